@@ -0,0 +1,61 @@
+# Gunicorn settings for both deployment profiles (picked up automatically from
+# the working directory):
+#   SERVER_PROFILE=wsgi gunicorn      -> quesec.wsgi, sync workers
+#   SERVER_PROFILE=asgi gunicorn      -> quesec.asgi, uvicorn workers + async catalog views
+# Compare the two with: python manage.py load_test --compare
+import multiprocessing
+import os
+
+profile = os.environ.get("SERVER_PROFILE", "wsgi")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+# recycle workers now and then so slow leaks never build up
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = os.environ.get("GUNICORN_ACCESSLOG") or None
+# import Django once in the master and warm it (URLconf, templates, indexes, the
+# hottest pages; products.warmup) before forking, so every worker - including
+# the ones max_requests recycles - starts warm instead of on live requests.
+# GUNICORN_PRELOAD=0 loads and warms in each worker instead.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+warm_up = os.environ.get("GUNICORN_WARMUP", "1") == "1"
+
+if profile == "asgi":
+    wsgi_app = "quesec.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "quesec.wsgi:application"
+    worker_class = "sync"
+
+
+def _warm(log, app):
+    from django.core.cache import close_caches
+    from django.db import connections
+
+    from products.warmup import warm
+
+    try:
+        steps = warm(app)
+    except Exception:
+        log.exception("Warm-up failed; starting cold")
+    else:
+        log.info("Warmed up: %s", ", ".join(f"{step} {ms:.0f}ms" for step, ms in steps))
+    finally:
+        # never hand a DB or cache connection to forked workers
+        connections.close_all()
+        close_caches()
+
+
+def when_ready(server):
+    # runs in the master after the sockets are bound, before the first fork
+    if preload_app and warm_up:
+        _warm(server.log, server.app.wsgi())
+
+
+def post_worker_init(worker):
+    if not preload_app and warm_up:
+        _warm(worker.log, worker.wsgi)
+
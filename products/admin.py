@@ -1,6 +1,23 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+
+from . import bulk
+from .images import IMAGE_FIELDS, upload_images
 from .models import Category, Product, ProductImage, Variation, VariationImage
 
+class ConcurrentUploadsMixin:
+    """Upload the new files of image inlines together (see images.upload_images) before saving the rows."""
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model._meta.label in IMAGE_FIELDS:
+            upload_images([
+                f.instance for f in formset.forms
+                if f.has_changed() and not formset._should_delete_form(f)
+            ])
+        super().save_formset(request, form, formset, change)
+
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'parent', 'is_active')
     list_filter = ('is_active',)
@@ -19,29 +36,100 @@ class VariationInline(admin.TabularInline):
 
 @admin.action(description="Duplicate selected products (with gallery)")
 def duplicate_products(modeladmin, request, queryset):
-    for obj in queryset:
-        images = list(obj.images.all())
-        obj.pk = None
-        obj.slug = ''
-        obj.sku = f"{obj.sku}-COPY"
-        obj.name = f"{obj.name} (Copy)"
-        obj.save()
-        for img in images:
-            ProductImage.objects.create(product=obj, image=img.image, alt_text=img.alt_text, sort_order=img.sort_order)
-
-class ProductAdmin(admin.ModelAdmin):
+    created = bulk.duplicate_products(queryset)
+    modeladmin.message_user(request, f"Created {len(created)} copies.", messages.SUCCESS)
+
+class BulkEditForm(forms.Form):
+    price_percent = forms.DecimalField(
+        required=False, max_digits=6, decimal_places=2, min_value=-100, label="Change price by %",
+        help_text="e.g. -10 for 10% off, 5 for a 5% increase",
+    )
+    stock = forms.IntegerField(required=False, min_value=0, label="Set stock to")
+    is_active = forms.NullBooleanField(
+        required=False, label="Set active",
+        widget=forms.Select(choices=[('unknown', "Leave unchanged"), ('true', "Active"), ('false', "Inactive")]),
+    )
+    csv_file = forms.FileField(
+        required=False, label="Or per product, from CSV",
+        help_text="Columns: sku and any of price, stock, is_active. Only selected products are touched.",
+    )
+
+    def clean(self):
+        data = super().clean()
+        data['rows'] = None
+        if data.get('csv_file'):
+            try:
+                data['rows'] = bulk.parse_edit_csv(data['csv_file'].read().decode('utf-8-sig'))
+            except (ValueError, UnicodeDecodeError) as exc:
+                raise forms.ValidationError(str(exc)) from None
+        if all(data.get(f) is None for f in ('price_percent', 'stock', 'is_active', 'rows')):
+            raise forms.ValidationError("Nothing to change.")
+        return data
+
+@admin.action(description="Bulk edit price / stock / active flag")
+def bulk_edit_products(modeladmin, request, queryset):
+    applying = 'apply' in request.POST
+    form = BulkEditForm(request.POST if applying else None, request.FILES if applying else None)
+    if applying and form.is_valid():
+        data = form.cleaned_data
+        changed = bulk.bulk_edit(queryset, data['price_percent'], data['stock'], data['is_active'], data['rows'])
+        modeladmin.message_user(request, f"Updated {changed} products.", messages.SUCCESS)
+        return None
+    return TemplateResponse(request, 'admin/products/product/bulk_edit.html', {
+        **modeladmin.admin_site.each_context(request),
+        'title': "Bulk edit products",
+        'opts': modeladmin.model._meta,
+        'form': form,
+        'count': queryset.count(),
+        # with "select all N" the ids are just the checked page; the flag widens it
+        'select_across': request.POST.get('select_across') == '1',
+        'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+    })
+
+class BrandFilter(admin.SimpleListFilter):
+    """
+    Brand as a text box. The stock filter runs SELECT DISTINCT brand and
+    renders a link per brand on every changelist load.
+    """
+    title = 'brand'
+    parameter_name = 'brand'
+    template = 'admin/products/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        return queryset.filter(brand__iexact=self.value()) if self.value() else queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': "All",
+            # the other active params, so the text box keeps them
+            'hidden': [(k, v) for k, v in changelist.params.items() if k != self.parameter_name],
+        }
+
+class ProductAdmin(ConcurrentUploadsMixin, admin.ModelAdmin):
     list_display = ('name', 'sku', 'brand', 'category', 'price', 'stock', 'is_active', 'is_featured')
-    list_filter = ('is_active', 'is_featured', 'category', 'brand')
+    list_filter = ('is_active', 'is_featured', 'category', BrandFilter)
+    list_select_related = ('category',)
+    list_per_page = 100
+    list_max_show_all = 500
     search_fields = ('name', 'sku', 'brand')
     inlines = [ProductImageInline, VariationInline]
     prepopulated_fields = {"slug": ("name",)}
-    actions = [duplicate_products]
+    actions = [duplicate_products, bulk_edit_products]
 
 class VariationImageInline(admin.TabularInline):
     model = VariationImage
     extra = 1
 
-class VariationAdmin(admin.ModelAdmin):
+class VariationAdmin(ConcurrentUploadsMixin, admin.ModelAdmin):
     list_display = ('product', 'name', 'sku', 'color', 'size')
     list_filter = ('product__category', 'color', 'size')
     search_fields = ('name', 'sku', 'product__name')
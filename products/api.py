@@ -0,0 +1,172 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+
+from .categories import get_category_tree
+from .filters import filter_products, get_filters, parse_price
+from .models import Product, Variation
+from .pagination import KEYSET_ORDERINGS, KeysetPaginator
+
+API_PAGE_SIZE = 48
+API_MAX_PAGE_SIZE = 100
+BATCH_LIMIT = 300
+
+# public field name -> ORM path read with .values(); no model instances are built
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'sku': 'sku',
+    'slug': 'slug',
+    'name': 'name',
+    'brand': 'brand',
+    'category': 'category__slug',
+    'price': 'price',
+    'mrp': 'mrp',
+    'stock': 'stock',
+    'is_featured': 'is_featured',
+    'short_description': 'short_description',
+    'description': 'description',
+    'image': 'cover_image',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+VARIATION_FIELDS = ('sku', 'slug', 'name', 'color', 'size')
+DEFAULT_FIELDS = ('sku', 'slug', 'name', 'brand', 'category', 'price', 'mrp', 'stock', 'image')
+
+
+class ApiError(ValueError):
+    pass
+
+
+def _error(exc):
+    return JsonResponse({'error': str(exc)}, status=400)
+
+
+def _parse_fields(param):
+    """?fields=sku,price,stock -> validated list; 'variations' adds one query for all rows."""
+    if not param:
+        return list(DEFAULT_FIELDS)
+    fields = list(dict.fromkeys(f.strip() for f in param.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS and f != 'variations']
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _split(params, name):
+    """Comma-separated and/or repeated query params, de-duplicated in order."""
+    return list(dict.fromkeys(v.strip() for raw in params.getlist(name) for v in raw.split(',') if v.strip()))
+
+
+def _product_rows(qs, fields, extra=()):
+    paths = ['id', *extra, *(PRODUCT_FIELDS[f] for f in fields if f in PRODUCT_FIELDS)]
+    return qs.values(*dict.fromkeys(paths))
+
+
+def _serialize(rows, fields):
+    wanted = [f for f in fields if f in PRODUCT_FIELDS]
+    variations = None
+    if 'variations' in fields:
+        variations = defaultdict(list)
+        for v in (Variation.objects.filter(product_id__in=[r['id'] for r in rows])
+                  .order_by('product_id', 'name').values('product_id', *VARIATION_FIELDS)):
+            variations[v.pop('product_id')].append(v)
+
+    out = []
+    for row in rows:
+        item = {f: row[PRODUCT_FIELDS[f]] for f in wanted}
+        if 'image' in item:
+            item['image'] = default_storage.url(item['image']) if item['image'] else None
+        if variations is not None:
+            item['variations'] = variations.get(row['id'], [])
+        out.append(item)
+    return out
+
+
+@require_GET
+def product_list(request):
+    """
+    /shop/ filters (q, category, brand, min, max, color, size) and sorts as JSON, always
+    cursor-paginated: ?cursor=<next|previous>&limit=<=100&fields=...
+    """
+    try:
+        fields = _parse_fields(request.GET.get('fields'))
+        sort = request.GET.get('sort') or None
+        if sort not in KEYSET_ORDERINGS:
+            raise ApiError(f"sort must be one of: {', '.join(k for k in KEYSET_ORDERINGS if k)}")
+        try:
+            limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError("limit must be an integer") from None
+        for name in ('min', 'max'):
+            if request.GET.get(name) and parse_price(request.GET[name]) is None:
+                raise ApiError(f"{name} must be a number")
+    except ApiError as exc:
+        return _error(exc)
+
+    ordering = KEYSET_ORDERINGS[sort]
+    keys = [o.lstrip('-') for o in ordering]
+    qs = _product_rows(filter_products(get_filters(request.GET)), fields, extra=keys)
+    page = KeysetPaginator(qs, limit, ordering).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': _serialize(page.object_list, fields),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_GET
+def product_batch(request):
+    """
+    Resolve up to BATCH_LIMIT products by ?sku=A,B or ?slug=a,b in one query.
+    Results follow the request order; unknown or inactive ones are listed in
+    'missing'.
+    """
+    try:
+        fields = _parse_fields(request.GET.get('fields'))
+        skus, slugs = _split(request.GET, 'sku'), _split(request.GET, 'slug')
+        if bool(skus) == bool(slugs):
+            raise ApiError("Pass either sku or slug")
+        if len(skus or slugs) > BATCH_LIMIT:
+            raise ApiError(f"At most {BATCH_LIMIT} products per request")
+    except ApiError as exc:
+        return _error(exc)
+
+    key, wanted = ('sku', skus) if skus else ('slug', slugs)
+    qs = Product.objects.filter(is_active=True, **{f'{key}__in': wanted}).order_by()
+    rows = {r[key]: r for r in _product_rows(qs, fields, extra=[key])}
+    found = [rows[k] for k in wanted if k in rows]
+    return JsonResponse({
+        'results': _serialize(found, fields),
+        'missing': [k for k in wanted if k not in rows],
+    })
+
+
+@require_GET
+def category_list(request):
+    """The active category tree in display order, straight from the cached CategoryTree."""
+    nodes = [
+        {'id': n['id'], 'slug': n['slug'], 'name': n['name'], 'parent': n['parent_id'], 'depth': n['depth']}
+        for n in get_category_tree().nodes if n['is_active']
+    ]
+    return JsonResponse({'results': nodes})
+
+
+@require_GET
+def suggest(request):
+    """
+    Typeahead for ?q=<what has been typed>: top ?limit= (<=20) product names,
+    brands, category names and exact SKU hits, from the in-process prefix index.
+    """
+    from . import suggest as suggestions  # numpy: not at URLconf import
+
+    try:
+        limit = min(max(int(request.GET.get('limit', suggestions.DEFAULT_LIMIT)), 1), suggestions.MAX_LIMIT)
+    except ValueError:
+        return _error(ApiError("limit must be an integer"))
+    response = JsonResponse(suggestions.suggestions(request.GET.get('q', ''), limit))
+    patch_cache_control(response, public=True, max_age=settings.SUGGEST_CACHE_MAX_AGE)
+    return response
@@ -0,0 +1,185 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .cache import catalog_version
+from .models import Product, Variation
+
+# listing filters answered from the bitmap index rather than the database
+ATTRIBUTES = ('color', 'size')
+
+_local = {}  # per-process memo: {'index': AttributeIndex}
+_lock = threading.Lock()
+
+
+def normalize(value):
+    """'  Navy  Blue' -> 'navy blue': the form filters and the index compare on."""
+    return ' '.join((value or '').split()).lower()
+
+
+def _remember_label(labels, value, raw):
+    # first spelling seen, but a capitalized one beats an all-lowercase one
+    label = ' '.join(raw.split())
+    if value not in labels or (labels[value] == value and label != value):
+        labels[value] = label
+
+
+def to_bits(ids):
+    """Product ids -> int bitset (bit n set = product n)."""
+    ids = np.asarray(list(ids), dtype=np.int64)
+    if not len(ids):
+        return 0
+    flags = np.zeros(ids.max() + 1, dtype=bool)
+    flags[ids] = True
+    return int.from_bytes(np.packbits(flags, bitorder='little').tobytes(), 'little')
+
+
+def from_bits(bits):
+    """int bitset -> ascending list of product ids."""
+    if not bits:
+        return []
+    raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder='little')).tolist()
+
+
+def restrict(qs, ids):
+    """
+    qs narrowed to these primary keys. The ids are ints, so they are inlined
+    as literals: no bound-parameter limit however many match.
+    """
+    if not ids:
+        return qs.none()
+    column = f'"{qs.model._meta.db_table}"."{qs.model._meta.pk.column}"'
+    return qs.filter(RawSQL(f"{column} IN ({','.join(map(str, ids))})", [], output_field=BooleanField()))
+
+
+class AttributeIndex:
+    """
+    Normalized color/size value -> bitset of the active products that carry
+    it on the product itself or on any of its variations. Multi-select
+    filters OR the bitsets within an attribute and AND them across
+    attributes; facet counts are popcounts of intersections. ``version`` is
+    the catalog version the bitsets reflect.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.bits = {attr: {} for attr in ATTRIBUTES}
+        self.labels = {attr: {} for attr in ATTRIBUTES}  # normalized -> display spelling
+        self.everything = 0  # every active product
+
+    @staticmethod
+    def _rows(**lookup):
+        """(product_id, color, size) of the matching active products and their variations."""
+        products = Product.objects.filter(is_active=True, **lookup)
+        yield from products.order_by('pk').values_list('pk', *ATTRIBUTES).iterator(chunk_size=5000)
+        variations = Variation.objects.filter(product__in=products.values('pk'))
+        yield from variations.order_by('pk').values_list('product_id', *ATTRIBUTES).iterator(chunk_size=5000)
+
+    @classmethod
+    def build(cls, version):
+        """Two queries over the whole catalog."""
+        index = cls(version)
+        members = {attr: {} for attr in ATTRIBUTES}
+        active = set()
+        for row in cls._rows():
+            active.add(row[0])
+            for attr, raw in zip(ATTRIBUTES, row[1:]):
+                value = normalize(raw)
+                if value:
+                    members[attr].setdefault(value, []).append(row[0])
+                    _remember_label(index.labels[attr], value, raw)
+        for attr in ATTRIBUTES:
+            index.bits[attr] = {value: to_bits(ids) for value, ids in members[attr].items()}
+        index.everything = to_bits(active)
+        return index
+
+    def update_product(self, product_id):
+        """Re-read one product (two small queries) and move its bit between values."""
+        bit = 1 << product_id
+        rows = list(self._rows(pk=product_id))
+        self.everything = self.everything | bit if rows else self.everything & ~bit
+        for i, attr in enumerate(ATTRIBUTES, start=1):
+            wanted = {}
+            for row in rows:
+                value = normalize(row[i])
+                if value:
+                    wanted.setdefault(value, row[i])
+            values = self.bits[attr]
+            for value in [v for v, bits in values.items() if bits & bit and v not in wanted]:
+                values[value] &= ~bit
+                if not values[value]:
+                    del values[value]
+            for value, label in wanted.items():
+                values[value] = values.get(value, 0) | bit
+                _remember_label(self.labels[attr], value, label)
+
+    def matching(self, filters, skip=()):
+        """Bitset of products passing the attribute filters (lists of normalized values), or None if none apply."""
+        result = None
+        for attr in ATTRIBUTES:
+            if attr in skip or not filters.get(attr):
+                continue
+            union = 0
+            for value in filters[attr]:
+                union |= self.bits[attr].get(value, 0)
+            result = union if result is None else result & union
+        return result
+
+    def counts(self, attr, within):
+        """[{'value', 'label', 'count'}] for ``attr`` inside bitset ``within``, most common first."""
+        rows = [
+            {'value': value, 'label': self.labels[attr].get(value, value), 'count': (bits & within).bit_count()}
+            for value, bits in self.bits[attr].items()
+        ]
+        return sorted((r for r in rows if r['count']), key=lambda r: (-r['count'], r['label'].lower()))
+
+
+def _cache_key(version):
+    return f'products:attribute-index:{version}'
+
+
+def get_attribute_index():
+    """
+    This process's index if it matches the catalog version, else the one
+    some process published for that version, else a fresh build (published
+    for the others).
+    """
+    version = catalog_version()
+    index = _local.get('index')
+    if index is None or index.version != version:
+        index = cache.get(_cache_key(version))
+        if index is None:
+            index = AttributeIndex.build(version)
+            cache.set(_cache_key(version), index, settings.FACET_CACHE_TIMEOUT)
+        _local['index'] = index
+    return index
+
+
+def refresh_product(product_id):
+    """
+    Signal hook: once the write commits (after its catalog version bump, which
+    is queued first), patch this process's index in place if it was current
+    just before that bump, else drop it so the next request loads or rebuilds
+    one. A rolled-back write leaves the index alone.
+    """
+    transaction.on_commit(lambda: _patch(product_id))
+
+
+def _patch(product_id):
+    with _lock:
+        index = _local.get('index')
+        if index is None:
+            return
+        version = catalog_version()
+        if index.version != version - 1:
+            _local.clear()
+            return
+        index.update_product(product_id)
+        index.version = version
+        cache.set(_cache_key(version), index, settings.FACET_CACHE_TIMEOUT)
@@ -0,0 +1,123 @@
+import json
+import time
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .instrumentation import percentile
+from .models import Category, Product
+
+
+@dataclass
+class Scenario:
+    name: str
+    url: str
+    params: dict = field(default_factory=dict)
+    settings: dict = field(default_factory=dict)
+
+
+def default_scenarios():
+    """
+    Listing filter/sort/page combinations plus detail pages, picked from
+    whatever catalog is loaded (run seed_catalog first).
+    """
+    shop = reverse('products:product_list')
+    root = Category.objects.filter(parent__isnull=True, is_active=True).order_by('pk').first()
+    sample = Product.objects.filter(is_active=True, variations__isnull=False).order_by('pk').first()
+    deep_page = max(1, Product.objects.filter(is_active=True).count() // 12 // 2)
+
+    scenarios = [
+        Scenario('home:render', reverse('home'), settings={'HOME_SNAPSHOT': False}),
+        Scenario('home:snapshot', reverse('home')),
+        Scenario('list:newest', shop),
+        Scenario('list:newest_layout_uncached', shop, settings={'LAYOUT_RENDER_CACHE': False}),
+        Scenario('list:price_asc', shop, {'sort': 'price_asc'}),
+        Scenario('list:featured', shop, {'sort': 'featured'}),
+        Scenario('list:price_range', shop, {'min': '500', 'max': '2000', 'sort': 'price_desc'}),
+        Scenario('list:search', shop, {'q': 'road bike'}),
+        Scenario('list:search_relevance', shop, {'q': 'helmet', 'sort': 'relevance'}),
+        Scenario('list:deep_page', shop, {'page': deep_page}),
+        Scenario('list:cursor', shop, {'sort': 'price_asc'}, {'SHOP_PAGINATION': 'cursor'}),
+        Scenario('api:list', reverse('products:api_product_list'), {'limit': 100}),
+        Scenario('api:list_sparse', reverse('products:api_product_list'), {'limit': 100, 'fields': 'sku,price,stock'}),
+        Scenario('api:suggest', reverse('products:api_suggest'), {'q': 'road b'}),
+    ]
+    if root:
+        scenarios.append(Scenario('list:category_subtree', shop, {'category': root.slug}))
+    if sample:
+        scenarios.append(Scenario('list:brand', shop, {'brand': sample.brand}))
+        scenarios.append(Scenario('detail:product', reverse('products:product_detail', args=[sample.slug])))
+        skus = ','.join(Product.objects.filter(is_active=True).order_by('pk').values_list('sku', flat=True)[:200])
+        scenarios.append(Scenario('api:batch', reverse('products:api_product_batch'), {'sku': skus, 'fields': 'sku,price,stock,variations'}))
+        variation = sample.variations.order_by('name').last()
+        if variation.color and variation.size:
+            scenarios.append(Scenario('list:color_size', shop, {'color': variation.color, 'size': variation.size}))
+        scenarios.append(Scenario(
+            'detail:variation',
+            reverse('products:product_detail_variation', args=[sample.slug, variation.slug]),
+        ))
+    return scenarios
+
+
+def run_scenarios(scenarios, iterations=20, warmup=2, cold=False):
+    """
+    Drive each scenario through the test client. ``cold`` clears the cache
+    before every request, so page/facet caches never help. Returns
+    {name: {'p50_ms', 'p95_ms', 'queries', 'status'}}.
+    """
+    client = Client()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for scenario in scenarios:
+            with override_settings(**scenario.settings):
+                for _ in range(warmup):
+                    client.get(scenario.url, scenario.params)
+                timings, queries, status = [], [], None
+                for _ in range(iterations):
+                    if cold:
+                        cache.clear()
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        response = client.get(scenario.url, scenario.params)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(ctx))
+                    status = response.status_code
+            results[scenario.name] = {
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'queries': max(queries),
+                'status': status,
+            }
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Regressions against a stored baseline: more queries than before, or a p95
+    more than ``tolerance`` (fraction) slower. Returns a list of messages.
+    """
+    problems = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if now['queries'] > before['queries']:
+            problems.append(f"{name}: {before['queries']} -> {now['queries']} queries")
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+    return problems
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return json.load(fh)['results']
+
+
+def save_baseline(path, results, meta):
+    with open(path, 'w') as fh:
+        json.dump({'meta': meta, 'results': results}, fh, indent=2, sort_keys=True)
+        fh.write('\n')
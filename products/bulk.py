@@ -0,0 +1,147 @@
+"""
+Catalog-scale edits for the product admin: a few statements per batch of
+BATCH_SIZE products instead of a save() (and its signals) per product.
+"""
+import csv
+import io
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .cards import refresh_cards
+from .models import Product, ProductImage, bulk_unique_slugify
+from .search import get_search_backend
+
+BATCH_SIZE = 500
+EDIT_FIELDS = ('price', 'stock', 'is_active')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+def _id_batches(queryset):
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _invalidate():
+    from . import suggest  # numpy: loaded on first use, not whenever the admin is
+
+    # bulk writes skip model signals; cards are refreshed per batch, this runs once at the end
+    bump_catalog_version()
+    get_search_backend().reset()
+    suggest.invalidate()
+
+
+def duplicate_products(queryset):
+    """
+    Copy each product with its gallery as "<name> (Copy)" / "<sku>-COPY"
+    (-COPY-1, -COPY-2, ... if taken), shortening the original name and sku
+    so the copy still fits the column. Per batch: one SELECT each for the
+    products, free slugs, free skus and images, one INSERT each for the
+    copies and their images. Returns the new product ids.
+    """
+    created = []
+    concrete = [f.attname for f in Product._meta.concrete_fields if not f.primary_key]
+    name_room = Product._meta.get_field('name').max_length - len(' (Copy)')
+    sku_room = Product._meta.get_field('sku').max_length - len('-COPY-9999')
+    for ids in _id_batches(queryset):
+        with transaction.atomic():
+            originals = list(Product.objects.filter(pk__in=ids).order_by('pk'))
+            copies = []
+            for original in originals:
+                copy = Product(**{name: getattr(original, name) for name in concrete})
+                copy.name, copy.slug, copy.sku = f"{original.name[:name_room]} (Copy)", '', ''
+                copy.copy_of = original
+                copies.append(copy)
+            bulk_unique_slugify(copies)
+            bulk_unique_slugify(copies, source=lambda c: f"{c.copy_of.sku[:sku_room]}-COPY", slug_field_name='sku', transform=str)
+            Product.objects.bulk_create(copies)
+
+            copy_ids = {copy.copy_of.pk: copy.pk for copy in copies}
+            ProductImage.objects.bulk_create([
+                ProductImage(product_id=copy_ids[img.product_id], image=img.image.name, renditions=img.renditions,
+                             alt_text=img.alt_text, sort_order=img.sort_order)
+                for img in ProductImage.objects.filter(product_id__in=ids)
+            ])
+            refresh_cards(copy_ids.values())
+        created += copy_ids.values()
+    if created:
+        _invalidate()
+    return created
+
+
+def parse_edit_csv(data):
+    """
+    ``sku,price,stock,is_active`` rows (any of the last three columns; blank
+    cells are left alone) -> {sku: {field: value}}. Raises ValueError naming
+    the first bad line.
+    """
+    reader = csv.DictReader(io.StringIO(data))
+    if 'sku' not in (reader.fieldnames or ()) or not set(reader.fieldnames) & set(EDIT_FIELDS):
+        raise ValueError(f"Header must have sku and at least one of: {', '.join(EDIT_FIELDS)}")
+    rows = {}
+    for line, row in enumerate(reader, start=2):
+        sku = (row.get('sku') or '').strip()
+        if not sku:
+            raise ValueError(f"line {line}: missing sku")
+        values = {}
+        try:
+            if (row.get('price') or '').strip():
+                values['price'] = Decimal(row['price'].strip()).quantize(Decimal('0.01'))
+                if values['price'] < 0:
+                    raise ValueError("negative price")
+            if (row.get('stock') or '').strip():
+                values['stock'] = int(row['stock'])
+                if values['stock'] < 0:
+                    raise ValueError("negative stock")
+            flag = (row.get('is_active') or '').strip().lower()
+            if flag:
+                if flag not in TRUE_VALUES | FALSE_VALUES:
+                    raise ValueError(f"is_active must be yes/no, got {flag!r}")
+                values['is_active'] = flag in TRUE_VALUES
+        except (ValueError, InvalidOperation) as exc:
+            raise ValueError(f"line {line} ({sku}): {exc}") from None
+        rows[sku] = values
+    return rows
+
+
+def bulk_edit(queryset, price_percent=None, stock=None, is_active=None, rows=None):
+    """
+    Apply to every product in ``queryset``: price changed by
+    ``price_percent`` % (rounded to cents), stock set to ``stock``, active
+    flag set to ``is_active``; then per-sku values from ``rows`` (see
+    parse_edit_csv) for the selected products listed there. One SELECT and
+    one bulk_update per batch. Returns the number of products changed.
+
+    Price and active-flag changes skip the incremental related-products
+    refresh; run build_related_products after large edits.
+    """
+    changed_total = 0
+    factor = 1 + Decimal(price_percent) / 100 if price_percent is not None else None
+    for ids in _id_batches(queryset):
+        with transaction.atomic():
+            changed = []
+            now = timezone.now()
+            for product in Product.objects.filter(pk__in=ids).only('pk', 'sku', *EDIT_FIELDS):
+                values = {}
+                if factor is not None:
+                    values['price'] = max(product.price * factor, Decimal(0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+                if stock is not None:
+                    values['stock'] = stock
+                if is_active is not None:
+                    values['is_active'] = is_active
+                values.update((rows or {}).get(product.sku, {}))
+                if any(getattr(product, f) != v for f, v in values.items()):
+                    for field, value in values.items():
+                        setattr(product, field, value)
+                    product.updated_at = now
+                    changed.append(product)
+            Product.objects.bulk_update(changed, [*EDIT_FIELDS, 'updated_at'])
+            refresh_cards([p.pk for p in changed])
+        changed_total += len(changed)
+    if changed_total:
+        _invalidate()
+    return changed_total
@@ -0,0 +1,78 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from quesec.db_router import hold_replicas
+
+CATALOG_VERSION_KEY = 'products:catalog-version'
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # seed from the clock so a flushed cache never reuses an old version
+        version = time.time_ns()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def _bump(key):
+    def bump():
+        cache.set(f'{key}:at', time.time(), None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+    # after the commit: a request reading the old rows in between would otherwise cache them under the new version
+    transaction.on_commit(bump)
+    hold_replicas()  # what's cached under the new version must come from the primary
+
+
+def catalog_version():
+    """
+    Counter bumped on every catalog write. Cached listing data embeds it in
+    its keys, so a bump orphans all old entries instead of deleting them.
+    """
+    return _version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return _bump(CATALOG_VERSION_KEY)
+
+
+def last_bumped(product_slug=None):
+    """
+    When the catalog (or this product's page) last changed, as an aware
+    datetime; None if the cache no longer knows (flushed since).
+    """
+    keys = [f'{CATALOG_VERSION_KEY}:at']
+    if product_slug:
+        keys.append(f'{_product_version_key(product_slug)}:at')
+    stamps = cache.get_many(keys).values()
+    return datetime.fromtimestamp(max(stamps), timezone.utc) if stamps else None
+
+
+def _product_version_key(slug):
+    return f'products:product-version:{slug}'
+
+
+def bump_product_version(slug):
+    """For edits that only affect one product's own page (variations, galleries)."""
+    return _bump(_product_version_key(slug))
+
+
+def detail_cache_key(product_slug, variation_slug=None):
+    """
+    Rendered product_detail page key. Includes the catalog version (product
+    rows: price, stock, the related block) and the product's own version
+    (variations and gallery images), so any edit reaching the page changes it.
+    """
+    versions = cache.get_many([CATALOG_VERSION_KEY, _product_version_key(product_slug)])
+    catalog_v = versions.get(CATALOG_VERSION_KEY) or catalog_version()
+    product_v = versions.get(_product_version_key(product_slug)) or _version(_product_version_key(product_slug))
+    page = hashlib.md5(f'{product_slug}/{variation_slug or ""}'.encode()).hexdigest()
+    return f'products:detail:{catalog_v}:{product_v}:{page}'
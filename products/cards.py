@@ -0,0 +1,79 @@
+from django.db import transaction
+
+from .models import Product, ProductCard
+
+BATCH_SIZE = 1000
+
+# everything but the primary key, rewritten on every refresh
+CARD_FIELDS = [f.name for f in ProductCard._meta.concrete_fields if not f.primary_key]
+
+
+def chip_label(variation):
+    """What a variation chip says: its name, else "color • size"."""
+    return variation.name or ' • '.join(x for x in (variation.color, variation.size) if x)
+
+
+def _thumbnail(product):
+    """(url, alt, renditions) of the cover, else the first gallery image."""
+    if product.cover_image:
+        field, renditions, alt = product.cover_image, product.cover_renditions, ''
+    elif product.card_images:
+        image = product.card_images[0]
+        field, renditions, alt = image.image, image.renditions, image.alt_text
+    else:
+        return '', '', {}
+    # renditions of a replaced file are stale; the card then falls back to the original
+    renditions = renditions if (renditions or {}).get('source') == field.name else {}
+    return field.url, alt or product.name, renditions
+
+
+def build_card(product):
+    """ProductCard for a product fetched with Product.objects.for_cards()."""
+    url, alt, renditions = _thumbnail(product)
+    return ProductCard(
+        id=product.pk,
+        slug=product.slug,
+        name=product.name,
+        brand=product.brand,
+        category_id=product.category_id,
+        category_slug=product.category.slug,
+        category_name=product.category.name,
+        category_path=product.category.path,
+        price=product.price,
+        mrp=product.mrp,
+        in_stock=product.stock > 0,
+        is_featured=product.is_featured,
+        created_at=product.created_at,
+        thumbnail_url=url,
+        thumbnail_alt=alt,
+        thumbnail_renditions=renditions,
+        variations=[{'slug': v.slug, 'label': chip_label(v)} for v in product.card_variations],
+        variation_count=product.variation_count,
+    )
+
+
+def refresh_cards(product_ids):
+    """
+    Re-project these products: upsert the cards of the active ones, drop the
+    rest. A fixed number of queries however many ids are passed (keep it to
+    BATCH_SIZE or so).
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    cards = [build_card(p) for p in Product.objects.filter(pk__in=product_ids, is_active=True).order_by().for_cards()]
+    with transaction.atomic():
+        ProductCard.objects.filter(pk__in=product_ids).exclude(pk__in=[c.pk for c in cards]).delete()
+        ProductCard.objects.bulk_create(cards, update_conflicts=True, unique_fields=['id'], update_fields=CARD_FIELDS)
+    return len(cards)
+
+
+def rebuild_all(stdout=None):
+    """Full rebuild in BATCH_SIZE chunks, then drop cards of missing/inactive products. Returns the card count."""
+    ids = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        refresh_cards(ids[start:start + BATCH_SIZE])
+        if stdout:
+            stdout.write(f"cards: {min(start + BATCH_SIZE, len(ids))}/{len(ids)}")
+    ProductCard.objects.exclude(pk__in=Product.objects.filter(is_active=True).values('pk')).delete()
+    return len(ids)
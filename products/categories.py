@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import catalog_version
+from .models import Category
+
+_local = {}  # per-process memo: {'version': ..., 'tree': CategoryTree}
+
+
+class CategoryTree:
+    """
+    The whole category table as plain dicts, in display (pre)order. Built from
+    one query and cached per catalog version, so breadcrumbs, nested menus and
+    subtree lookups cost no queries per request.
+    """
+
+    def __init__(self, rows):
+        self.by_id = {r['id']: r for r in rows}
+        self.by_slug = {r['slug']: r for r in rows}
+        children = defaultdict(list)
+        for r in rows:
+            children[r['parent_id']].append(r)
+        self.nodes = []
+
+        def walk(parent_id):
+            for r in sorted(children[parent_id], key=lambda r: r['name'].lower()):
+                self.nodes.append(r)
+                walk(r['id'])
+
+        walk(None)
+
+    def ancestors(self, pk):
+        """Root-first ancestors of ``pk``, excluding the node itself."""
+        node = self.by_id.get(pk)
+        if node is None:
+            return []
+        ids = [int(i) for i in node['path'].strip('/').split('/')[:-1]]
+        return [self.by_id[i] for i in ids if i in self.by_id]
+
+    def breadcrumbs(self, pk):
+        node = self.by_id.get(pk)
+        return self.ancestors(pk) + [node] if node else []
+
+    def rollup(self, counts):
+        """Per-category counts -> counts including every descendant's."""
+        totals = defaultdict(int)
+        for pk, n in counts.items():
+            node = self.by_id.get(pk)
+            if node is None:
+                continue
+            for ancestor in node['path'].strip('/').split('/'):
+                totals[int(ancestor)] += n
+        return totals
+
+
+def get_category_tree():
+    version = catalog_version()
+    if _local.get('version') == version:
+        return _local['tree']
+    key = f'products:category-tree:{version}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(Category.objects.values('id', 'parent_id', 'name', 'slug', 'path', 'depth', 'is_active'))
+        cache.set(key, rows, settings.FACET_CACHE_TIMEOUT)
+    tree = CategoryTree(rows)
+    _local.update(version=version, tree=tree)
+    return tree
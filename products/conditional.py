@@ -0,0 +1,98 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag, urlencode
+
+from .cache import catalog_version, detail_cache_key, last_bumped
+from .models import Product, ProductImage, Variation, VariationImage
+
+
+def _precondition(request, validated):
+    etag, last_modified = validated
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _add_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        if last_modified:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE, must_revalidate=True)
+    return response
+
+
+def conditional_page(validators):
+    """
+    Like django.views.decorators.http.condition, but ``validators(request,
+    *args, **kwargs)`` returns (etag, last_modified) in one call, so a 304 is
+    answered before the view runs. Validators and a revalidate-always
+    Cache-Control go on 200/304 responses only. Works on async views too.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                validated = await sync_to_async(validators)(request, *args, **kwargs)
+                etag, last_modified, response = _precondition(request, validated)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, last_modified, response = _precondition(request, validators(request, *args, **kwargs))
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def listing_validators(request):
+    """Listing pages change only with the catalog version (and the query string)."""
+    query = urlencode(sorted((k, v) for k, values in request.GET.lists() for v in values))
+    tag = hashlib.md5(f'{catalog_version()}:{settings.SHOP_PAGINATION}:{query}'.encode()).hexdigest()
+    return quote_etag(tag), last_bumped()
+
+
+def _product_last_modified(product_slug):
+    """Newest updated_at over the product, its variations and all their images (one query)."""
+    def latest(qs):
+        return Subquery(qs.order_by('-updated_at').values('updated_at')[:1])
+
+    row = Product.objects.filter(slug=product_slug, is_active=True).values('updated_at').annotate(
+        variations_at=latest(Variation.objects.filter(product=OuterRef('pk'))),
+        images_at=latest(ProductImage.objects.filter(product=OuterRef('pk'))),
+        variation_images_at=latest(VariationImage.objects.filter(variation__product=OuterRef('pk'))),
+    ).first()
+    return max(v for v in row.values() if v) if row else None
+
+
+def detail_validators(request, product_slug, variation_slug=None):
+    """
+    ETag from the page cache key (catalog + product versions), so it changes
+    exactly when the cached page would. Last-Modified is the newest row
+    timestamp, raised to the last version bump to cover deletes and
+    catalog-wide edits; cached under the same versions.
+    """
+    key = detail_cache_key(product_slug, variation_slug)
+    last_modified = cache.get(f'{key}:modified')
+    if last_modified is None:
+        last_modified = _product_last_modified(product_slug)
+        if last_modified is not None:
+            bumped = last_bumped(product_slug)
+            last_modified = max(last_modified, bumped) if bumped else last_modified
+            cache.set(f'{key}:modified', last_modified, settings.DETAIL_CACHE_TIMEOUT)
+    return quote_etag(hashlib.md5(key.encode()).hexdigest()), last_modified
@@ -0,0 +1,102 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+
+from .cache import catalog_version
+from .categories import get_category_tree
+from .filters import filter_cards
+
+PRICE_BUCKETS = 5
+MAX_BRANDS = 50
+
+
+def _cache_key(filters):
+    raw = json.dumps(filters, sort_keys=True)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'products:facets:{catalog_version()}:{digest}'
+
+
+def _price_facets(filters):
+    qs = filter_cards(filters, skip=('min', 'max'))
+    price_range = qs.aggregate(min_price=Min('price'), max_price=Max('price'))
+    lo, hi = price_range['min_price'], price_range['max_price']
+    buckets = []
+    if lo is not None and hi > lo:
+        step = ((hi - lo) / PRICE_BUCKETS).quantize(Decimal('0.01'))
+        edges = [lo + step * i for i in range(PRICE_BUCKETS)] + [hi]
+        counts = qs.aggregate(**{
+            f'b{i}': Count('pk', filter=Q(price__gte=edges[i]) & (
+                Q(price__lte=edges[i + 1]) if i == PRICE_BUCKETS - 1 else Q(price__lt=edges[i + 1])
+            ))
+            for i in range(PRICE_BUCKETS)
+        })
+        buckets = [
+            {'min': edges[i], 'max': edges[i + 1], 'count': counts[f'b{i}']}
+            for i in range(PRICE_BUCKETS)
+        ]
+    return price_range, buckets
+
+
+def _category_facets(filters):
+    tree = get_category_tree()
+    counts = tree.rollup(dict(
+        filter_cards(filters, skip=('category',))
+        .order_by().values_list('category_id').annotate(n=Count('pk'))
+    ))
+    # tree order; a parent's count includes its subcategories
+    return [
+        {'slug': c['slug'], 'name': c['name'], 'depth': c['depth'], 'indent': '— ' * c['depth'], 'count': counts[c['id']]}
+        for c in tree.nodes if c['is_active']
+    ]
+
+
+def _brand_facets(filters):
+    rows = (
+        filter_cards(filters, skip=('brand',))
+        .exclude(brand='')
+        .order_by().values('brand').annotate(count=Count('pk'))
+        .order_by('-count', 'brand')[:MAX_BRANDS]
+    )
+    return [{'name': r['brand'], 'count': r['count']} for r in rows]
+
+
+def _attribute_facets(filters):
+    from .attributes import ATTRIBUTES, get_attribute_index, to_bits  # numpy: not at URLconf import
+
+    index = get_attribute_index()
+    within = index.everything
+    if any(v for k, v in filters.items() if k not in ATTRIBUTES):
+        # the database part of the filters, as one id list turned into a bitset
+        within = to_bits(filter_cards(filters, skip=ATTRIBUTES).values_list('pk', flat=True))
+    facets = {}
+    for attr in ATTRIBUTES:
+        others = index.matching(filters, skip=(attr,))
+        facets[attr] = index.counts(attr, within if others is None else within & others)
+    return facets
+
+
+def get_facets(filters):
+    """
+    Sidebar data for the listing: price range + histogram, per-category,
+    per-brand, per-color and per-size counts. Each facet applies every filter except its own, so the
+    other options stay visible. Cached under the catalog version, which
+    product/category signals bump once their write commits (facets computed
+    before that belong to the old rows), so warm hits cost no queries.
+    """
+    key = _cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        price_range, price_buckets = _price_facets(filters)
+        facets = {
+            'price_range': price_range,
+            'price_buckets': price_buckets,
+            'categories': _category_facets(filters),
+            'brands': _brand_facets(filters),
+            **{f'{attr}s': counts for attr, counts in _attribute_facets(filters).items()},
+        }
+        cache.set(key, facets, settings.FACET_CACHE_TIMEOUT)
+    return facets
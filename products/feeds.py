@@ -0,0 +1,294 @@
+"""
+Sitemaps and the shopping feed, generated as streams: rows come from
+.iterator(chunk_size=CHUNK_SIZE) and leave as text chunks, so memory stays
+flat however large the catalog. The same generators either back the
+streaming views directly or, with CATALOG_FEEDS_PRECOMPUTED, are written
+gzip-compressed to storage by manage.py build_feeds and served from there.
+"""
+import csv
+import gzip
+import math
+import tempfile
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .models import Product, ProductImage, Variation, VariationImage
+
+CHUNK_SIZE = 2000
+SITEMAP_LIMIT = 50_000  # URLs per sitemap file (sitemaps.org protocol limit)
+STORAGE_DIR = 'feeds'
+FEED_FORMATS = {'xml': 'application/xml', 'csv': 'text/csv'}
+FEED_FIELDS = (
+    'id', 'item_group_id', 'title', 'description', 'link', 'image_link', 'availability',
+    'price', 'sale_price', 'brand', 'condition', 'color', 'size', 'product_type',
+)
+
+
+def base_url(request=None):
+    """Scheme + host every <loc>/<link> starts with: CATALOG_BASE_URL, else the request's."""
+    if settings.CATALOG_BASE_URL:
+        return settings.CATALOG_BASE_URL.rstrip('/')
+    if request is None:
+        raise ValueError("CATALOG_BASE_URL is not set")
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def url_pattern(name, arity):
+    """reverse() once with placeholder slugs -> a str.format() pattern; far cheaper than reverse() per row."""
+    url = reverse(name, args=[f'arg{i}placeholder' for i in range(arity)])
+    for i in range(arity):
+        url = url.replace(f'arg{i}placeholder', f'{{{i}}}')
+    return url
+
+
+def _absolute(base, url):
+    return f"{base}{url}" if url.startswith('/') else url
+
+
+# ---------------- sitemaps ----------------
+
+def _sitemap_rows(section):
+    if section == 'products':
+        pattern = url_pattern('products:product_detail', 1)
+        rows = Product.objects.filter(is_active=True).order_by('pk').values_list('slug', 'updated_at')
+    elif section == 'variations':
+        pattern = url_pattern('products:product_detail_variation', 2)
+        rows = (Variation.objects.filter(product__is_active=True).order_by('pk')
+                .values_list('product__slug', 'slug', 'updated_at'))
+    else:
+        raise KeyError(section)
+    return pattern, rows
+
+
+def sitemap_pages():
+    """[(section, page)] needed to keep every file within SITEMAP_LIMIT URLs (two COUNTs)."""
+    pages = []
+    for section in ('products', 'variations'):
+        total = _sitemap_rows(section)[1].count()
+        pages += [(section, page) for page in range(1, max(1, math.ceil(total / SITEMAP_LIMIT)) + 1)]
+    return pages
+
+
+def sitemap_index(base, pages):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for section, page in pages:
+        loc = reverse('products:sitemap_section', args=[section, page])
+        yield f"<sitemap><loc>{escape(base + loc)}</loc></sitemap>\n"
+    yield '</sitemapindex>\n'
+
+
+def sitemap_section(base, section, page):
+    pattern, rows = _sitemap_rows(section)
+    start = (page - 1) * SITEMAP_LIMIT
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for *slugs, updated_at in rows[start:start + SITEMAP_LIMIT].iterator(chunk_size=CHUNK_SIZE):
+        loc = escape(base + pattern.format(*slugs))
+        yield f"<url><loc>{loc}</loc><lastmod>{updated_at.date().isoformat()}</lastmod></url>\n"
+    yield '</urlset>\n'
+
+
+# ---------------- shopping feed ----------------
+
+def _money(amount):
+    return f"{amount.quantize(Decimal('0.01'))} {settings.CATALOG_CURRENCY}"
+
+
+def _first_image(images):
+    return images[0].image if images else None
+
+
+def feed_items(base):
+    """
+    One dict per FEED_FIELDS item: every variation of an active product (grouped
+    by the product's sku), or the product itself if it has none.
+    """
+    product_url = url_pattern('products:product_detail', 1)
+    variation_url = url_pattern('products:product_detail_variation', 2)
+    products = (
+        Product.objects.filter(is_active=True).select_related('category').order_by('pk')
+        .prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.order_by('sort_order', 'id')),
+            Prefetch('variations', queryset=Variation.objects.order_by('name', 'id').prefetch_related(
+                Prefetch('images', queryset=VariationImage.objects.order_by('sort_order', 'id')),
+            )),
+        )
+    )
+    for p in products.iterator(chunk_size=CHUNK_SIZE):
+        image = p.cover_image or _first_image(p.images.all())
+        on_sale = p.mrp is not None and p.mrp > p.price
+        common = {
+            'title': p.name,
+            'description': p.short_description or p.description[:5000] or p.name,
+            'availability': 'in_stock' if p.stock > 0 else 'out_of_stock',
+            'price': _money(p.mrp if on_sale else p.price),
+            'sale_price': _money(p.price) if on_sale else '',
+            'brand': p.brand,
+            'condition': 'new',
+            'product_type': p.category.name,
+        }
+        variations = p.variations.all()
+        if not variations:
+            yield {
+                **common, 'id': p.sku, 'item_group_id': '', 'color': p.color, 'size': p.size,
+                'link': base + product_url.format(p.slug),
+                'image_link': _absolute(base, image.url) if image else '',
+            }
+        for v in variations:
+            v_image = _first_image(v.images.all()) or image
+            yield {
+                **common, 'id': v.sku, 'item_group_id': p.sku,
+                'title': f"{p.name} - {v.name}" if v.name else p.name,
+                'color': v.color or p.color, 'size': v.size or p.size,
+                'link': base + variation_url.format(p.slug, v.slug),
+                'image_link': _absolute(base, v_image.url) if v_image else '',
+            }
+
+
+def feed_xml(items):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n'
+    yield f"<title>{escape(settings.CATALOG_FEED_TITLE)}</title>\n"
+    for item in items:
+        fields = ''.join(f"<g:{k}>{escape(str(item[k]))}</g:{k}>" for k in FEED_FIELDS if item[k] != '')
+        yield f"<item>{fields}</item>\n"
+    yield '</channel></rss>\n'
+
+
+class _Echo:
+    # csv.writer target that hands each formatted row back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def feed_csv(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FEED_FIELDS)
+    for item in items:
+        yield writer.writerow([item[k] for k in FEED_FIELDS])
+
+
+def generate_feed(fmt, base):
+    return (feed_xml if fmt == 'xml' else feed_csv)(feed_items(base))
+
+
+# ---------------- precomputed files ----------------
+
+def _feed_name(fmt):
+    return f'{STORAGE_DIR}/products.{fmt}.gz'
+
+
+def _sitemap_name(section=None, page=None):
+    return f'{STORAGE_DIR}/sitemap-{section}-{page}.xml.gz' if section else f'{STORAGE_DIR}/sitemap.xml.gz'
+
+
+def write_compressed(name, chunks):
+    """Gzip ``chunks`` into a temp file, then replace ``name`` in default_storage with it."""
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=6) as gz:
+            for chunk in chunks:
+                gz.write(chunk.encode())
+        size = tmp.tell()
+        tmp.seek(0)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, File(tmp, name=name))
+    return size
+
+
+def build_all(base, stdout=None):
+    """Write the feeds and every sitemap file to storage. Returns {name: compressed bytes}."""
+    written = {}
+    for fmt in FEED_FORMATS:
+        written[_feed_name(fmt)] = write_compressed(_feed_name(fmt), generate_feed(fmt, base))
+    pages = sitemap_pages()
+    for section, page in pages:
+        name = _sitemap_name(section, page)
+        written[name] = write_compressed(name, sitemap_section(base, section, page))
+    written[_sitemap_name()] = write_compressed(_sitemap_name(), sitemap_index(base, pages))
+    # files for pages the catalog has shrunk out of
+    for section in ('products', 'variations'):
+        page = 1 + sum(1 for s, _ in pages if s == section)
+        while default_storage.exists(_sitemap_name(section, page)):
+            default_storage.delete(_sitemap_name(section, page))
+            page += 1
+    if stdout:
+        for name, size in written.items():
+            stdout.write(f"{name}: {size:,} bytes")
+    return written
+
+
+def _read(fh, size=64 * 1024):
+    with fh:
+        yield from iter(lambda: fh.read(size), b'')
+
+
+def _stored(request, name, content_type):
+    """A precomputed gzip file, passed through compressed if the client takes gzip, else inflated on the fly."""
+    if not default_storage.exists(name):
+        raise Http404("Not generated yet; run manage.py build_feeds")
+    fh = default_storage.open(name, 'rb')
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = _stream(_read(fh), content_type)
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = default_storage.size(name)
+    else:
+        response = _stream(_read(gzip.GzipFile(fileobj=fh)), content_type)
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+async def _pull(chunks, batch=500):
+    # under ASGI a sync iterator would be read into memory whole before sending;
+    # pull it in batches on the request's sync thread (its DB cursor lives there)
+    chunks = iter(chunks)
+    take = sync_to_async(lambda: list(islice(chunks, batch)))
+    while items := await take():
+        for item in items:
+            yield item
+
+
+def _stream(chunks, content_type):
+    if settings.CATALOG_ASYNC_VIEWS:
+        chunks = _pull(chunks)
+    return StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+
+
+# ---------------- views ----------------
+
+@require_GET
+def sitemap(request):
+    if settings.CATALOG_FEEDS_PRECOMPUTED:
+        return _stored(request, _sitemap_name(), 'application/xml')
+    return _stream(sitemap_index(base_url(request), sitemap_pages()), 'application/xml')
+
+
+@require_GET
+def sitemap_page(request, section, page):
+    if section not in ('products', 'variations'):
+        raise Http404
+    if settings.CATALOG_FEEDS_PRECOMPUTED:
+        return _stored(request, _sitemap_name(section, page), 'application/xml')
+    if page > 1 and _sitemap_rows(section)[1].count() <= (page - 1) * SITEMAP_LIMIT:
+        raise Http404
+    return _stream(sitemap_section(base_url(request), section, page), 'application/xml')
+
+
+@require_GET
+def product_feed(request, fmt):
+    if fmt not in FEED_FORMATS:
+        raise Http404
+    if settings.CATALOG_FEEDS_PRECOMPUTED:
+        return _stored(request, _feed_name(fmt), FEED_FORMATS[fmt])
+    return _stream(generate_feed(fmt, base_url(request)), FEED_FORMATS[fmt])
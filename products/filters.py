@@ -0,0 +1,94 @@
+from decimal import Decimal, InvalidOperation
+
+from .categories import get_category_tree
+from .models import Product, ProductCard
+from .search import get_search_backend
+
+# GET params that narrow the listing (everything except sort/paging)
+FILTER_PARAMS = ('q', 'category', 'brand', 'min', 'max')
+
+# .attributes (numpy) is imported by the functions using it, so importing the
+# URLconf doesn't load numpy; the first listing request (or warm-up) does
+
+
+def parse_price(value):
+    """?min=/?max= as a finite Decimal, else None."""
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return price if price.is_finite() else None
+
+
+def get_filters(params):
+    """
+    Single-valued FILTER_PARAMS as strings (a min/max that isn't a number is
+    dropped); the multi-select ATTRIBUTES (?color=red&color=blue or
+    ?color=red,blue) as sorted normalized lists.
+    """
+    from .attributes import ATTRIBUTES, normalize
+
+    filters = {name: params.get(name) or '' for name in FILTER_PARAMS}
+    for name in ('min', 'max'):
+        if filters[name] and parse_price(filters[name]) is None:
+            filters[name] = ''
+    for attr in ATTRIBUTES:
+        filters[attr] = sorted({normalize(v) for raw in params.getlist(attr) for v in raw.split(',')} - {''})
+    return filters
+
+
+def _narrow(qs, f, path_lookup):
+    from .attributes import ATTRIBUTES, from_bits, get_attribute_index, restrict
+
+    if 'category' in f:
+        # the category and everything below it, via the materialized path index
+        node = get_category_tree().by_slug.get(f['category'])
+        qs = qs.filter(**{path_lookup: node['path']}) if node else qs.none()
+    if 'brand' in f:
+        qs = qs.filter(brand__iexact=f['brand'])
+    if 'min' in f:
+        qs = qs.filter(price__gte=f['min'])
+    if 'max' in f:
+        qs = qs.filter(price__lte=f['max'])
+    if any(attr in f for attr in ATTRIBUTES):
+        # color/size come from the bitmap index; the database only sees the matching ids
+        qs = restrict(qs, from_bits(get_attribute_index().matching(f)))
+    return qs
+
+
+def filter_products(filters, skip=()):
+    """
+    Active products narrowed by the /shop/ filters. ``skip`` leaves out some
+    filters, e.g. facet counts for a dimension ignore that dimension's own filter.
+    """
+    qs = Product.objects.filter(is_active=True)
+    f = {k: v for k, v in filters.items() if v and k not in skip}
+
+    if 'q' in f:
+        qs = get_search_backend().search(qs, f['q'])
+    return _narrow(qs, f, 'category__path__startswith')
+
+
+def filter_cards(filters, skip=()):
+    """
+    filter_products over the ProductCard read model, which is what the /shop/
+    listing and its facets query.
+    """
+    qs = ProductCard.objects.all()
+    f = {k: v for k, v in filters.items() if v and k not in skip}
+
+    if 'q' in f:
+        qs = get_search_backend().search_cards(qs, f['q'])
+    return _narrow(qs, f, 'category_path__startswith')
+
+
+def sort_products(qs, sort, q=None):
+    if sort == 'price_asc':
+        return qs.order_by('price')
+    if sort == 'price_desc':
+        return qs.order_by('-price')
+    if sort == 'featured':
+        return qs.order_by('-is_featured', '-created_at')
+    if sort == 'relevance' and q:
+        return qs.order_by('-relevance', '-created_at')
+    return qs.order_by('-created_at')
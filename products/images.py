@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_pool():
+    # a forked child (generate_derivatives --workers) inherits the pool object but not its threads
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+# named renditions -> target width in px (never upscaled past the source)
+RENDITIONS = {'thumb': 160, 'card': 400, 'detail': 800, 'zoom': 1600}
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+# model label -> (image field, renditions field) for every image we derive from
+IMAGE_FIELDS = {
+    'products.Product': ('cover_image', 'cover_renditions'),
+    'products.ProductImage': ('image', 'renditions'),
+    'products.VariationImage': ('image', 'renditions'),
+}
+
+
+def derivative_name(source, width, fmt):
+    """products/gallery/a.png -> derivatives/products/gallery/a/400.webp"""
+    stem = PurePosixPath(source).with_suffix('')
+    return f"derivatives/{stem}/{width}.{fmt}"
+
+
+def available_widths(source_width):
+    return sorted({min(w, source_width) for w in RENDITIONS.values()})
+
+
+def rendition_width(meta, rendition):
+    return min(RENDITIONS[rendition], meta['width'])
+
+
+def scaled_height(meta, width):
+    return max(1, round(meta['height'] * width / meta['width']))
+
+
+def _encode(img, fmt):
+    from PIL import Image
+
+    pil_format, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and img.mode != 'RGB':
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            flat = Image.new('RGB', img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel('A'))
+            img = flat
+        else:
+            img = img.convert('RGB')
+    buf = BytesIO()
+    img.save(buf, pil_format, **options)
+    return buf.getvalue()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(settings.MEDIA_UPLOAD_THREADS, thread_name_prefix='media-upload')
+    return _executor
+
+
+def save_files(files, storage=None):
+    """Write {name: bytes} to ``storage``, replacing existing files, on the upload threads."""
+    storage = storage or default_storage
+
+    def put(item):
+        name, data = item
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(data))
+
+    # list() re-raises the first upload error here
+    list(_pool().map(put, files.items()))
+
+
+def generate_derivatives(source, storage=None):
+    """
+    Write every rendition of ``source`` in WebP and JPEG to ``storage`` and
+    return the metadata templates need to build srcset without touching
+    storage: {'source', 'width', 'height', 'widths'}.
+    """
+    # Pillow is imported here, not at module level: the signal handlers import
+    # this module into every process, and only uploads need it
+    from PIL import Image, ImageOps
+
+    storage = storage or default_storage
+    with storage.open(source, 'rb') as fh:
+        img = Image.open(fh)
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'PA') or 'transparency' in img.info else 'RGB')
+
+    meta = {'source': source, 'width': img.width, 'height': img.height, 'widths': available_widths(img.width)}
+    files = {}
+    for width in meta['widths']:
+        resized = img if width == img.width else img.resize((width, scaled_height(meta, width)), Image.LANCZOS)
+        for fmt in FORMATS:
+            files[derivative_name(source, width, fmt)] = _encode(resized, fmt)
+    save_files(files, storage)
+    return meta
+
+
+def safe_generate(source, storage=None):
+    """generate_derivatives() that logs and returns None for unreadable sources."""
+    try:
+        return generate_derivatives(source, storage)
+    except (OSError, ValueError):
+        logger.warning("Could not generate derivatives for %s", source, exc_info=True)
+        return None
+
+
+def upload_images(instances):
+    """
+    Upload the new files of these unsaved image rows (see IMAGE_FIELDS), and
+    their renditions, concurrently. Run before saving them: the saves then
+    find the files committed and the renditions filled in, so neither the
+    upload nor generate_derivatives_on_upload happens again one row at a time.
+    """
+    pending = []
+    for obj in instances:
+        field_name, meta_field = IMAGE_FIELDS[obj._meta.label]
+        file = getattr(obj, field_name)
+        if file and not file._committed:
+            pending.append((obj, file, meta_field))
+    if not pending:
+        return
+
+    def upload(job):
+        obj, file, meta_field = job
+        file.save(file.name, file.file, save=False)  # what FileField.pre_save would do
+        if settings.IMAGE_DERIVATIVES_ON_SAVE:
+            meta = safe_generate(file.name)
+            if meta is not None:
+                setattr(obj, meta_field, meta)
+
+    # renditions go through save_files on the shared pool, so the rows get their own
+    with ThreadPoolExecutor(min(len(pending), settings.MEDIA_UPLOAD_THREADS), thread_name_prefix='media-row') as rows:
+        list(rows.map(upload, pending))
@@ -0,0 +1,326 @@
+import functools
+import logging
+import math
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (ms) of the latency buckets reported by dump_perf_stats
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SNAPSHOT_INDEX_KEY = 'perf:snapshots'
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+_current = ContextVar('perf_request_metrics', default=None)
+_MISS = object()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; fine for the few thousand samples we keep."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL with literals and IN-lists collapsed, so N+1 loops group together."""
+    return _PLACEHOLDER_LISTS.sub('(...)', _LITERALS.sub('?', sql))
+
+
+class RequestMetrics:
+    """What one request spent on SQL, templates and the cache."""
+
+    __slots__ = ('queries', 'template_ms', 'template_depth', 'cache_ms', 'cache_hits', 'cache_misses', 'in_cache')
+
+    def __init__(self):
+        self.queries = []  # (sql, ms, alias)
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.cache_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.in_cache = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000, context['connection'].alias))
+
+    @property
+    def db_ms(self):
+        return sum(ms for _, ms, _ in self.queries)
+
+    def repeated(self):
+        """[(count, fingerprint)] for statements run more than once, most repeated first."""
+        counts = Counter(fingerprint(sql) for sql, _, _ in self.queries)
+        return [(n, fp) for fp, n in counts.most_common() if n > 1]
+
+    def server_timing(self, total_ms):
+        dupes = sum(n - 1 for n, _ in self.repeated())
+        return ', '.join([
+            f'db;dur={self.db_ms:.1f};desc="{len(self.queries)} queries, {dupes} repeated"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'cache;dur={self.cache_ms:.1f};desc="{self.cache_hits} hit, {self.cache_misses} miss"',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        metrics = _current.get()
+        if metrics is None or metrics.template_depth:
+            return render(self, context)
+        metrics.template_depth = 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+            metrics.template_depth = 0
+    wrapper.perf_wrapped = True
+    return wrapper
+
+
+def _counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache:
+            return get(self, key, default, version)
+        started = time.perf_counter()
+        value = get(self, key, _MISS, version)
+        metrics.cache_ms += (time.perf_counter() - started) * 1000
+        if value is _MISS:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+    wrapper.perf_wrapped = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        metrics.in_cache = True  # BaseCache.get_many loops over get()
+        started = time.perf_counter()
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            metrics.in_cache = False
+        metrics.cache_ms += (time.perf_counter() - started) * 1000
+        metrics.cache_hits += len(found)
+        metrics.cache_misses += len(keys) - len(found)
+        return found
+    wrapper.perf_wrapped = True
+    return wrapper
+
+
+_install_lock = threading.Lock()
+
+
+def install():
+    """Hook template rendering and the configured cache backends (idempotent)."""
+    with _install_lock:
+        if not getattr(Template.render, 'perf_wrapped', False):
+            Template.render = _timed_render(Template.render)
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if not getattr(backend.get, 'perf_wrapped', False):
+                backend.get = _counted_get(backend.get)
+            if not getattr(backend.get_many, 'perf_wrapped', False):
+                backend.get_many = _counted_get_many(backend.get_many)
+
+
+class Histogram:
+    """Rolling window of the last ``size`` requests to one view."""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)  # (total_ms, db_ms, queries)
+
+    def add(self, total_ms, db_ms, queries):
+        self.samples.append((round(total_ms, 2), round(db_ms, 2), queries))
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+_last_publish = 0.0
+
+
+def record(view_name, total_ms, metrics):
+    with _histograms_lock:
+        hist = _histograms.get(view_name)
+        if hist is None:
+            hist = _histograms[view_name] = Histogram(settings.PERF_HISTOGRAM_SIZE)
+        hist.add(total_ms, metrics.db_ms, len(metrics.queries))
+
+
+def snapshot():
+    """{view_name: [(total_ms, db_ms, queries), ...]} for this process."""
+    with _histograms_lock:
+        return {name: list(hist.samples) for name, hist in _histograms.items()}
+
+
+def reset():
+    global _last_publish
+    with _histograms_lock:
+        _histograms.clear()
+        _last_publish = 0.0
+
+
+def summarize(samples):
+    totals = [s[0] for s in samples]
+    buckets = Counter(next((b for b in BUCKETS_MS if t <= b), None) for t in totals)
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(totals, 50),
+        'p95_ms': percentile(totals, 95),
+        'p99_ms': percentile(totals, 99),
+        'max_ms': max(totals),
+        'avg_db_ms': round(sum(s[1] for s in samples) / len(samples), 2),
+        'avg_queries': round(sum(s[2] for s in samples) / len(samples), 1),
+        'buckets': [(b, buckets[b]) for b in BUCKETS_MS] + [(None, buckets[None])],
+    }
+
+
+def _snapshot_key():
+    return f"perf:snapshot:{socket.gethostname()}:{os.getpid()}"
+
+
+def publish(force=False):
+    """
+    Copy this process's histograms into the cache (at most every
+    PERF_PUBLISH_SECONDS) so dump_perf_stats can merge all workers.
+    """
+    global _last_publish
+    now = time.monotonic()
+    if not force and now - _last_publish < settings.PERF_PUBLISH_SECONDS:
+        return
+    _last_publish = now
+    key = _snapshot_key()
+    cache.set(key, {'at': time.time(), 'views': snapshot()}, SNAPSHOT_TIMEOUT)
+    keys = cache.get(SNAPSHOT_INDEX_KEY) or []
+    if key not in keys:
+        cache.set(SNAPSHOT_INDEX_KEY, (keys + [key])[-200:], SNAPSHOT_TIMEOUT)
+
+
+def collect():
+    """Merge every published snapshot: {view_name: samples}."""
+    merged = {}
+    for key in cache.get(SNAPSHOT_INDEX_KEY) or []:
+        data = cache.get(key)
+        for name, samples in (data or {}).get('views', {}).items():
+            merged.setdefault(name, []).extend(samples)
+    return merged
+
+
+def clear_published():
+    cache.delete_many((cache.get(SNAPSHOT_INDEX_KEY) or []) + [SNAPSHOT_INDEX_KEY])
+
+
+def _log_slow(request, view_name, total_ms, metrics):
+    slowest = sorted(metrics.queries, key=lambda q: q[1], reverse=True)[:5]
+    lines = [f"  {ms:.1f}ms [{alias}] {sql[:500]}" for sql, ms, alias in slowest]
+    lines += [f"  x{n} {fp[:500]}" for n, fp in metrics.repeated()[:5]]
+    logger.warning(
+        "Slow request %s %s (%s): %.0fms, %d queries in %.0fms, templates %.0fms\n%s",
+        request.method, request.get_full_path(), view_name, total_ms,
+        len(metrics.queries), metrics.db_ms, metrics.template_ms, '\n'.join(lines),
+    )
+
+
+@contextmanager
+def counting_queries():
+    """
+    Count the queries of this thread's connections towards the request being
+    measured, if any. The middleware does it for the request's thread; code
+    running ORM work on other threads (products.views._concurrently) enters
+    it there, as connections are per thread.
+    """
+    metrics = _current.get()
+    with ExitStack() as stack:
+        if metrics is not None:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(metrics))
+        yield
+
+
+class InstrumentationMiddleware:
+    """
+    Per-request query count, DB/template/cache time and repeated-query
+    fingerprints, sent as Server-Timing and kept in rolling per-view
+    histograms. Enabled with PERF_INSTRUMENTATION; list it first. Async-capable,
+    so measuring the ASGI profile doesn't push its views through a sync thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with counting_queries():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            # the request's connections; thread-sensitive sync_to_async calls share them
+            with counting_queries():
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, started)
+
+    def _finish(self, request, response, metrics, started):
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else '<unresolved>'
+        response['Server-Timing'] = metrics.server_timing(total_ms)
+        record(view_name, total_ms, metrics)
+        if total_ms >= settings.PERF_SLOW_REQUEST_MS:
+            _log_slow(request, view_name, total_ms, metrics)
+        publish()
+        return response
@@ -0,0 +1,56 @@
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from products.benchmark import compare, default_scenarios, load_baseline, run_scenarios, save_baseline
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Time /, /shop/ and /shop/<slug>/ through the test client across filter, sort "
+        "and page combinations; report p50/p95 and query counts and compare with a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--cold', action='store_true', help="clear the cache before every request")
+        parser.add_argument('--only', help="comma-separated scenario name prefixes, e.g. list:,detail:product")
+        parser.add_argument('--baseline', help="JSON file to compare against")
+        parser.add_argument('--save-baseline', help="write this run's results to a JSON file")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p95 slowdown (fraction)")
+
+    def handle(self, **options):
+        if not Product.objects.exists():
+            raise CommandError("Catalog is empty; run manage.py seed_catalog first.")
+        scenarios = default_scenarios()
+        if options['only']:
+            prefixes = tuple(options['only'].split(','))
+            scenarios = [s for s in scenarios if s.name.startswith(prefixes)]
+
+        results = run_scenarios(scenarios, options['iterations'], options['warmup'], options['cold'])
+
+        self.stdout.write(f"{'scenario':<26} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<26} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['queries']:>8}")
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results, {
+                'vendor': connection.vendor,
+                'products': Product.objects.count(),
+                'cold': options['cold'],
+                'python': platform.python_version(),
+                'debug': settings.DEBUG,
+            })
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        if options['baseline']:
+            problems = compare(results, load_baseline(options['baseline']), options['tolerance'])
+            for problem in problems:
+                self.stderr.write(f"REGRESSION {problem}")
+            if problems:
+                raise CommandError(f"{len(problems)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import feeds
+
+
+class Command(BaseCommand):
+    help = "Write the shopping feeds and sitemaps, gzip-compressed, to media storage (served with CATALOG_FEEDS_PRECOMPUTED)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='',
+                            help="Scheme + host for links, e.g. https://shop.example.com (default: CATALOG_BASE_URL)")
+
+    def handle(self, **options):
+        base = options['base_url'].rstrip('/')
+        if not base:
+            try:
+                base = feeds.base_url()
+            except ValueError as exc:
+                raise CommandError(f"{exc}; pass --base-url") from None
+        started = time.monotonic()
+        written = feeds.build_all(base, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(written)} files in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version
+from products.cards import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductCard read model the /shop/ listing reads, one row per active product."
+
+    def handle(self, **options):
+        started = time.monotonic()
+        total = rebuild_all(stdout=self.stdout)
+        bump_catalog_version()  # cached facets and listing ETags were computed from the old rows
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {total} product cards in {time.monotonic() - started:.1f}s"
+        ))
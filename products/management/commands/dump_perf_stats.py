@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from products.instrumentation import BUCKETS_MS, clear_published, collect, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the per-view latency histograms the instrumentation middleware publishes "
+        "to the cache (needs a shared CACHE_URL to see other processes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="machine-readable output")
+        parser.add_argument('--view', help="only this URL name, e.g. products:product_list")
+        parser.add_argument('--reset', action='store_true', help="drop the published histograms afterwards")
+
+    def handle(self, **options):
+        merged = collect()
+        if options['view']:
+            merged = {k: v for k, v in merged.items() if k == options['view']}
+        stats = {name: summarize(samples) for name, samples in sorted(merged.items()) if samples}
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        elif not stats:
+            self.stdout.write("No samples published yet (is PERF_INSTRUMENTATION on?)")
+        else:
+            self.stdout.write(
+                f"{'view':<32} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'queries':>8} {'db ms':>8}"
+            )
+            for name, s in stats.items():
+                self.stdout.write(
+                    f"{name:<32} {s['count']:>6} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} "
+                    f"{s['max_ms']:>8.1f} {s['avg_queries']:>8.1f} {s['avg_db_ms']:>8.1f}"
+                )
+                self.stdout.write("    " + "  ".join(
+                    f"<={b}ms:{n}" if b else f">{BUCKETS_MS[-1]}ms:{n}" for b, n in s['buckets'] if n
+                ))
+
+        if options['reset']:
+            clear_published()
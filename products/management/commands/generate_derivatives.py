@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products.cache import bump_catalog_version
+from products.cards import refresh_cards
+from products.images import IMAGE_FIELDS, safe_generate
+
+# the listing card shows the cover, else the first gallery image: the product each row's card belongs to
+CARD_PRODUCT = {'products.Product': 'pk', 'products.ProductImage': 'product_id'}
+
+_worker_storage = None
+
+
+def _init_worker():
+    # each process builds its own storage (boto clients aren't fork-safe)
+    global _worker_storage
+    _worker_storage = storages.create_storage(settings.STORAGES['default'])
+
+
+def _generate(source):
+    return source, safe_generate(source, _worker_storage)
+
+
+class Command(BaseCommand):
+    help = "Backfill thumb/card/detail/zoom renditions for existing product images using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--force', action='store_true', help="regenerate even if renditions are up to date")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, workers, force, batch_size, **options):
+        started = time.monotonic()
+        done = failed = 0
+        # forked workers must not share the parent's DB sockets
+        for conn in connections.all(initialized_only=True):
+            if not conn.in_atomic_block:
+                conn.close()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for label, (field_name, meta_field) in IMAGE_FIELDS.items():
+                model = apps.get_model(label)
+                fields = ['pk', field_name, meta_field, CARD_PRODUCT.get(label, 'pk')]
+                for batch in self.pending(model, fields, force, batch_size):
+                    results = dict(pool.map(_generate, {getattr(obj, field_name).name for obj in batch}))
+                    changed = []
+                    for obj in batch:
+                        meta = results[getattr(obj, field_name).name]
+                        if meta is None:
+                            failed += 1
+                            continue
+                        setattr(obj, meta_field, meta)
+                        changed.append(obj)
+                    model.objects.bulk_update(changed, [meta_field])
+                    if label in CARD_PRODUCT:
+                        # bulk_update skips the signals that keep the cards' renditions current
+                        refresh_cards(getattr(obj, CARD_PRODUCT[label]) for obj in changed)
+                    done += len(changed)
+                    self.stdout.write(f"{label}: {done} images ({done / (time.monotonic() - started):,.1f}/s)")
+        if done:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated renditions for {done} images ({failed} failed) in {time.monotonic() - started:.1f}s"
+        ))
+
+    def pending(self, model, fields, force, batch_size):
+        """Batches of rows whose renditions are missing or describe an older file; ``fields``: pk, file, renditions, ..."""
+        _, field_name, meta_field, *_ = fields
+        qs = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).only(*fields)
+        batch = []
+        for obj in qs.order_by('pk').iterator(chunk_size=batch_size):
+            if force or getattr(obj, meta_field).get('source') != getattr(obj, field_name).name:
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
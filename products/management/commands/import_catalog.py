@@ -0,0 +1,273 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from products.cache import bump_catalog_version
+from products.cards import refresh_cards
+from products.models import Category, Product, ProductImage, Variation, VariationImage, bulk_unique_slugify
+from products.search import get_search_backend
+
+PRODUCT_FIELDS = ('name', 'brand', 'price', 'mrp', 'stock', 'short_description', 'description',
+                  'is_active', 'is_featured', 'color', 'size', 'cover_image')
+VARIATION_FIELDS = ('name', 'color', 'size')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt):
+    """Yield (line_no, dict) one row at a time; never loads the whole file."""
+    with open(path, newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            for i, row in enumerate(csv.DictReader(fh), start=1):
+                yield i, row
+        else:
+            for i, line in enumerate(fh, start=1):
+                if line.strip():
+                    yield i, json.loads(line)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(row, key, required=False):
+    value = _text(row, key)
+    if not value:
+        if required:
+            raise RowError(f"{key} is required")
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"{key}: {value!r} is not a number")
+
+
+def _bool(row, key, default):
+    value = _text(row, key)
+    return value.lower() in TRUE_VALUES if value else default
+
+
+def _images(row):
+    value = row.get('images') or []
+    if isinstance(value, str):
+        value = value.split('|')
+    return [p.strip() for p in value if p and p.strip()]
+
+
+def parse_product(row):
+    sku = _text(row, 'sku')
+    if not sku or not _text(row, 'name') or not _text(row, 'category'):
+        raise RowError("sku, name and category are required")
+    stock = _text(row, 'stock')
+    if stock and not stock.isdigit():
+        raise RowError(f"stock: {stock!r} is not a whole number")
+    return {
+        'sku': sku,
+        'category': _text(row, 'category'),
+        'parent_category': _text(row, 'parent_category'),
+        'name': _text(row, 'name'),
+        'brand': _text(row, 'brand'),
+        'price': _decimal(row, 'price', required=True),
+        'mrp': _decimal(row, 'mrp'),
+        'stock': int(stock or 0),
+        'short_description': _text(row, 'short_description'),
+        'description': _text(row, 'description'),
+        'is_active': _bool(row, 'is_active', True),
+        'is_featured': _bool(row, 'is_featured', False),
+        'color': _text(row, 'color'),
+        'size': _text(row, 'size'),
+        'cover_image': _text(row, 'cover_image') or None,
+        'images': _images(row),
+    }
+
+
+def parse_variation(row):
+    sku = _text(row, 'sku')
+    if not sku:
+        raise RowError("sku is required")
+    return {
+        'sku': sku,
+        'product_sku': _text(row, 'product_sku'),
+        'name': _text(row, 'name'),
+        'color': _text(row, 'color'),
+        'size': _text(row, 'size'),
+        'images': _images(row),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV / JSON Lines catalog into Category, Product and Variation, "
+        "upserting by sku in batches. Rows with a product_sku are variations of "
+        "that product; 'images' holds gallery paths (CSV: separated by '|')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help="default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help="skip rows already committed by a previous run (see --state-file)")
+        parser.add_argument('--state-file', help="default: <path>.progress")
+
+    def handle(self, path, **options):
+        path = Path(path)
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'jsonl')
+        state_file = Path(options['state_file'] or f"{path}.progress")
+
+        done = 0
+        if options['resume'] and state_file.exists():
+            done = json.loads(state_file.read_text())['rows']
+            self.stdout.write(f"Resuming after row {done}")
+
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        rows = islice(read_rows(path, fmt), done, None)
+        started = time.monotonic()
+        total = errors = 0
+        try:
+            for number, batch in enumerate(batched(rows, options['batch_size']), start=1):
+                with transaction.atomic():
+                    errors += self.import_batch(batch)
+                done += len(batch)
+                total += len(batch)
+                state_file.write_text(json.dumps({'rows': done}))
+                rate = total / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(f"batch {number}: {done} rows committed ({rate:,.0f} rows/s)")
+        finally:
+            # bulk writes skip model signals; invalidate caches/indexes once instead
+            if total:
+                from products import suggest  # numpy: only once something was imported
+
+                bump_catalog_version()
+                get_search_backend().reset()
+                suggest.invalidate()
+
+        elapsed = time.monotonic() - started
+        state_file.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total - errors} rows ({errors} skipped) in {elapsed:.1f}s "
+            f"({total / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
+
+    def import_batch(self, batch):
+        products, variations, errors = {}, {}, 0
+        for line, row in batch:
+            try:
+                if _text(row, 'product_sku'):
+                    data = parse_variation(row)
+                    variations[data['sku']] = data
+                else:
+                    data = parse_product(row)
+                    products[data['sku']] = data
+            except RowError as exc:
+                errors += 1
+                self.stderr.write(f"row {line}: {exc}")
+
+        self.upsert_categories(products.values())
+        product_ids = self.upsert_products(products)
+        variation_errors, variation_owners = self.upsert_variations(variations, product_ids)
+        # bulk writes skip the signals that maintain the listing cards
+        refresh_cards({*product_ids.values(), *variation_owners})
+        return errors + variation_errors
+
+    def upsert_categories(self, rows):
+        parents = {r['parent_category'] for r in rows if r['parent_category']}
+        wanted = {r['category']: r['parent_category'] for r in rows}
+        created = self._create_categories(parents - self.categories.keys(), {})
+        created += self._create_categories(wanted.keys() - self.categories.keys(), wanted)
+        if created:
+            Category.rebuild_paths()  # bulk_create skips save(), which maintains the tree; once per batch
+
+    def _create_categories(self, names, parents):
+        if not names:
+            return 0
+        objs = [Category(name=n, parent_id=self.categories.get(parents.get(n))) for n in sorted(names)]
+        bulk_unique_slugify(objs)
+        for obj in Category.objects.bulk_create(objs):
+            self.categories[obj.name] = obj.pk
+        return len(objs)
+
+    def upsert_products(self, rows):
+        existing = Product.objects.in_bulk(rows.keys(), field_name='sku')
+        now = timezone.now()
+        to_create, to_update = [], []
+        for sku, data in rows.items():
+            obj = existing.get(sku) or Product(sku=sku)
+            for field in PRODUCT_FIELDS:
+                setattr(obj, field, data[field])
+            obj.category_id = self.categories[data['category']]
+            obj.updated_at = now
+            (to_update if obj.pk else to_create).append(obj)
+
+        bulk_unique_slugify(to_create)
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, PRODUCT_FIELDS + ('category', 'updated_at'))
+
+        ids = {obj.sku: obj.pk for obj in to_create + to_update}
+        self.attach_images(ProductImage, 'product_id', {ids[sku]: d['images'] for sku, d in rows.items()})
+        return ids
+
+    def upsert_variations(self, rows, product_ids):
+        missing = {d['product_sku'] for d in rows.values()} - product_ids.keys()
+        product_ids = dict(product_ids, **dict(
+            Product.objects.filter(sku__in=missing).values_list('sku', 'pk')
+        ))
+        existing = Variation.objects.in_bulk(rows.keys(), field_name='sku')
+        now = timezone.now()
+        to_create, to_update, errors = [], [], 0
+        for sku, data in rows.items():
+            product_id = product_ids.get(data['product_sku'])
+            if product_id is None:
+                errors += 1
+                self.stderr.write(f"variation {sku}: unknown product_sku {data['product_sku']!r}")
+                continue
+            obj = existing.get(sku) or Variation(sku=sku)
+            for field in VARIATION_FIELDS:
+                setattr(obj, field, data[field])
+            obj.product_id = product_id
+            obj.updated_at = now
+            (to_update if obj.pk else to_create).append(obj)
+
+        bulk_unique_slugify(to_create, source=Variation.slug_source, scope_field='product_id')
+        Variation.objects.bulk_create(to_create)
+        Variation.objects.bulk_update(to_update, VARIATION_FIELDS + ('product', 'updated_at'))
+
+        ids = {obj.sku: obj.pk for obj in to_create + to_update}
+        self.attach_images(VariationImage, 'variation_id', {ids[s]: rows[s]['images'] for s in ids})
+        return errors, {obj.product_id for obj in to_create + to_update}
+
+    def attach_images(self, model, owner_field, images_by_owner):
+        """Add gallery rows for paths the owner doesn't have yet (one SELECT + one INSERT)."""
+        images_by_owner = {k: v for k, v in images_by_owner.items() if v}
+        if not images_by_owner:
+            return
+        existing = set(
+            model.objects.filter(**{f'{owner_field}__in': images_by_owner})
+            .values_list(owner_field, 'image')
+        )
+        new = [
+            model(**{owner_field: owner}, image=path, sort_order=order)
+            for owner, paths in images_by_owner.items()
+            for order, path in enumerate(paths)
+            if (owner, path) not in existing
+        ]
+        model.objects.bulk_create(new)
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from itertools import count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.http import urlencode
+
+from products.benchmark import default_scenarios
+from products.instrumentation import percentile
+
+
+def _paths(only=None):
+    scenarios = [s for s in default_scenarios() if not s.settings]
+    if only:
+        scenarios = [s for s in scenarios if s.name.startswith(tuple(only.split(',')))]
+    return [s.url + (f"?{urlencode(s.params)}" if s.params else '') for s in scenarios]
+
+
+def run_load(base_url, paths, concurrency, duration):
+    """``concurrency`` threads request ``paths`` round-robin for ``duration`` seconds."""
+    timings, errors, lock = [], [0], threading.Lock()
+    ticket = count()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            url = base_url + paths[next(ticket) % len(paths)]
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as resp:
+                    resp.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if ok:
+                    timings.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {
+        'requests': len(timings),
+        'errors': errors[0],
+        'rps': round(len(timings) / duration, 1),
+        'p50_ms': round(percentile(timings, 50), 1) if timings else None,
+        'p95_ms': round(percentile(timings, 95), 1) if timings else None,
+    }
+
+
+@contextmanager
+def gunicorn(profile, workers, port, **extra_env):
+    """Start gunicorn.conf.py with SERVER_PROFILE=<profile> and wait until it answers."""
+    env = dict(os.environ, SERVER_PROFILE=profile, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}", **extra_env)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py')],
+        cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            if proc.poll() is not None:
+                raise CommandError(f"{profile} server exited: {proc.stderr.read().decode()[-2000:]}")
+            try:
+                urllib.request.urlopen(base_url + '/shop/', timeout=5).read()
+                break
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        else:
+            raise CommandError(f"{profile} server did not come up on port {port}")
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+class Command(BaseCommand):
+    help = (
+        "HTTP load test over the benchmark scenarios' URLs. Either against a running "
+        "server (--url) or --compare: start the WSGI and the ASGI gunicorn profile with "
+        "the same worker count, one after the other, and report both. Or --replicas 0,1,2: "
+        "start the WSGI profile once per count with that many of DB_REPLICA_URLS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--compare', action='store_true', help="start and compare wsgi vs asgi")
+        parser.add_argument('--replicas', help="comma-separated replica counts to compare, e.g. 0,1,2")
+        parser.add_argument('--workers', type=int, default=2, help="gunicorn workers per run (--compare/--replicas)")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=15, help="seconds per run")
+        parser.add_argument('--warmup', type=float, default=3, help="seconds of unmeasured load first")
+        parser.add_argument('--only', help="comma-separated scenario prefixes, e.g. list:,detail:")
+
+    def handle(self, **options):
+        if sum(map(bool, (options['url'], options['compare'], options['replicas']))) != 1:
+            raise CommandError("Pass one of --url, --compare or --replicas")
+        replica_urls = [u.strip() for u in os.environ.get('DB_REPLICA_URLS', '').split(',') if u.strip()]
+        counts = [int(n) for n in options['replicas'].split(',')] if options['replicas'] else []
+        if counts and max(counts) > len(replica_urls):
+            raise CommandError(f"--replicas {max(counts)} needs that many DB_REPLICA_URLS, {len(replica_urls)} set")
+        paths = _paths(options['only'])
+        if not paths:
+            raise CommandError("No URLs to hit; run manage.py seed_catalog first.")
+
+        def measure(base_url):
+            run_load(base_url, paths, options['concurrency'], options['warmup'])
+            return run_load(base_url, paths, options['concurrency'], options['duration'])
+
+        if options['url']:
+            results = {options['url']: measure(options['url'].rstrip('/'))}
+        elif counts:
+            results = {}
+            for n in counts:
+                env = {'DB_REPLICA_URLS': ','.join(replica_urls[:n])}
+                with gunicorn('wsgi', options['workers'], options['port'], **env) as base_url:
+                    results[f"{n} replicas"] = measure(base_url)
+        else:
+            results = {}
+            for profile in ('wsgi', 'asgi'):
+                with gunicorn(profile, options['workers'], options['port']) as base_url:
+                    results[profile] = measure(base_url)
+
+        self.stdout.write(f"{len(paths)} URLs, concurrency {options['concurrency']}, {options['duration']}s")
+        self.stdout.write(f"{'target':<28} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<28} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['errors']:>7}")
+        if options['compare'] and results['wsgi']['rps']:
+            gain = results['asgi']['rps'] / results['wsgi']['rps'] - 1
+            self.stdout.write(f"asgi vs wsgi throughput: {gain:+.0%} at {options['workers']} workers each")
+        if len(counts) > 1 and results[f"{counts[0]} replicas"]['rps']:
+            baseline = results[f"{counts[0]} replicas"]['rps']
+            for n in counts[1:]:
+                gain = results[f"{n} replicas"]['rps'] / baseline - 1
+                self.stdout.write(f"{n} vs {counts[0]} replicas throughput: {gain:+.0%}")
@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from products import warmup
+
+# Runs in a fresh interpreter (python -X importtime): times each startup phase,
+# then the first and second request to each path. Import timings go to stderr,
+# split into phases by the markers; the results are one JSON line on stdout.
+PROBE = r'''
+import json, os, sys, time
+
+def mark(phase):
+    sys.stderr.write(f"--- {phase}\n")
+    sys.stderr.flush()
+
+started = time.perf_counter()
+from django.conf import settings
+settings.WSGI_APPLICATION
+timings = {"settings": (time.perf_counter() - started) * 1000}
+mark("app")
+from django.core.servers.basehttp import get_internal_wsgi_application
+app = get_internal_wsgi_application()
+timings["app"] = (time.perf_counter() - started) * 1000 - timings["settings"]
+mark("warm-up" if sys.argv[1] == "warm" else "requests")
+from products import warmup
+if sys.argv[1] == "warm":
+    t = time.perf_counter()
+    warmup.warm(app)
+    timings["warm-up"] = (time.perf_counter() - t) * 1000
+    mark("requests")
+requests = [[path, warmup.fetch(app, path)[:2], warmup.fetch(app, path)[1]] for path in json.loads(sys.argv[2])]
+print(json.dumps({"timings": timings, "requests": requests}))
+'''
+
+
+def _run(mode, paths):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, mode, json.dumps(paths)],
+        cwd=settings.BASE_DIR, env=os.environ, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise CommandError(f"startup probe failed:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def import_breakdown(stderr):
+    """-X importtime output -> {phase: Counter(top-level package -> self ms)}."""
+    phases, phase = {}, 'settings'
+    for line in stderr.splitlines():
+        if line.startswith('--- '):
+            phase = line[4:]
+        elif line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+            own, _, name = line[len('import time:'):].split('|')
+            phases.setdefault(phase, Counter())[name.strip().split('.')[0]] += int(own) / 1000
+    return phases
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the WSGI app in fresh interpreters and report where startup goes: time per phase "
+        "(settings, app loading), imports per package and phase, and time to first byte of the "
+        "hottest paths in a cold process vs. one warmed by products.warmup (as gunicorn does)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=12, help="packages listed per phase")
+
+    def handle(self, **options):
+        # worked out here: the probe's first requests must not find anything loaded
+        paths = warmup.hot_paths(1, 1) + [f"{reverse('products:api_suggest')}?q=a"]
+        cold, stderr = _run('cold', paths)
+        warm, _ = _run('warm', paths)
+
+        self.stdout.write("Startup (cold process)")
+        for phase, ms in cold['timings'].items():
+            self.stdout.write(f"  {phase:<22} {ms:>8.1f} ms")
+        for phase, packages in import_breakdown(stderr).items():
+            self.stdout.write(f"Imports during {phase}: {sum(packages.values()):.1f} ms")
+            for package, ms in packages.most_common(options['top']):
+                self.stdout.write(f"  {package:<22} {ms:>8.1f} ms")
+
+        self.stdout.write(f"Warm-up: {warm['timings']['warm-up']:.1f} ms")
+        self.stdout.write(f"{'first byte, ms':<52} {'cold':>8} {'2nd req':>8} {'warmed':>8}")
+        warmed = {path: ttfb for path, (_, ttfb), _ in warm['requests']}
+        for path, (status, ttfb), again in cold['requests']:
+            label = path if status == 200 else f"{path} ({status})"
+            self.stdout.write(f"  {label:<50} {ttfb:>8.1f} {again:>8.1f} {warmed[path]:>8.1f}")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Category, Product
+from products.related import rebuild_all
+from products.seed import SCALES, seed_catalog
+
+
+class Command(BaseCommand):
+    help = "Fill the catalog with reproducible synthetic data for benchmarking (see products.seed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+        parser.add_argument('--products', type=int, help="override the scale's product count")
+        parser.add_argument('--depth', type=int)
+        parser.add_argument('--fanout', type=int)
+        parser.add_argument('--variations', type=int, help="max variations per product")
+        parser.add_argument('--images', type=int, help="max gallery rows per product")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='SEED', help="sku/category name prefix")
+        parser.add_argument('--flush', action='store_true', help="delete ALL products and categories first")
+        parser.add_argument('--with-related', action='store_true', help="also build the related-products index")
+
+    def handle(self, **options):
+        params = dict(SCALES[options['scale']])
+        for key in params:
+            if options[key] is not None:
+                params[key] = options[key]
+
+        if options['flush']:
+            Product.objects.all().delete()
+            Category.objects.all().delete()
+        elif Product.objects.filter(sku__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"{options['prefix']} data already loaded; use --flush or another --prefix")
+
+        started = time.monotonic()
+        seed_catalog(seed=options['seed'], prefix=options['prefix'], stdout=self.stdout, **params)
+        if options['with_related']:
+            rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {params['products']} products in {time.monotonic() - started:.1f}s"
+        ))
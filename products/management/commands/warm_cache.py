@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the caches a deploy or a cache flush empties: request the hottest pages (home, /shop/, "
+        "the largest categories, the top products) so facets, detail pages and the home snapshot are "
+        "cached (needs a shared CACHE_URL to help other processes). gunicorn workers warm their own "
+        "templates and indexes (gunicorn.conf.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, help="largest categories to warm (default: WARMUP_CATEGORIES)")
+        parser.add_argument('--products', type=int, help="top product pages to warm (default: WARMUP_PRODUCTS)")
+
+    def handle(self, **options):
+        started = time.monotonic()
+        for step, ms in warmup.warm_process():
+            self.stdout.write(f"{step:<20} {ms:>8.1f} ms")
+        pages = warmup.warm_pages(paths=warmup.hot_paths(options['categories'], options['products']))
+        failed = 0
+        for path, status, ms in pages:
+            if status != 200:
+                failed += 1
+                self.stderr.write(f"{path}: {status}")
+            elif options['verbosity'] > 1:
+                self.stdout.write(f"{path:<60} {ms:>8.1f} ms")
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Warmed {len(pages) - failed}/{len(pages)} pages in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:12
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+CARD_VARIATION_LIMIT = 6
+
+
+def fill_cards(apps, schema_editor):
+    # same projection as products.cards.build_card, on the historical models
+    Product = apps.get_model('products', 'Product')
+    ProductCard = apps.get_model('products', 'ProductCard')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    Variation = apps.get_model('products', 'Variation')
+    ids = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), 1000):
+        batch = ids[start:start + 1000]
+        images, variations = {}, defaultdict(list)
+        for img in ProductImage.objects.filter(product_id__in=batch).order_by('-sort_order', '-id'):
+            images[img.product_id] = img  # last one written is the first by sort_order
+        for v in Variation.objects.filter(product_id__in=batch).order_by('name', 'id'):
+            variations[v.product_id].append(v)
+        cards = []
+        for p in Product.objects.filter(pk__in=batch).select_related('category'):
+            name, renditions, alt = '', {}, ''
+            if p.cover_image:
+                name, renditions = p.cover_image.name, p.cover_renditions
+            elif p.pk in images:
+                img = images[p.pk]
+                name, renditions, alt = img.image.name, img.renditions, img.alt_text
+            chips = variations[p.pk]
+            cards.append(ProductCard(
+                id=p.pk, slug=p.slug, name=p.name, brand=p.brand, category_id=p.category_id,
+                category_slug=p.category.slug, category_name=p.category.name, category_path=p.category.path,
+                price=p.price, mrp=p.mrp, in_stock=p.stock > 0, is_featured=p.is_featured, created_at=p.created_at,
+                thumbnail_url=default_storage.url(name) if name else '', thumbnail_alt=(alt or p.name) if name else '',
+                thumbnail_renditions=renditions if (renditions or {}).get('source') == name else {},
+                variations=[
+                    {'slug': v.slug, 'label': v.name or ' • '.join(x for x in (v.color, v.size) if x)}
+                    for v in chips[:CARD_VARIATION_LIMIT]
+                ],
+                variation_count=len(chips),
+            ))
+        ProductCard.objects.bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_image_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('slug', models.SlugField(max_length=220)),
+                ('name', models.CharField(max_length=180)),
+                ('brand', models.CharField(blank=True, max_length=120)),
+                ('category_slug', models.SlugField(max_length=220)),
+                ('category_name', models.CharField(max_length=120)),
+                ('category_path', models.CharField(db_index=True, max_length=255)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('mrp', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('in_stock', models.BooleanField(default=False)),
+                ('is_featured', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('thumbnail_url', models.CharField(blank=True, max_length=500)),
+                ('thumbnail_alt', models.CharField(blank=True, max_length=180)),
+                ('thumbnail_renditions', models.JSONField(blank=True, default=dict)),
+                ('variations', models.JSONField(blank=True, default=list)),
+                ('variation_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.category')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['-created_at', '-id'], name='card_newest_idx'), models.Index(fields=['price', 'id'], name='card_price_idx'), models.Index(fields=['-is_featured', '-created_at', '-id'], name='card_featured_idx'), models.Index(django.db.models.functions.text.Upper('brand'), models.F('price'), name='card_brand_idx'), models.Index(fields=['category', 'price'], name='card_category_price_idx')],
+            },
+        ),
+        migrations.RunPython(fill_cards, migrations.RunPython.noop),
+    ]
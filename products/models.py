@@ -1,22 +1,130 @@
-from django.db import models
+from collections import defaultdict
+from itertools import count
+from operator import attrgetter
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce, Concat, Substr, Upper
 from django.utils import timezone
 
+from .cache import bump_catalog_version
+
+SLUG_SAVE_ATTEMPTS = 3
+
+def _taken_slugs(qs, bases, slug_field_name, scope_field=None):
+    """
+    One query for every existing slug that is ``base`` or ``base-<anything>``.
+    Returns {scope value: set(slugs)} (scope value is None when unscoped).
+    """
+    cond = Q(**{f'{slug_field_name}__in': bases})
+    for base in bases:
+        cond |= Q(**{f'{slug_field_name}__startswith': f'{base}-'})
+    fields = [scope_field or 'pk', slug_field_name]
+    taken = defaultdict(set)
+    for scope, slug in qs.filter(cond).values_list(*fields):
+        taken[scope if scope_field else None].add(slug)
+    return taken
+
+def _next_free(base, taken):
+    if base not in taken:
+        return base
+    for num in count(1):
+        candidate = f"{base}-{num}"
+        if candidate not in taken:
+            return candidate
+
 def unique_slugify(instance, value, slug_field_name='slug', within_qs=None):
+    """Lowest free ``base`` / ``base-N`` slug, found with a single query."""
     base = slugify(value) or "item"
-    unique_slug = base
-    num = 1
     if within_qs is None:
-        ModelClass = instance.__class__
-        while ModelClass.objects.filter(**{slug_field_name: unique_slug}).exclude(pk=instance.pk).exists():
-            unique_slug = f"{base}-{num}"
-            num += 1
-        return unique_slug
-    while within_qs.filter(**{slug_field_name: unique_slug}).exclude(pk=instance.pk).exists():
-        unique_slug = f"{base}-{num}"
-        num += 1
-    return unique_slug
+        within_qs = instance.__class__.objects.all()
+    taken = _taken_slugs(within_qs.exclude(pk=instance.pk), [base], slug_field_name)
+    return _next_free(base, taken[None])
+
+def bulk_unique_slugify(instances, source=attrgetter('name'), slug_field_name='slug', scope_field=None, batch_size=200,
+                        transform=slugify):
+    """
+    Give every instance without a slug a unique one, using one query per
+    ``batch_size`` distinct bases instead of one per collision (each base is an
+    OR term; SQLite caps expression depth at 1000). ``scope_field``
+    makes slugs unique per value of that field (e.g. 'product_id' for
+    Variation), matching what the single-object save() does. With
+    ``transform=str`` it fills any unique text field the same way (e.g. sku).
+    """
+    pending = [obj for obj in instances if not getattr(obj, slug_field_name)]
+    if not pending:
+        return instances
+    model = pending[0].__class__
+    bases = {id(obj): transform(source(obj)) or "item" for obj in pending}
+    distinct = sorted(set(bases.values()))
+
+    taken = defaultdict(set)
+    for i in range(0, len(distinct), batch_size):
+        qs = model.objects.all()
+        if scope_field:
+            qs = qs.filter(**{f'{scope_field}__in': {getattr(obj, scope_field) for obj in pending}})
+        for scope, slugs in _taken_slugs(qs, distinct[i:i + batch_size], slug_field_name, scope_field).items():
+            taken[scope] |= slugs
+    # slugs already set on the other instances in this batch count as taken too
+    for obj in instances:
+        if getattr(obj, slug_field_name):
+            taken[getattr(obj, scope_field) if scope_field else None].add(getattr(obj, slug_field_name))
+
+    for obj in pending:
+        scope_taken = taken[getattr(obj, scope_field) if scope_field else None]
+        slug = _next_free(bases[id(obj)], scope_taken)
+        scope_taken.add(slug)
+        setattr(obj, slug_field_name, slug)
+    return instances
+
+def save_with_unique_slug(instance, save, allocate, *args, **kwargs):
+    """
+    Allocate a slug and save; if a concurrent insert grabbed the same slug
+    first (unique constraint), allocate again and retry.
+    """
+    error = None
+    for _ in range(SLUG_SAVE_ATTEMPTS):
+        slug = allocate()
+        if error is not None and slug == instance.slug:
+            raise error  # slug was still free, so the violation was something else (e.g. sku)
+        instance.slug = slug
+        try:
+            with transaction.atomic(using=kwargs.get('using')):
+                return save(*args, **kwargs)
+        except IntegrityError as exc:
+            error = exc
+    raise error
+
+CARD_VARIATION_LIMIT = 6  # chips shown per listing card
+
+class ProductQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Everything a listing card renders (projected into ProductCard by
+        products.cards), in a fixed number of queries per batch:
+        - category via JOIN
+        - first gallery image -> card_images (list, at most 1)
+        - first 6 variations -> card_variations (list)
+        - variation_count annotation for the "+N more" chip
+        """
+        variation_count = (
+            Variation.objects.filter(product=models.OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(n=models.Count('pk'))
+            .values('n')
+        )
+        return (
+            self.select_related('category')
+            .annotate(variation_count=Coalesce(models.Subquery(variation_count), 0))
+            .prefetch_related(
+                models.Prefetch('images', queryset=ProductImage.objects.order_by('sort_order', 'id')[:1], to_attr='card_images'),
+                models.Prefetch('variations', queryset=Variation.objects.order_by('name', 'id')[:CARD_VARIATION_LIMIT], to_attr='card_variations'),
+            )
+        )
 
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
@@ -24,15 +132,72 @@ class Category(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # Materialized path of ancestor ids incl. self, e.g. "/3/17/42/"; a subtree
+    # is path__startswith=<node path>, ancestors are parsed from the path.
+    path = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['name']
 
+    def clean(self):
+        if self.pk and self.parent_id and f"/{self.pk}/" in (self.parent.path or f"/{self.parent_id}/"):
+            raise ValidationError({'parent': "A category cannot be moved under itself or its own subcategory."})
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, self.name)
-        super().save(*args, **kwargs)
+        # one transaction, so a rejected reparent (cycle) rolls the save back too
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.slug:
+                super().save(*args, **kwargs)
+            else:
+                save_with_unique_slug(self, super().save, lambda: unique_slugify(self, self.name), *args, **kwargs)
+            self.update_path()
+
+    def update_path(self):
+        """
+        Recompute path/depth from the parent. On a reparent the whole subtree is
+        rewritten with a single UPDATE.
+        """
+        paths = dict(Category.objects.filter(pk__in=[self.pk, self.parent_id]).values_list('pk', 'path'))
+        old_path = paths.get(self.pk, '')
+        parent_path = paths.get(self.parent_id, '/') if self.parent_id else '/'
+        if f"/{self.pk}/" in parent_path:
+            raise ValueError(f"{self} cannot be moved under its own subcategory")
+        new_path = f"{parent_path}{self.pk}/"
+        if new_path == old_path:
+            return
+        new_depth = new_path.count('/') - 2
+        Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=models.F('depth') + (new_path.count('/') - old_path.count('/')),
+            )
+            # the listing filters product cards on their own copy of the path
+            ProductCard.objects.filter(category_path__startswith=old_path).update(
+                category_path=Concat(models.Value(new_path), Substr('category_path', len(old_path) + 1)),
+            )
+        self.path, self.depth = new_path, new_depth
+        bump_catalog_version()
+
+    @classmethod
+    def rebuild_paths(cls):
+        """Recompute every path in memory (after bulk_create or raw imports): 1 SELECT + bulk_update."""
+        rows = {pk: parent for pk, parent in cls.objects.values_list('pk', 'parent_id')}
+        paths = {}
+
+        def path_of(pk):
+            if pk not in paths:
+                parent = rows[pk]
+                paths[pk] = f"{path_of(parent) if parent else '/'}{pk}/"
+            return paths[pk]
+
+        objs = [cls(pk=pk, path=path_of(pk), depth=path_of(pk).count('/') - 2) for pk in rows]
+        cls.objects.bulk_update(objs, ['path', 'depth'], batch_size=1000)
+
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.strip('/').split('/')[:-1]] if self.path else []
 
     def __str__(self):
         return self.name
@@ -49,6 +214,7 @@ class Product(models.Model):
     short_description = models.CharField(max_length=240, blank=True)
     description = models.TextField(blank=True)
     cover_image = models.ImageField(upload_to='products/cover/', blank=True, null=True)
+    cover_renditions = models.JSONField(default=dict, blank=True, editable=False)  # see products.images
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     color = models.CharField(max_length=60, blank=True)
@@ -56,13 +222,15 @@ class Product(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, self.name)
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        save_with_unique_slug(self, super().save, lambda: unique_slugify(self, self.name), *args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.sku})"
@@ -74,8 +242,10 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/gallery/')
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # see products.images
     alt_text = models.CharField(max_length=160, blank=True)
     sort_order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['sort_order', 'id']
@@ -108,13 +278,15 @@ class Variation(models.Model):
         unique_together = (('product', 'slug'),)
         ordering = ['product', 'name']
 
+    def slug_source(self):
+        # Auto name if not given but color/size set
+        return self.name or " ".join(x for x in [self.color, self.size] if x).strip() or "variant"
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            qs = Variation.objects.filter(product=self.product)
-            # Auto name if not given but color/size set
-            base_name = self.name or " ".join(x for x in [self.color, self.size] if x).strip() or "variant"
-            self.slug = unique_slugify(self, base_name, within_qs=qs)
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        qs = Variation.objects.filter(product=self.product)
+        save_with_unique_slug(self, super().save, lambda: unique_slugify(self, self.slug_source(), within_qs=qs), *args, **kwargs)
 
     def __str__(self):
         return f"{self.product.name} — {self.name or (self.color + ' ' + self.size).strip()}"
@@ -122,11 +294,76 @@ class Variation(models.Model):
 class VariationImage(models.Model):
     variation = models.ForeignKey(Variation, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/variation/')
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # see products.images
     alt_text = models.CharField(max_length=160, blank=True)
     sort_order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['sort_order', 'id']
 
     def __str__(self):
         return f"Image for {self.variation}"
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "related products" for the detail page, filled by
+    manage.py build_related_products and kept current by signals
+    (see products.related). rank 0 is the best match.
+    """
+    product = models.ForeignKey(Product, related_name='related_entries', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class ProductCard(models.Model):
+    """
+    Denormalized listing card, one row per active product (id = product id):
+    everything a /shop/ card renders or filters on, so the listing and its
+    facets read this table alone. Built by products.cards, kept current by
+    signals; full rebuild: manage.py build_product_cards.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    slug = models.SlugField(max_length=220)
+    name = models.CharField(max_length=180)
+    brand = models.CharField(max_length=120, blank=True)
+    category = models.ForeignKey(Category, related_name='+', on_delete=models.CASCADE)
+    category_slug = models.SlugField(max_length=220)
+    category_name = models.CharField(max_length=120)
+    category_path = models.CharField(max_length=255, db_index=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    mrp = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    in_stock = models.BooleanField(default=False)
+    is_featured = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    thumbnail_url = models.CharField(max_length=500, blank=True)
+    thumbnail_alt = models.CharField(max_length=180, blank=True)
+    thumbnail_renditions = models.JSONField(default=dict, blank=True)
+    variations = models.JSONField(default=list, blank=True)  # first CARD_VARIATION_LIMIT as {slug, label}
+    variation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # one per KEYSET_ORDERINGS entry, so every sort is an index scan
+            models.Index(fields=['-created_at', '-id'], name='card_newest_idx'),
+            models.Index(fields=['price', 'id'], name='card_price_idx'),
+            models.Index(fields=['-is_featured', '-created_at', '-id'], name='card_featured_idx'),
+            # brand__iexact filter; price rides along for the price facet
+            models.Index(Upper('brand'), 'price', name='card_brand_idx'),
+            # category facet counts and price range per category
+            models.Index(fields=['category', 'price'], name='card_category_price_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,142 @@
+import base64
+import json
+from types import SimpleNamespace
+
+from django.db import connections
+from django.db.models import Q
+
+# sort param -> keyset ordering (always ends in a unique id tie-breaker)
+KEYSET_ORDERINGS = {
+    None: ('-created_at', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'featured': ('-is_featured', '-created_at', '-id'),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        return data['v'], data['d']
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+def approximate_count(qs):
+    """
+    Planner row estimate for qs (Postgres only). Returns None elsewhere, so
+    callers can simply hide the total instead of paying for COUNT(*).
+    """
+    connection = connections[qs.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = qs.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, approx_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approx_total = approx_total
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Cursor (seek) pagination: every page is "WHERE key < last_seen ORDER BY key
+    LIMIT n", so page 500 costs the same as page 1 and no COUNT(*) is run.
+    Cursors are opaque base64 tokens holding the boundary row's key values.
+    """
+
+    def __init__(self, queryset, per_page, ordering, with_total=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.with_total = with_total
+        model = queryset.model
+        self._fields = [model._meta.get_field(self._name(o)) for o in ordering]
+
+    @staticmethod
+    def _name(key):
+        return key.lstrip('-')
+
+    def _values(self, obj):
+        if isinstance(obj, dict):  # .values() rows; must include the ordering fields
+            obj = SimpleNamespace(**obj)
+        return [f.value_to_string(obj) for f in self._fields]
+
+    def _seek(self, values, forward):
+        """Row-value comparison (a, b) > (x, y) spelled as OR-ed Qs so mixed directions work."""
+        q = Q()
+        for i, key in enumerate(self.ordering):
+            descending = key.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            name = self._name(key)
+            term = Q(**{f'{name}__{lookup}': self._fields[i].to_python(values[i])})
+            for prev_key, prev_field, prev_value in zip(self.ordering[:i], self._fields, values):
+                term &= Q(**{self._name(prev_key): prev_field.to_python(prev_value)})
+            q |= term
+        return q
+
+    def get_page(self, cursor=None):
+        qs = self.queryset
+        forward = True
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                if len(values) != len(self.ordering):
+                    raise InvalidCursor(cursor)
+                forward = direction != 'p'
+                qs = qs.filter(self._seek(values, forward))
+            except (InvalidCursor, ValueError, TypeError):
+                cursor, forward, qs = None, True, self.queryset
+
+        if forward:
+            ordering = self.ordering
+        else:
+            ordering = [o[1:] if o.startswith('-') else f'-{o}' for o in self.ordering]
+        rows = list(qs.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor(self._values(rows[-1]), 'n')
+            if cursor and (forward or has_more):
+                previous_cursor = encode_cursor(self._values(rows[0]), 'p')
+
+        total = approximate_count(self.queryset) if self.with_total else None
+        return KeysetPage(rows, next_cursor, previous_cursor, total)
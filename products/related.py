@@ -0,0 +1,139 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Product, RelatedProduct
+
+RELATED_LIMIT = 8
+BLOCK_ROWS = 1000  # rows scored at once; bounds memory to BLOCK_ROWS x group size
+
+# score = weighted sum of these signals; price similarity is 1 / (1 + |ln(p1/p2)|)
+WEIGHTS = {'category': 3.0, 'sibling': 1.0, 'brand': 2.0, 'price': 2.0}
+
+# Product fields the score depends on; changing any of them triggers a refresh
+SCORED_FIELDS = ('price', 'category_id', 'brand', 'is_active')
+
+
+def group_key(path, category_id):
+    """Products are only compared within the same top-level category subtree."""
+    return int(path.strip('/').split('/')[0]) if path else category_id
+
+
+class Group:
+    """Feature vectors of every active product in one top-level subtree."""
+
+    def __init__(self, rows):
+        self.ids = np.array([r['id'] for r in rows], dtype=np.int64)
+        self.category = np.array([r['category_id'] for r in rows], dtype=np.int64)
+        self.parent = np.array([r['category__parent_id'] or -1 for r in rows], dtype=np.int64)
+        brands = [(r['brand'] or '').strip().lower() for r in rows]
+        _, codes = np.unique(brands, return_inverse=True)
+        self.brand = np.where([b != '' for b in brands], codes, -1)
+        self.log_price = np.log(np.maximum([float(r['price']) for r in rows], 0.01))
+        self.index = {pk: i for i, pk in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def load(cls, key):
+        qs = Product.objects.filter(is_active=True).filter(
+            Q(category__path__startswith=f"/{key}/") | Q(category_id=key, category__path='')
+        )
+        rows = list(qs.values('id', 'category_id', 'category__parent_id', 'brand', 'price'))
+        return cls(rows) if rows else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """len(rows) x len(group) score matrix; a product never relates to itself."""
+        rows = np.asarray(rows)
+        same_cat = self.category[rows, None] == self.category[None, :]
+        sibling = (self.parent[rows, None] == self.parent[None, :]) & (self.parent[rows, None] != -1)
+        brand = (self.brand[rows, None] == self.brand[None, :]) & (self.brand[rows, None] != -1)
+        price = 1.0 / (1.0 + np.abs(self.log_price[rows, None] - self.log_price[None, :]))
+        score = (WEIGHTS['category'] * same_cat + WEIGHTS['sibling'] * sibling
+                 + WEIGHTS['brand'] * brand + WEIGHTS['price'] * price)
+        score[np.arange(len(rows)), rows] = -np.inf
+        return score
+
+    def top(self, rows):
+        """{product_id: [(related_id, score), ...]} best first (ties by id)."""
+        rows = np.asarray(rows)
+        k = min(RELATED_LIMIT, len(self) - 1)
+        out = {}
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start:start + BLOCK_ROWS]
+            if k <= 0:
+                out.update({int(self.ids[r]): [] for r in block})
+                continue
+            score = self.scores(block)
+            best = np.argpartition(-score, k - 1, axis=1)[:, :k]
+            for i, r in enumerate(block):
+                cols = best[i]
+                s = score[i, cols]
+                order = np.lexsort((self.ids[cols], -s))
+                out[int(self.ids[r])] = [(int(self.ids[cols[o]]), float(s[o])) for o in order]
+        return out
+
+
+def _write(top):
+    RelatedProduct.objects.filter(product_id__in=list(top)).delete()
+    RelatedProduct.objects.bulk_create([
+        RelatedProduct(product_id=pk, related_id=rel, rank=rank, score=score)
+        for pk, entries in top.items()
+        for rank, (rel, score) in enumerate(entries)
+    ], batch_size=2000)
+
+
+def rebuild_all(stdout=None):
+    """Full rebuild, one top-level subtree at a time. Returns the number of products indexed."""
+    keys = {
+        group_key(path, cat)
+        for cat, path in Product.objects.filter(is_active=True)
+        .values_list('category_id', 'category__path').distinct()
+    }
+    total = 0
+    for key in sorted(keys):
+        group = Group.load(key)
+        with transaction.atomic():
+            _write(group.top(np.arange(len(group))))
+        total += len(group)
+        if stdout:
+            stdout.write(f"group {key}: {len(group)} products")
+    RelatedProduct.objects.exclude(product__is_active=True).delete()
+    return total
+
+
+def refresh_product(product, previous_group=None):
+    """
+    Incremental update after a scored field of ``product`` changed: recomputes
+    its own row and the rows that list it, in the group it left
+    (``previous_group``, if any) and the one it is in now. The work grows with
+    how many rows list it, not with the group; products that would now rank it
+    among their matches pick it up on the next build_related_products.
+    """
+    listed_by = list(RelatedProduct.objects.filter(related=product).values_list('product_id', flat=True))
+    current = group_key(product.category.path, product.category_id) if product.is_active else None
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product=product).delete()
+        for key in {previous_group, current} - {None}:
+            group = Group.load(key)
+            if group is None:
+                continue
+            rows = [group.index[pk] for pk in {product.pk, *listed_by} if pk in group.index]
+            if rows:
+                _write(group.top(rows))
+
+
+def refresh_rows(product_ids):
+    """Recompute the rows of these products (e.g. after one of their entries was deleted)."""
+    keys = {
+        group_key(path, cat)
+        for cat, path in Product.objects.filter(pk__in=product_ids, is_active=True)
+        .values_list('category_id', 'category__path')
+    }
+    with transaction.atomic():
+        for key in keys:
+            group = Group.load(key)
+            rows = [group.index[pk] for pk in product_ids if pk in group.index]
+            if rows:
+                _write(group.top(rows))
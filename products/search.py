@@ -0,0 +1,206 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# field -> weight; same columns the old icontains search looked at
+SEARCH_FIELDS = {'name': 3.0, 'brand': 2.0, 'short_description': 1.0}
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def _no_results(qs):
+    # still annotated, so callers can order_by('-relevance') unconditionally
+    return qs.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+class PostgresSearchBackend:
+    """
+    Full-text match on name/brand/short_description plus trigram similarity on
+    name (catches typos). Both are served by the GIN indexes from migration
+    0002; the document expression below must stay identical to the indexed one.
+    """
+    document = (
+        "to_tsvector('simple', coalesce({t}.\"name\", '') || ' ' || "
+        "coalesce({t}.\"brand\", '') || ' ' || "
+        "coalesce({t}.\"short_description\", ''))"
+    )
+    match_sql = "({document} @@ websearch_to_tsquery('simple', %s) OR {t}.\"name\" %% %s)"
+    rank_sql = "ts_rank({document}, websearch_to_tsquery('simple', %s)) + similarity({t}.\"name\", %s)"
+
+    def _sql(self, template, table):
+        return template.format(document=self.document.format(t=table), t=table)
+
+    def search(self, qs, query):
+        table = '"products_product"'
+        match = RawSQL(self._sql(self.match_sql, table), [query, query], output_field=BooleanField())
+        rank = RawSQL(self._sql(self.rank_sql, table), [query, query], output_field=FloatField())
+        return qs.filter(match).annotate(relevance=rank)
+
+    def search_cards(self, qs, query):
+        """
+        search() for ProductCard rows. The documents live on products_product,
+        so match and rank are hand-written subqueries on it (Django would
+        re-alias a queryset subquery, breaking the raw column references).
+        """
+        card_id = '"products_productcard"."id"'
+        match = RawSQL(
+            f"{card_id} IN (SELECT p.id FROM products_product p WHERE p.is_active AND {self._sql(self.match_sql, 'p')})",
+            [query, query], output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"(SELECT {self._sql(self.rank_sql, 'p')} FROM products_product p WHERE p.id = {card_id})",
+            [query, query], output_field=FloatField(),
+        )
+        return qs.filter(match).annotate(relevance=rank)
+
+    # the database keeps its own indexes current
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, pk):
+        pass
+
+    def reset(self):
+        pass
+
+
+class InMemorySearchBackend:
+    """
+    Per-process inverted index (token -> {product_id: weight}) over active
+    products, built lazily on first search and kept current from Product
+    save/delete signals. Used where there is no Postgres (dev, tests).
+    Queries are AND-ed token matches; a token also matches indexed words it
+    is a prefix of, at half weight. Only the best SEARCH_MAX_RESULTS matches
+    are returned (0: all of them); every row is annotated with
+    ``search_matches``, how many products matched, so callers can tell.
+    """
+    max_prefix_expansions = 50
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = None
+            self._doc_tokens = {}
+            self._sorted_tokens = None
+
+    def rebuild(self):
+        from .models import Product
+
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._doc_tokens = {}
+            self._sorted_tokens = None
+            rows = Product.objects.filter(is_active=True).values('id', *SEARCH_FIELDS)
+            for row in rows.iterator(chunk_size=2000):
+                self._add(row['id'], row)
+
+    def _add(self, pk, values):
+        tokens = set()
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(values[field]):
+                posting = self._postings[token]
+                posting[pk] = posting.get(pk, 0) + weight
+                tokens.add(token)
+        self._doc_tokens[pk] = tokens
+        self._sorted_tokens = None
+
+    def remove_product(self, pk):
+        with self._lock:
+            if self._postings is None:
+                return
+            for token in self._doc_tokens.pop(pk, ()):
+                posting = self._postings[token]
+                posting.pop(pk, None)
+                if not posting:
+                    del self._postings[token]
+            self._sorted_tokens = None
+
+    def index_product(self, product):
+        with self._lock:
+            if self._postings is None:
+                return  # not built yet; first search reads fresh rows
+            self.remove_product(product.pk)
+            if product.is_active:
+                self._add(product.pk, {f: getattr(product, f) for f in SEARCH_FIELDS})
+
+    def _lookup(self, term):
+        hits = dict(self._postings.get(term, {}))
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        i = bisect_left(self._sorted_tokens, term)
+        for token in self._sorted_tokens[i:i + self.max_prefix_expansions]:
+            if not token.startswith(term):
+                break
+            if token == term:
+                continue
+            for pk, weight in self._postings[token].items():
+                hits[pk] = max(hits.get(pk, 0), weight / 2)
+        return hits
+
+    def search(self, qs, query):
+        terms = tokenize(query)
+        if not terms:
+            return _no_results(qs)
+        with self._lock:
+            if self._postings is None:
+                self.rebuild()
+            scores = None
+            for term in terms:
+                hits = self._lookup(term)
+                if scores is None:
+                    scores = hits
+                else:
+                    scores = {pk: s + hits[pk] for pk, s in scores.items() if pk in hits}
+                if not scores:
+                    return _no_results(qs)
+        # the ids and scores go into the SQL, so their number is bounded
+        limit = settings.SEARCH_MAX_RESULTS
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1)) if limit else list(scores.items())
+        relevance = Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in top],
+            default=Value(0.0), output_field=FloatField(),
+        )
+        return qs.filter(pk__in=[pk for pk, _ in top]).annotate(
+            relevance=relevance, search_matches=Value(len(scores), output_field=IntegerField()),
+        )
+
+    # scores are keyed by product id, which is also the ProductCard primary key
+    search_cards = search
+
+
+_backend = None
+_backend_path = None
+
+
+def get_search_backend():
+    """
+    PRODUCT_SEARCH_BACKEND (dotted path) if set, else Postgres full-text when
+    the default database is Postgres, else the in-process index.
+    """
+    global _backend, _backend_path
+    path = settings.PRODUCT_SEARCH_BACKEND
+    if not path:
+        if connections['default'].vendor == 'postgresql':
+            path = 'products.search.PostgresSearchBackend'
+        else:
+            path = 'products.search.InMemorySearchBackend'
+    if _backend is None or _backend_path != path:
+        _backend = import_string(path)()
+        _backend_path = path
+    return _backend
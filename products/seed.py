@@ -0,0 +1,97 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import suggest
+from .cache import bump_catalog_version
+from .cards import refresh_cards
+from .models import Category, Product, ProductImage, Variation, bulk_unique_slugify
+from .search import get_search_backend
+
+# named presets for seed_catalog --scale
+SCALES = {
+    '1k': {'products': 1_000, 'depth': 3, 'fanout': 4, 'variations': 4, 'images': 2},
+    '50k': {'products': 50_000, 'depth': 4, 'fanout': 5, 'variations': 6, 'images': 3},
+    '500k': {'products': 500_000, 'depth': 5, 'fanout': 6, 'variations': 8, 'images': 3},
+}
+
+WORDS = ['Road', 'Trail', 'City', 'Gravel', 'Aero', 'Carbon', 'Alloy', 'Sport', 'Pro', 'Lite',
+         'Comfort', 'Speed', 'Touring', 'Urban', 'Race', 'Junior', 'Classic', 'Electric']
+KINDS = ['Bike', 'Helmet', 'Jersey', 'Glove', 'Light', 'Lock', 'Pump', 'Saddle', 'Tyre', 'Bottle']
+COLORS = ['Black', 'White', 'Red', 'Blue', 'Green', 'Yellow', 'Orange', 'Grey']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', '26in', '27.5in', '29in']
+
+
+def _batches(n, size):
+    for start in range(0, n, size):
+        yield start, min(size, n - start)
+
+
+def seed_catalog(products=1_000, depth=3, fanout=4, variations=4, images=2, brands=200,
+                 seed=42, prefix='SEED', batch_size=5_000, stdout=None):
+    """
+    Fill the catalog with reproducible synthetic data: a ``depth``-level category
+    tree with ``fanout`` children per node, ``products`` products spread over
+    the leaf categories, up to ``variations`` variations and ``images`` gallery
+    rows (paths only, no files) each. Uses bulk inserts throughout, so signals
+    don't fire; listing cards are built per batch, caches and the search index
+    are invalidated once at the end.
+    """
+    rng = random.Random(seed)
+    log = stdout.write if stdout else (lambda msg: None)
+
+    parents = [None]
+    for level in range(depth):
+        objs = [
+            Category(name=f"{prefix} {rng.choice(WORDS)} {level}-{i}-{j}", parent_id=parent)
+            for i, parent in enumerate(parents) for j in range(fanout)
+        ]
+        bulk_unique_slugify(objs)
+        Category.objects.bulk_create(objs, batch_size=batch_size)
+        parents = [c.pk for c in objs]
+    Category.rebuild_paths()
+    leaves = parents
+    log(f"categories: {sum(fanout ** (d + 1) for d in range(depth))} ({len(leaves)} leaves)")
+
+    brand_names = [f"{rng.choice(WORDS)}{rng.choice(KINDS)} {i}" for i in range(brands)]
+    now = timezone.now()
+    for start, size in _batches(products, batch_size):
+        with transaction.atomic():
+            batch = []
+            for n in range(start, start + size):
+                price = Decimal(round(rng.lognormvariate(7, 1), 2)).quantize(Decimal('0.01'))
+                batch.append(Product(
+                    name=f"{rng.choice(WORDS)} {rng.choice(KINDS)} {n}",
+                    sku=f"{prefix}-{n:07d}",
+                    category_id=rng.choice(leaves),
+                    brand=rng.choice(brand_names),
+                    price=price,
+                    mrp=(price * Decimal('1.2')).quantize(Decimal('0.01')) if rng.random() < 0.5 else None,
+                    stock=0 if rng.random() < 0.1 else rng.randint(1, 200),
+                    short_description=f"{rng.choice(WORDS)} {rng.choice(WORDS).lower()} {rng.choice(KINDS).lower()}",
+                    is_featured=rng.random() < 0.05,
+                    created_at=now - timedelta(minutes=rng.randint(0, 525_600)),
+                ))
+            bulk_unique_slugify(batch)
+            Product.objects.bulk_create(batch)
+
+            var_objs, img_objs = [], []
+            for p in batch:
+                for j in range(rng.randint(0, variations)):
+                    color, size_ = rng.choice(COLORS), rng.choice(SIZES)
+                    var_objs.append(Variation(product_id=p.pk, name=f"{color} / {size_}", sku=f"{p.sku}-{j}",
+                                              color=color, size=size_))
+                for j in range(rng.randint(0, images)):
+                    img_objs.append(ProductImage(product_id=p.pk, image=f"seed/gallery/{p.sku}-{j}.jpg", sort_order=j))
+            bulk_unique_slugify(var_objs, source=Variation.slug_source, scope_field='product_id')
+            Variation.objects.bulk_create(var_objs, batch_size=batch_size)
+            ProductImage.objects.bulk_create(img_objs, batch_size=batch_size)
+            refresh_cards([p.pk for p in batch])
+        log(f"products: {start + size}/{products}")
+
+    bump_catalog_version()
+    get_search_backend().reset()
+    suggest.invalidate()
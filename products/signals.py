@@ -0,0 +1,203 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, bump_product_version
+from .cards import refresh_cards
+from .images import IMAGE_FIELDS, safe_generate
+from .models import Category, Product, ProductCard, ProductImage, RelatedProduct, Variation, VariationImage
+from .search import get_search_backend
+
+# related, attributes and suggest (numpy) are imported by the receivers using
+# them, so loading the app - every management command, every worker boot -
+# doesn't import numpy before something needs it
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+# listing cards show variation chips and the first image; color/size facets read variations
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+def _owning_product(instance):
+    try:
+        if isinstance(instance, VariationImage):
+            return instance.variation.product
+        return instance.product
+    except ObjectDoesNotExist:
+        return None  # parent already gone; its own delete bumped the catalog
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=VariationImage)
+@receiver(post_delete, sender=VariationImage)
+def product_page_changed(sender, instance, **kwargs):
+    product = _owning_product(instance)
+    if product is not None:
+        bump_product_version(product.slug)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_card_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_cards([instance.pk])
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_card_child_changed(sender, instance, raw=False, **kwargs):
+    # chips and thumbnail; variation images never show on a card
+    if not raw:
+        refresh_cards([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def category_card_fields_changed(sender, instance, raw=False, **kwargs):
+    # a move is handled by Category.update_path, which rewrites category_path
+    if not raw:
+        ProductCard.objects.filter(category=instance).exclude(
+            Q(category_slug=instance.slug) & Q(category_name=instance.name)
+        ).update(category_slug=instance.slug, category_name=instance.name)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=VariationImage)
+def mark_new_upload(sender, instance, **kwargs):
+    # an uncommitted FieldFile means a file is being uploaded with this save
+    field = getattr(instance, IMAGE_FIELDS[sender._meta.label][0])
+    instance._derivatives_pending = bool(field) and not field._committed
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=VariationImage)
+def generate_derivatives_on_upload(sender, instance, created, raw=False, **kwargs):
+    if raw or not getattr(instance, '_derivatives_pending', False) or not settings.IMAGE_DERIVATIVES_ON_SAVE:
+        return
+    instance._derivatives_pending = False
+    field_name, meta_field = IMAGE_FIELDS[sender._meta.label]
+    meta = safe_generate(getattr(instance, field_name).name)
+    if meta is None:
+        return
+    setattr(instance, meta_field, meta)
+    sender.objects.filter(pk=instance.pk).update(**{meta_field: meta})
+    # pages rendered before the renditions existed must not stay cached
+    if isinstance(instance, Product):
+        bump_catalog_version()
+        refresh_cards([instance.pk])
+    else:
+        product_page_changed(sender, instance)
+        if isinstance(instance, ProductImage):
+            refresh_cards([instance.product_id])
+
+
+
+@receiver(pre_save, sender=Product)
+def remember_scored_fields(sender, instance, raw=False, **kwargs):
+    from .related import SCORED_FIELDS
+
+    instance._scored_before = None
+    if raw or instance._state.adding or not settings.RELATED_PRODUCTS_INCREMENTAL:
+        return
+    instance._scored_before = (
+        Product.objects.filter(pk=instance.pk).values(*SCORED_FIELDS, 'category__path').first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def refresh_related_products(sender, instance, created, raw=False, **kwargs):
+    from .related import SCORED_FIELDS, group_key, refresh_product
+
+    if raw or not settings.RELATED_PRODUCTS_INCREMENTAL:
+        return
+    before = getattr(instance, '_scored_before', None)
+    if not created and before is not None and all(before[f] == getattr(instance, f) for f in SCORED_FIELDS):
+        return
+    previous = group_key(before['category__path'], before['category_id']) if before else None
+    refresh_product(instance, previous)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_related_listers(sender, instance, **kwargs):
+    instance._related_listers = list(
+        RelatedProduct.objects.filter(related=instance).values_list('product_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def backfill_related_after_delete(sender, instance, **kwargs):
+    from .related import refresh_rows
+
+    listers = getattr(instance, '_related_listers', [])
+    if listers and settings.RELATED_PRODUCTS_INCREMENTAL:
+        refresh_rows(listers)
+
+
+@receiver(post_save, sender=Product)
+def suggest_product_saved(sender, instance, raw=False, **kwargs):
+    from . import suggest
+
+    if not raw:
+        suggest.product_changed(instance)
+
+
+@receiver(post_delete, sender=Product)
+def suggest_product_deleted(sender, instance, **kwargs):
+    from . import suggest
+
+    suggest.product_removed(instance.pk)
+
+
+@receiver(post_save, sender=Variation)
+def suggest_variation_saved(sender, instance, raw=False, **kwargs):
+    from . import suggest
+
+    if not raw:
+        suggest.skus_added(instance.sku)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def suggest_categories_changed(sender, raw=False, **kwargs):
+    from . import suggest
+
+    if not raw:
+        suggest.categories_changed()
+
+
+# registered last, so its on-commit patch is queued after catalog_changed's version bump
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def refresh_attribute_index(sender, instance, raw=False, **kwargs):
+    from . import attributes
+
+    if not raw:
+        attributes.refresh_product(instance.pk if sender is Product else instance.product_id)
@@ -0,0 +1,432 @@
+"""
+Search-as-you-type suggestions from a per-process prefix index: product
+names, brands, category names and exact SKU hits for what has been typed
+so far, without a database query per keystroke.
+
+Product names are tokenized like the search index; every token is a key
+in one sorted vocabulary, and each token's postings (product positions)
+sit in one flat array ordered by token, so all tokens starting with a
+prefix are a single contiguous slice found with two bisects. Positions
+are assigned in rank order (featured, then in stock, then by name), so
+the best matches for a prefix are simply its smallest positions. Names
+and slugs are kept as UTF-8 blobs with offsets and SKUs as 64-bit hashes,
+which keeps 500k products in tens of megabytes rather than hundreds.
+
+Writes in this process are applied from signals as a small overlay (the
+stale base entries hidden, the new values scanned linearly); once the
+overlay grows past OVERLAY_LIMIT, or the index is older than
+SUGGEST_MAX_AGE (to pick up other processes' writes), a background
+thread rebuilds it while the old one keeps answering.
+"""
+import hashlib
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.urls import get_script_prefix, get_urlconf
+from django.utils.http import urlencode
+
+from .feeds import url_pattern
+from .models import Category, Product, Variation
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+MIN_SKU_LENGTH = 3
+SMALL_SLICE = 4096  # postings deduplicated per keystroke; bigger prefixes go through the memo
+MEMO_SIZE = 512  # best-ranked positions of big prefixes ('b', 'ro', ...)
+OVERLAY_LIMIT = 500  # products changed since the build before a rebuild is started
+_LAST = '\U0010ffff'  # sorts after any text, so (prefix, prefix + _LAST) spans a prefix
+
+FEATURED, IN_STOCK = 1, 2
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def _sku_hash(sku):
+    return int.from_bytes(hashlib.blake2b(sku.strip().upper().encode(), digest_size=8).digest(), 'little')
+
+
+def _rank(flags, name):
+    """Sort key: featured first, then in stock, then alphabetical."""
+    return (not flags & FEATURED, not flags & IN_STOCK, name.lower())
+
+
+def _brand_label(brand):
+    label = brand.strip()
+    return label, urlencode({'brand': label})
+
+
+def _matches_all(name, terms):
+    tokens = tokenize(name)
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus offsets, instead of one str object each."""
+
+    def __init__(self, strings):
+        encoded = [s.encode() for s in strings]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=self.offsets[1:])
+        self.blob = b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode()
+
+    @property
+    def nbytes(self):
+        return len(self.blob) + self.offsets.nbytes
+
+
+class PhraseIndex:
+    """
+    Small vocabularies (brands, category names): every word-start suffix of
+    each phrase is a sorted key, so "enf" finds "Royal Enfield".
+    """
+
+    def __init__(self, items):
+        """items: (key, label, weight) with key a normalized phrase; duplicate keys are merged."""
+        self.items = {}
+        for key, label, weight in items:
+            _, _, old = self.items.get(key, (None, None, 0))
+            self.items[key] = (key, label, old + weight)
+        entries = []
+        for key in self.items:
+            words = key.split()
+            entries += [(' '.join(words[i:]), key) for i in range(len(words))]
+        entries.sort()
+        self.keys = [k for k, _ in entries]
+        self.targets = [t for _, t in entries]
+
+    def lookup(self, prefix, limit):
+        lo, hi = bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + _LAST)
+        found = {self.targets[i] for i in range(lo, hi)}
+        best = sorted((self.items[k] for k in found), key=lambda item: (-item[2], item[0]))
+        return best[:limit]
+
+
+class SuggestIndex:
+    def __init__(self, products, categories, skus):
+        """
+        products: (id, name, slug, brand, is_featured, in_stock) rows;
+        categories: (slug, name) of active categories; skus: every active
+        product's and variation's SKU.
+        """
+        self.built_at = time.monotonic()
+        rows = sorted(products, key=lambda r: _rank(FEATURED * r[4] | IN_STOCK * r[5], r[1]) + (r[0],))
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        self.flags = np.fromiter((FEATURED * r[4] | IN_STOCK * r[5] for r in rows), dtype=np.uint8, count=len(rows))
+        self.names = StringTable(r[1] for r in rows)
+        self.slugs = StringTable(r[2] for r in rows)
+
+        # (token id, position) pairs -> postings grouped by token in vocabulary order
+        vocab, token_ids, positions = {}, [], []
+        for position, row in enumerate(rows):
+            for token in set(tokenize(row[1])):
+                token_ids.append(vocab.setdefault(token, len(vocab)))
+                positions.append(position)
+        self.vocab = sorted(vocab)
+        order_of = np.empty(len(vocab), dtype=np.int32)
+        order_of[[vocab[t] for t in self.vocab]] = np.arange(len(vocab), dtype=np.int32)
+        token_order = order_of[np.asarray(token_ids, dtype=np.int32)] if token_ids else np.empty(0, np.int32)
+        by_token = np.argsort(token_order, kind='stable')  # positions stay ascending within a token
+        self.postings = np.asarray(positions, dtype=np.int32)[by_token]
+        self.offsets = np.searchsorted(token_order[by_token], np.arange(len(vocab) + 1))
+
+        brands = {}  # normalized -> [as first spelled, product count]
+        for row in rows:
+            key = normalize(row[3])
+            if key:
+                brands.setdefault(key, [row[3], 0])[1] += 1
+        self.brands = PhraseIndex((key, _brand_label(brand), count) for key, (brand, count) in brands.items())
+        self.set_categories(categories)
+        self.skus = np.unique(np.fromiter((_sku_hash(s) for s in skus), dtype=np.uint64))
+
+        self.hidden = set()  # product ids whose base entry is out of date
+        self.overlay = {}  # product id -> (rank, name, slug) written since the build
+        self.extra_skus = set()
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Three queries, streamed."""
+        products = Product.objects.filter(is_active=True).order_by().values_list(
+            'id', 'name', 'slug', 'brand', 'is_featured', Q(stock__gt=0),
+        )
+        categories = Category.objects.filter(is_active=True).values_list('slug', 'name')
+        skus = Product.objects.filter(is_active=True).order_by().values_list('sku', flat=True).union(
+            Variation.objects.filter(product__is_active=True).order_by().values_list('sku', flat=True), all=True,
+        )
+        return cls(products.iterator(chunk_size=5000), list(categories), skus.iterator(chunk_size=5000))
+
+    def set_categories(self, categories):
+        self.categories = PhraseIndex((normalize(name), (name, slug), 1) for slug, name in categories)
+
+    @property
+    def nbytes(self):
+        """Approximate footprint of the product part (the bulk of it at scale)."""
+        arrays = (self.ids, self.flags, self.postings, self.offsets, self.skus)
+        vocab = sum(len(t) + 49 for t in self.vocab) + 8 * len(self.vocab)
+        return sum(a.nbytes for a in arrays) + self.names.nbytes + self.slugs.nbytes + vocab
+
+    @property
+    def changes(self):
+        return len(self.hidden)
+
+    # ---------------- writes (signals) ----------------
+
+    def update_product(self, pk, name, slug, brand, is_featured, in_stock, is_active, skus=()):
+        with self._lock:
+            self.hidden.add(pk)
+            self.overlay.pop(pk, None)
+            if is_active:
+                flags = FEATURED * is_featured | IN_STOCK * in_stock
+                self.overlay[pk] = (_rank(flags, name), name, slug)
+                key = normalize(brand)
+                if key and key not in self.brands.items:
+                    self.brands = PhraseIndex([*self.brands.items.values(), (key, _brand_label(brand), 1)])
+            self.extra_skus.update(_sku_hash(s) for s in skus)
+
+    def remove_product(self, pk):
+        with self._lock:
+            self.hidden.add(pk)
+            self.overlay.pop(pk, None)
+
+    def add_skus(self, skus):
+        with self._lock:
+            self.extra_skus.update(_sku_hash(s) for s in skus)
+
+    # ---------------- reads ----------------
+
+    def _slice(self, term):
+        lo, hi = bisect_left(self.vocab, term), bisect_left(self.vocab, term + _LAST)
+        return self.offsets[lo], self.offsets[hi]
+
+    def _width(self, term):
+        start, end = self._slice(term)
+        return end - start
+
+    def _mask(self, term):
+        """Boolean per position: has a token starting with ``term``. Linear, unlike sorting a big slice."""
+        start, end = self._slice(term)
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[self.postings[start:end]] = True
+        return mask
+
+    def _positions(self, term):
+        """
+        Ascending unique positions of products with a token starting with
+        ``term``; for big prefixes only the best-ranked SMALL_SLICE of them.
+        """
+        start, end = self._slice(term)
+        if end - start <= SMALL_SLICE:
+            return np.unique(self.postings[start:end])
+        with self._lock:
+            best = self._memo.get(term)
+            if best is not None:
+                self._memo.move_to_end(term)
+                return best
+        best = np.flatnonzero(self._mask(term))[:SMALL_SLICE]
+        with self._lock:
+            self._memo[term] = best
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return best
+
+    def products(self, terms, limit):
+        """[(name, slug)] of the best-ranked products with a token starting with every term."""
+        if len(terms) == 1:
+            # hidden entries are at most OVERLAY_LIMIT, so SMALL_SLICE always leaves ``limit`` to show
+            candidates = self._positions(terms[0])
+        else:
+            by_width = sorted(terms, key=self._width)
+            start, end = self._slice(by_width[0])
+            if end - start <= SMALL_SLICE:
+                candidates = np.unique(self.postings[start:end])
+            else:
+                candidates = np.flatnonzero(self._mask(by_width[0]))
+            for term in by_width[1:]:
+                if not len(candidates):
+                    break
+                candidates = candidates[self._mask(term)[candidates]]
+        found = []
+        for position in candidates:
+            if int(self.ids[position]) in self.hidden:
+                continue
+            name = self.names[position]
+            found.append((_rank(int(self.flags[position]), name), name, self.slugs[position]))
+            if len(found) == limit:
+                break
+        found += [entry for entry in self.overlay.values() if _matches_all(entry[1], terms)]
+        return [(name, slug) for _, name, slug in sorted(found)[:limit]]
+
+    def has_sku(self, sku):
+        h = _sku_hash(sku)
+        i = np.searchsorted(self.skus, np.uint64(h))
+        return (i < len(self.skus) and int(self.skus[i]) == h) or h in self.extra_skus
+
+
+# ---------------- the process's index ----------------
+
+_state = {'index': None, 'building': False, 'log': None}
+_lock = threading.RLock()
+
+
+def _replay(index, log):
+    for method, args in log:
+        getattr(index, method)(*args)
+
+
+def _rebuild_in_background():
+    try:
+        index = SuggestIndex.load()
+    except Exception:
+        logger.exception("Rebuilding the suggestion index failed")
+        index = None
+    finally:
+        connections.close_all()  # this thread's own connections
+    with _lock:
+        if index is not None:
+            _replay(index, _state['log'])
+            _state['index'] = index
+        _state['building'], _state['log'] = False, None
+
+
+def _maybe_refresh(index):
+    max_age = settings.SUGGEST_MAX_AGE
+    age = time.monotonic() - index.built_at
+    stale = index.changes > OVERLAY_LIMIT or age == float('inf') or (max_age and age > max_age)
+    if stale and not _state['building']:
+        _state['building'], _state['log'] = True, []
+        threading.Thread(target=_rebuild_in_background, name='suggest-rebuild', daemon=True).start()
+
+
+def get_suggest_index():
+    """This process's index, built on first use; a stale one is replaced in the background."""
+    index = _state['index']
+    if index is None:
+        with _lock:
+            index = _state['index']
+            if index is None:
+                index = _state['index'] = SuggestIndex.load()
+    with _lock:
+        _maybe_refresh(index)
+    return index
+
+
+def rebuild():
+    """Build synchronously and swap in (warm-up, bulk writes)."""
+    index = SuggestIndex.load()
+    with _lock:
+        _state['index'] = index
+    return index
+
+
+def reset():
+    """Drop the index; the next keystroke rebuilds it."""
+    with _lock:
+        _state['index'] = None
+
+
+def invalidate():
+    """For bulk writes that skip signals: the next keystroke starts a background rebuild."""
+    with _lock:
+        if _state['index'] is not None:
+            _state['index'].built_at = float('-inf')
+
+
+def _apply(method, *args):
+    # signal hook: patch the live index, and remember it for a rebuild in flight
+    with _lock:
+        if _state['index'] is not None:
+            getattr(_state['index'], method)(*args)
+        if _state['log'] is not None:
+            _state['log'].append((method, args))
+
+
+def product_changed(product):
+    _apply('update_product', product.pk, product.name, product.slug, product.brand, product.is_featured,
+           product.stock > 0, product.is_active, (product.sku,))
+
+
+def product_removed(pk):
+    _apply('remove_product', pk)
+
+
+def skus_added(*skus):
+    _apply('add_skus', skus)
+
+
+def categories_changed():
+    with _lock:
+        index = _state['index']
+        if index is not None:
+            index.set_categories(Category.objects.filter(is_active=True).values_list('slug', 'name'))
+
+
+# ---------------- the response ----------------
+
+@lru_cache(maxsize=8)
+def _urls(urlconf, script_prefix):
+    return (
+        url_pattern('products:product_list', 0),
+        url_pattern('products:product_detail', 1),
+        url_pattern('products:product_detail_variation', 2),
+    )
+
+
+def suggestions(query, limit=DEFAULT_LIMIT):
+    """{'products', 'brands', 'categories', 'skus'} for a typed prefix; each a list of {'name', 'url', ...}."""
+    terms = tokenize(query)
+    out = {'products': [], 'brands': [], 'categories': [], 'skus': []}
+    if not terms:
+        return out
+    index = get_suggest_index()
+    shop, product_url, _ = _urls(get_urlconf(), get_script_prefix())
+    phrase = ' '.join(terms)
+
+    out['products'] = [{'name': name, 'url': product_url.format(slug)} for name, slug in index.products(terms, limit)]
+    out['brands'] = [
+        {'name': label, 'count': count, 'url': f"{shop}?{query_string}"}
+        for _, (label, query_string), count in index.brands.lookup(phrase, limit)
+    ]
+    out['categories'] = [
+        {'name': name, 'url': f"{shop}?category={slug}"}
+        for _, (name, slug), _ in index.categories.lookup(phrase, limit)
+    ]
+    sku = query.strip()
+    if len(sku) >= MIN_SKU_LENGTH and ' ' not in sku and index.has_sku(sku):
+        out['skus'] = _sku_hits(sku)
+    return out
+
+
+def _sku_hits(sku):
+    """The hash matched: one indexed query per table resolves it (and drops the rare false positive)."""
+    wanted = {sku, sku.upper(), sku.lower()}
+    _, product_url, variation_url = _urls(get_urlconf(), get_script_prefix())
+    hits = [
+        {'sku': s, 'name': name, 'url': product_url.format(slug)}
+        for s, name, slug in Product.objects.filter(sku__in=wanted, is_active=True).values_list('sku', 'name', 'slug')
+    ]
+    hits += [
+        {'sku': s, 'name': f"{name} - {label}" if label else name, 'url': variation_url.format(slug, v_slug)}
+        for s, name, label, slug, v_slug in Variation.objects.filter(sku__in=wanted, product__is_active=True)
+        .values_list('sku', 'product__name', 'name', 'product__slug', 'slug')
+    ]
+    return hits
@@ -0,0 +1,53 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from products.images import FORMATS, derivative_name, rendition_width, scaled_height
+
+register = template.Library()
+
+DEFAULT_SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 768px) 300px, 50vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+    'zoom': '100vw',
+}
+
+
+def _srcset(meta, fmt):
+    return ', '.join(
+        f"{default_storage.url(derivative_name(meta['source'], w, fmt))} {w}w" for w in meta['widths']
+    )
+
+
+@register.simple_tag
+def responsive_image(image, renditions, rendition='card', alt='', css_class='', sizes=None, loading='lazy'):
+    """
+    <picture> with WebP + JPEG srcsets and explicit width/height for an image
+    field and its renditions metadata (see products.images). Falls back to a
+    plain <img> of the original when no renditions exist for the current file.
+    ``image`` may also be an already resolved URL (ProductCard.thumbnail_url),
+    whose renditions were matched to the file when the card was built.
+
+        {% responsive_image p.cover_image p.cover_renditions 'card' alt=p.name css_class='card-img-top' %}
+    """
+    if not image:
+        return ''
+    meta = renditions or {}
+    resolved = isinstance(image, str)
+    if not meta.get('source') or (not resolved and meta['source'] != image.name):
+        url = image if resolved else image.url
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">', url, alt, css_class, loading)
+
+    width = rendition_width(meta, rendition)
+    sizes = sizes or DEFAULT_SIZES[rendition]
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((fmt, _srcset(meta, fmt), sizes) for fmt in FORMATS if fmt != 'jpeg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="{}"></picture>',
+        sources,
+        default_storage.url(derivative_name(meta['source'], width, 'jpeg')),
+        _srcset(meta, 'jpeg'), sizes, width, scaled_height(meta, width), alt, css_class, loading,
+    )
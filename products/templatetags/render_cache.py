@@ -0,0 +1,47 @@
+import threading
+
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+class InvariantNode(template.Node):
+    """
+    Renders its body once and replays the HTML on every later render. The
+    node lives in the compiled template, so the cached loader keeps it for
+    the life of the process and a template edit (which recompiles) starts
+    over. The body gets an empty context: per-request values inside it come
+    out blank rather than leaking one visitor's page into another's.
+    """
+
+    def __init__(self, name, nodelist):
+        self.name = name
+        self.nodelist = nodelist
+        self.html = None
+        self.lock = threading.Lock()
+
+    def render(self, context):
+        if not settings.LAYOUT_RENDER_CACHE:
+            return self.nodelist.render(context.new())
+        if self.html is None:
+            with self.lock:
+                if self.html is None:
+                    self.html = mark_safe(self.nodelist.render(context.new()))
+        return self.html
+
+
+@register.tag
+def invariant(parser, token):
+    """
+    Layout that is the same for every page and visitor (menus, footer):
+
+        {% invariant "footer" %} ... only static markup and {% static %} ... {% endinvariant %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes one argument, a name for the fragment")
+    nodelist = parser.parse(('endinvariant',))
+    parser.delete_first_token()
+    return InvariantNode(bits[1].strip('"\''), nodelist)
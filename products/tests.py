@@ -1,3 +1,1686 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, HttpResponse, QueryDict
+from django.template import Context, Template
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from quesec import db_router, snapshots
+from quesec.media_storage import MemoizedFileSystemStorage
+from quesec.static_pipeline import CompressedManifestStaticFilesStorage, StaticFilesMiddleware
+
+from .models import (
+    Category, Product, ProductCard, ProductImage, RelatedProduct, Variation, VariationImage, bulk_unique_slugify,
+    unique_slugify,
+)
+from . import feeds, instrumentation, suggest, views, warmup
+from .attributes import AttributeIndex, from_bits, get_attribute_index, to_bits
+from .benchmark import compare, default_scenarios, run_scenarios
+from .cache import bump_catalog_version, catalog_version
+from .categories import get_category_tree
+from .facets import get_facets
+from .filters import get_filters
+from .images import derivative_name, upload_images
+from .management.commands.profile_startup import import_breakdown
+from .related import Group
+from .pagination import KEYSET_ORDERINGS, KeysetPaginator
+from .search import InMemorySearchBackend, get_search_backend
+from .seed import seed_catalog
+from .suggest import SuggestIndex
+
+
+def make_catalog(products=15, variations=8, images=2):
+    cat = Category.objects.create(name="Bikes")
+    for i in range(products):
+        p = Product.objects.create(
+            name=f"Bike {i}", category=cat, brand="Hero", sku=f"SKU-{i}", price=Decimal(100 + i),
+        )
+        for j in range(images):
+            ProductImage.objects.create(product=p, image=f"products/gallery/{i}-{j}.png", sort_order=j)
+        for j in range(variations):
+            Variation.objects.create(product=p, name=f"Size {j}", sku=f"SKU-{i}-{j}")
+    return cat
+
+
+class ProductListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_query_count_is_constant(self):
+        self.client.get(reverse('products:product_list'))  # warm the facet cache
+        # count, page: cards need no joins or prefetches
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('products:product_list'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['page_obj'].object_list), 12)
+
+    def test_card_data(self):
+        resp = self.client.get(reverse('products:product_list'))
+        p = resp.context['page_obj'].object_list[0]
+        self.assertEqual(p.variation_count, 8)
+        self.assertEqual([v['label'] for v in p.variations], [f"Size {j}" for j in range(6)])
+        self.assertTrue(p.thumbnail_url.endswith('products/gallery/14-0.png'))
+        self.assertContains(resp, "+2 more")
+        self.assertContains(resp, "Hero • Bikes")
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cat = Category.objects.create(name="Helmets")
+        # duplicate prices / featured flags so the id tie-breaker matters
+        for i in range(30):
+            Product.objects.create(
+                name=f"Helmet {i}", category=cat, sku=f"H-{i}",
+                price=Decimal(100 + i % 4), is_featured=i % 3 == 0,
+            )
+
+    def walk(self, paginator):
+        seen, cursor, pages = [], None, []
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            seen += [p.id for p in page]
+            if not page.has_next():
+                return seen, pages
+            cursor = page.next_cursor
+
+    def test_forward_and_back_match_offset_order(self):
+        for sort, ordering in KEYSET_ORDERINGS.items():
+            expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+            paginator = KeysetPaginator(Product.objects.all(), 7, ordering)
+            seen, pages = self.walk(paginator)
+            self.assertEqual(seen, expected, sort)
+            self.assertFalse(pages[0].has_previous())
+
+            back = paginator.get_page(pages[-1].previous_cursor)
+            self.assertEqual([p.id for p in back], [p.id for p in pages[-2]], sort)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), 5, KEYSET_ORDERINGS[None])
+        self.assertEqual(
+            [p.id for p in paginator.get_page('not-a-cursor')],
+            [p.id for p in paginator.get_page()],
+        )
+
+    @override_settings(SHOP_PAGINATION='cursor')
+    def test_listing_cursor_mode_skips_count(self):
+        url = reverse('products:product_list')
+        self.client.get(url, {'sort': 'price_asc'})
+        # just the page
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, {'sort': 'price_asc'})
+        page = resp.context['page_obj']
+        self.assertTrue(page.has_next())
+        self.assertContains(resp, f"sort=price_asc&cursor={page.next_cursor}")
+
+        resp = self.client.get(url, {'sort': 'price_asc', 'cursor': page.next_cursor})
+        self.assertTrue(resp.context['page_obj'].has_previous())
+
+
+class InMemorySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cat = Category.objects.create(name="Gear")
+        cls.helmet = Product.objects.create(name="Road Helmet", brand="Giro", category=cls.cat, sku="G-1", price=50)
+        cls.gloves = Product.objects.create(
+            name="Winter Gloves", brand="Giro", category=cls.cat, sku="G-2", price=20,
+            short_description="Pairs well with any helmet",
+        )
+        cls.lamp = Product.objects.create(name="Bike Lamp", brand="Cateye", category=cls.cat, sku="G-3", price=30)
+
+    def setUp(self):
+        self.backend = get_search_backend()
+        self.assertIsInstance(self.backend, InMemorySearchBackend)
+        self.backend.reset()
+
+    def search(self, q):
+        qs = self.backend.search(Product.objects.filter(is_active=True), q)
+        return list(qs.order_by('-relevance', 'id'))
+
+    def test_ranking_and_prefix(self):
+        self.assertEqual(self.search("helmet"), [self.helmet, self.gloves])
+        self.assertEqual(self.search("giro glo"), [self.gloves])
+        self.assertEqual(self.search("cat"), [self.lamp])
+        self.assertEqual(self.search("nothing"), [])
+
+    def test_index_follows_save_and_delete(self):
+        self.search("lamp")  # build the index
+        self.lamp.name = "Bike Light"
+        self.lamp.save()
+        self.assertEqual(self.search("lamp"), [])
+        self.assertEqual(self.search("light"), [self.lamp])
+
+        self.helmet.is_active = False
+        self.helmet.save()
+        self.assertEqual(self.search("helmet"), [self.gloves])
+
+        self.gloves.delete()
+        self.assertEqual(self.search("helmet"), [])
+
+    def test_listing_relevance_sort(self):
+        resp = self.client.get(reverse('products:product_list'), {'q': 'helmet', 'sort': 'relevance'})
+        self.assertEqual([p.pk for p in resp.context['page_obj'].object_list], [self.helmet.pk, self.gloves.pk])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_capped_results_say_so(self):
+        self.assertEqual(self.search("helmet"), [self.helmet])
+        resp = self.client.get(reverse('products:product_list'), {'q': 'helmet', 'sort': 'relevance'})
+        self.assertEqual(resp.context['page_obj'].paginator.count, 1)
+        self.assertContains(resp, "Showing the best 1 of 2 matches")
+        with self.settings(SEARCH_MAX_RESULTS=0):
+            self.assertEqual(self.search("helmet"), [self.helmet, self.gloves])
+            self.assertNotContains(self.client.get(reverse('products:product_list'), {'q': 'helmet'}), "Showing the best")
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bikes = Category.objects.create(name="Bikes")
+        cls.gear = Category.objects.create(name="Gear")
+        Category.objects.create(name="Empty")
+        for i, (cat, brand, price) in enumerate([
+            (cls.bikes, "Hero", 100), (cls.bikes, "Hero", 200), (cls.bikes, "Trek", 600),
+            (cls.gear, "Giro", 50), (cls.gear, "Hero", 150),
+        ]):
+            Product.objects.create(name=f"P{i}", category=cat, brand=brand, sku=f"F-{i}", price=price)
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        filters = {'q': '', 'category': '', 'brand': '', 'min': '', 'max': ''}
+        filters.update(params)
+        return get_facets(filters)
+
+    def test_open_write_does_not_bump_facets(self):
+        def giro():
+            return next(b['count'] for b in self.facets()['brands'] if b['name'] == 'Giro')
+
+        self.assertEqual(giro(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Product.objects.create(name="New", category=self.gear, brand="Giro", sku="F-open", price=75)
+                self.assertEqual(giro(), 1)  # the pre-write version's facets, not recomputed yet
+        self.assertEqual(giro(), 2)
+
+    def test_counts_ignore_own_dimension(self):
+        facets = self.facets(category='bikes', brand='hero')
+        # categories: brand=hero applies, category doesn't
+        self.assertEqual(
+            [(c['slug'], c['count']) for c in facets['categories']],
+            [('bikes', 2), ('empty', 0), ('gear', 1)],
+        )
+        # brands: category=bikes applies, brand doesn't
+        self.assertEqual(facets['brands'], [{'name': 'Hero', 'count': 2}, {'name': 'Trek', 'count': 1}])
+        self.assertEqual(facets['price_range'], {'min_price': 100, 'max_price': 200})
+
+    def test_counts_follow_search(self):
+        get_search_backend().reset()
+        facets = self.facets(q='hero')
+        self.assertEqual([c['count'] for c in facets['categories']], [2, 0, 1])
+        self.assertEqual(facets['brands'], [{'name': 'Hero', 'count': 3}])
+
+    def test_price_buckets_cover_every_product(self):
+        buckets = self.facets()['price_buckets']
+        self.assertEqual(len(buckets), 5)
+        self.assertEqual(sum(b['count'] for b in buckets), 5)
+        self.assertEqual((buckets[0]['min'], buckets[-1]['max']), (50, 600))
+
+    def test_warm_cache_is_query_free_and_invalidated_by_saves(self):
+        self.facets()
+        with self.assertNumQueries(0):
+            self.facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="New", category=self.gear, brand="Giro", sku="F-new", price=75)
+        giro = next(b for b in self.facets()['brands'] if b['name'] == 'Giro')
+        self.assertEqual(giro['count'], 2)
+        self.gear.name = "Apparel"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gear.save()
+        self.assertIn('Apparel', [c['name'] for c in self.facets()['categories']])
+
+
+class AttributeFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cat = Category.objects.create(name="Apparel")
+        mk = lambda sku, brand, **kw: Product.objects.create(name=sku, sku=sku, category=cat, brand=brand, price=10, **kw)
+        cls.jersey = mk("Jersey", "Rapha")
+        Variation.objects.create(product=cls.jersey, color="Red", size="M", sku="J-RM")
+        Variation.objects.create(product=cls.jersey, color="Navy  Blue", size="L", sku="J-BL")
+        cls.cap = mk("Cap", "Rapha", color="red")  # the product's own color counts too
+        cls.socks = mk("Socks", "Giro")
+        Variation.objects.create(product=cls.socks, color="Blue", size="M", sku="S-BM")
+
+    def setUp(self):
+        cache.clear()
+
+    def listed(self, **params):
+        resp = self.client.get(reverse('products:product_list'), params)
+        return sorted(p.name for p in resp.context['page_obj'].object_list)
+
+    def test_bitset_roundtrip(self):
+        self.assertEqual(from_bits(to_bits([9, 1, 64, 1])), [1, 9, 64])
+        self.assertEqual((to_bits([]), from_bits(0)), (0, []))
+
+    def test_multi_select_filters(self):
+        self.assertEqual(self.listed(color='red'), ['Cap', 'Jersey'])
+        # OR within an attribute, AND across attributes
+        self.assertEqual(self.listed(color=['red', 'blue']), ['Cap', 'Jersey', 'Socks'])
+        self.assertEqual(self.listed(color='navy blue,blue', size='m'), ['Jersey', 'Socks'])
+        self.assertEqual(self.listed(color='green'), [])
+
+    def test_counts_ignore_own_dimension(self):
+        filters = dict(get_filters(QueryDict('brand=rapha&color=red')))
+        facets = get_facets(filters)
+        self.assertEqual([(c['label'], c['count']) for c in facets['colors']], [('Red', 2), ('Navy Blue', 1)])
+        self.assertEqual([(s['value'], s['count']) for s in facets['sizes']], [('l', 1), ('m', 1)])
+
+    def test_signals_update_index_in_place(self):
+        index = get_attribute_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Variation.objects.create(product=self.socks, color="Red", sku="S-R")
+        with mock.patch.object(AttributeIndex, 'build') as build:
+            self.assertIs(get_attribute_index(), index)
+            self.assertEqual(sorted(from_bits(index.matching({'color': ['red']}))), sorted(
+                [self.jersey.pk, self.cap.pk, self.socks.pk]
+            ))
+            self.cap.is_active = False
+            with self.captureOnCommitCallbacks(execute=True):
+                self.cap.save()
+            self.assertEqual(self.listed(color='red'), ['Jersey', 'Socks'])
+        build.assert_not_called()
+
+    def test_rolled_back_write_leaves_index_alone(self):
+        index = get_attribute_index()
+        with self.assertRaises(ValueError), transaction.atomic():
+            Variation.objects.create(product=self.socks, color="Teal", sku="S-T")
+            raise ValueError
+        self.assertEqual(from_bits(index.matching({'color': ['teal']})), [])
+
+
+class ProductDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cat = make_catalog(products=3, variations=2, images=1)
+        cls.product = Product.objects.get(sku="SKU-0")
+        cls.variation = cls.product.variations.order_by('name').last()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products:product_detail', args=[self.product.slug])
+
+    def test_warm_hit_skips_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertContains(resp, self.product.name)
+
+    def test_variation_pages_are_cached_separately(self):
+        url = reverse('products:product_detail_variation', args=[self.product.slug, self.variation.slug])
+        self.assertContains(self.client.get(self.url), "SKU: SKU-0-0")
+        self.assertContains(self.client.get(url), f"SKU: {self.variation.sku}")
+        missing = reverse('products:product_detail_variation', args=[self.product.slug, 'nope'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_price_and_related_changes_invalidate(self):
+        self.client.get(self.url)
+        self.product.price = Decimal('999.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(self.url), "999.00")
+
+        other = Product.objects.get(sku="SKU-1")
+        other.price = Decimal('555.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        self.assertContains(self.client.get(self.url), "555.00")
+
+    def test_gallery_changes_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            img = ProductImage.objects.create(product=self.product, image="products/gallery/extra.png", sort_order=9)
+        self.assertContains(self.client.get(self.url), "products/gallery/extra.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            img.delete()
+        self.assertNotContains(self.client.get(self.url), "products/gallery/extra.png")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VariationImage.objects.create(variation=self.product.variations.order_by('name').first(), image="products/variation/new.png")
+        self.assertContains(self.client.get(self.url), "products/variation/new.png")
+
+    def test_versions_bump_on_commit(self):
+        # a page rendered while the write is open must not be cached under the version meant for the new rows
+        self.product.price = Decimal('12.34')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(self.url), "12.34")
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.product.price = Decimal('56.78')
+                self.product.save()
+                self.assertContains(self.client.get(self.url), "12.34")  # still the pre-write version
+        self.assertContains(self.client.get(self.url), "56.78")
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.product.price = Decimal('43.21')
+            self.product.save()
+            self.client.get(self.url)
+            Product.objects.create(name="Dup", category=self.product.category, sku=self.product.sku, price=1)
+        self.assertContains(self.client.get(self.url), "56.78")
+
+    def test_production_requires_shared_cache(self):
+        # the version counters must be seen by every worker, so DEBUG off refuses a per-process cache
+        def load_settings(cache_url):
+            env = {**os.environ, 'DEBUG': 'False', 'CACHE_URL': cache_url,
+                   'AWS_STORAGE_BUCKET_NAME': 'media', 'AWS_ACCESS_KEY_ID': 'key', 'AWS_SECRET_ACCESS_KEY': 'secret'}
+            return subprocess.run([sys.executable, '-c', 'import quesec.settings'], cwd=settings.BASE_DIR,
+                                  env=env, capture_output=True, text=True)
+
+        refused = load_settings('locmemcache://')
+        self.assertNotEqual(refused.returncode, 0)
+        self.assertIn("CACHE_URL must name a shared cache", refused.stderr)
+        self.assertEqual(load_settings('rediscache://127.0.0.1:6379/1').returncode, 0)
+
+
+class SlugAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cat = Category.objects.create(name="Helmets")
+        for i in range(5):
+            Product.objects.create(name="Helmet", category=cls.cat, sku=f"S-{i}", price=1)
+
+    def test_next_suffix_in_one_query(self):
+        Product.objects.filter(slug='helmet-2').update(slug='helmet-red')
+        with self.assertNumQueries(1):
+            slug = unique_slugify(Product(), "Helmet")
+        self.assertEqual(slug, 'helmet-2')
+
+    def test_bulk_products(self):
+        objs = [Product(name=name, category=self.cat, sku=f"B-{i}", price=1)
+                for i, name in enumerate(["Helmet", "Helmet", "Helmet 5", "Gloves"])]
+        with self.assertNumQueries(1):
+            bulk_unique_slugify(objs)
+        self.assertEqual([o.slug for o in objs], ['helmet-5', 'helmet-6', 'helmet-5-1', 'gloves'])
+        Product.objects.bulk_create(objs)
+
+    def test_bulk_variations_are_scoped_per_product(self):
+        a, b = Product.objects.all()[:2]
+        Variation.objects.create(product=a, name="Red", sku="V-1")
+        objs = [Variation(product=p, name="Red", sku=f"V-{p.pk}-{i}") for p in (a, b) for i in range(2)]
+        with self.assertNumQueries(1):
+            bulk_unique_slugify(objs, source=Variation.slug_source, scope_field='product_id')
+        self.assertEqual([o.slug for o in objs], ['red-1', 'red-2', 'red', 'red-1'])
+
+    def test_save_retries_when_slug_is_taken_concurrently(self):
+        real = unique_slugify
+        # first allocation returns a slug another writer already inserted
+        with mock.patch('products.models.unique_slugify', side_effect=['helmet', real(Product(), "Helmet")]):
+            p = Product.objects.create(name="Helmet", category=self.cat, sku="S-new", price=1)
+        self.assertEqual(p.slug, 'helmet-5')
+
+    def test_other_integrity_errors_are_not_retried(self):
+        with self.assertRaises(IntegrityError):
+            Product.objects.create(name="Helmet", category=self.cat, sku="S-0", price=1)
+
+
+class ImportCatalogTests(TestCase):
+    HEADER = "sku,name,category,parent_category,brand,price,stock,images,product_sku,color,size\n"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def write(self, name, text):
+        path = self.tmp / name
+        path.write_text(text)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_catalog', str(path), *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_csv_create_then_update(self):
+        path = self.write("cat.csv", self.HEADER + "\n".join([
+            "B-1,Road Bike,Road,Bikes,Trek,500,3,a.png|b.png,,,",
+            "B-2,Road Bike,Road,Bikes,Trek,600,0,,,,",
+            "B-1-R,Red 54,,,,,,r.png,B-1,Red,54",
+            "B-1-B,,,,,,,,B-1,Blue,56",
+            "BAD,,,,,,,,,,",
+        ]))
+        out = self.run_import(path, '--batch-size', '2')
+        self.assertIn("Imported 4 rows (1 skipped)", out)
+        self.assertIn("rows/s", out)
+
+        road = Category.objects.get(name="Road")
+        self.assertEqual(road.parent.name, "Bikes")
+        self.assertEqual(road.path, f"{road.parent.path}{road.pk}/")
+        p1, p2 = Product.objects.order_by('sku')
+        self.assertEqual((p1.slug, p2.slug), ('road-bike', 'road-bike-1'))
+        self.assertEqual(p1.category, road)
+        self.assertEqual(list(p1.images.values_list('image', flat=True)), ['a.png', 'b.png'])
+        self.assertEqual(
+            sorted(p1.variations.values_list('sku', 'slug')), [('B-1-B', 'blue-56'), ('B-1-R', 'red-54')],
+        )
+        self.assertEqual(Variation.objects.get(sku='B-1-R').images.get().image, 'r.png')
+
+        # same skus again: updated in place, no duplicate rows or images
+        path = self.write("cat2.csv", self.HEADER + "B-1,Road Bike,Road,Bikes,Trek,450,7,a.png|b.png,,,\n")
+        self.run_import(path)
+        p1.refresh_from_db()
+        self.assertEqual((p1.price, p1.stock, p1.slug), (Decimal('450'), 7, 'road-bike'))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(p1.images.count(), 2)
+
+    def test_category_paths_rebuilt_once_per_batch(self):
+        path = self.write("cat.csv", self.HEADER + "\n".join([
+            "H-1,Helmet,Helmets,Gear,Giro,10,1,,,,",
+            "S-1,Shoe,Shoes,Gear,Giro,20,1,,,,",
+            "T-1,Tube,Tubes,Gear,Giro,5,1,,,,",
+        ]))
+        with mock.patch.object(Category, 'rebuild_paths', wraps=Category.rebuild_paths) as rebuild:
+            self.run_import(path, '--batch-size', '2')
+            self.run_import(path)
+        self.assertEqual(rebuild.call_count, 2)  # one per batch that created categories, none on the re-run
+        self.assertEqual(Category.objects.get(name="Tubes").depth, 1)
+
+    def test_jsonl_resume_skips_committed_rows(self):
+        rows = [{"sku": f"J-{i}", "name": f"Item {i}", "category": "Misc", "price": "10"} for i in range(5)]
+        path = self.write("cat.jsonl", "\n".join(json.dumps(r) for r in rows))
+        Path(f"{path}.progress").write_text(json.dumps({'rows': 3}))
+        self.run_import(path, '--resume')
+        self.assertEqual(sorted(Product.objects.values_list('sku', flat=True)), ['J-3', 'J-4'])
+        self.assertFalse(Path(f"{path}.progress").exists())
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        def rows(prefix, n):
+            return self.HEADER + "\n".join(f"{prefix}-{i},Helmet,Gear,,Giro,10,1,{prefix}{i}.png,," for i in range(n))
+
+        small, large = self.write("s.csv", rows("S", 5)), self.write("l.csv", rows("L", 50))
+        self.run_import(small)
+        with CaptureQueriesContext(connection) as few:
+            self.run_import(self.write("s2.csv", rows("T", 5)))
+        with CaptureQueriesContext(connection) as many:
+            self.run_import(large)
+        self.assertEqual(len(few), len(many))
+
+
+def png_bytes(width, height):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new('RGBA', (width, height), (200, 30, 30, 255)).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = self.settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        cat = Category.objects.create(name="Bikes")
+        self.product = Product.objects.create(name="Bike", category=cat, sku="IMG-1", price=1)
+
+    def test_upload_generates_renditions(self):
+        img = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile("wide.png", png_bytes(1000, 500)),
+        )
+        meta = ProductImage.objects.get(pk=img.pk).renditions
+        self.assertEqual(meta['source'], img.image.name)
+        self.assertEqual((meta['width'], meta['height'], meta['widths']), (1000, 500, [160, 400, 800, 1000]))
+        for width in meta['widths']:
+            for fmt in ('webp', 'jpeg'):
+                self.assertTrue(default_storage.exists(derivative_name(img.image.name, width, fmt)))
+
+        html = Template(
+            "{% load product_images %}{% responsive_image img.image img.renditions 'card' alt='x' %}"
+        ).render(Context({'img': img}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('400.jpeg" srcset=', html)
+        self.assertIn('width="400" height="200"', html)
+
+    def test_plain_img_without_renditions(self):
+        img = ProductImage.objects.create(product=self.product, image="products/gallery/missing.png")
+        self.assertEqual(img.renditions, {})
+        html = Template(
+            "{% load product_images %}{% responsive_image img.image img.renditions 'thumb' %}"
+        ).render(Context({'img': img}))
+        self.assertEqual(html, '<img src="/media/products/gallery/missing.png" alt="" class="" loading="lazy">')
+
+    def test_backfill_command(self):
+        name = default_storage.save("products/gallery/small.png", ContentFile(png_bytes(300, 300)))
+        img = ProductImage.objects.create(product=self.product, image=name)
+        out = StringIO()
+        call_command('generate_derivatives', '--workers', '1', stdout=out)
+        img.refresh_from_db()
+        self.assertEqual(img.renditions['widths'], [160, 300])
+        self.assertIn("Generated renditions for 1 images", out.getvalue())
+        self.assertTrue(default_storage.exists(derivative_name(name, 300, 'webp')))
+        # the listing card (written by the create, before the backfill) shows the new renditions too
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).thumbnail_renditions, img.renditions)
+
+
+class SlowMediaStorage(MemoizedFileSystemStorage):
+    """Filesystem stand-in for S3: counts URL builds, every upload costs a round trip."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.built, self.inflight, self.peak = 0, 0, 0
+        self.lock = threading.Lock()
+
+    def _save(self, name, content):
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        try:
+            time.sleep(0.01)
+            return super()._save(name, content)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = self.settings(MEDIA_ROOT=tmp.name, STORAGES={**settings.STORAGES, 'default': {
+            'BACKEND': 'products.tests.SlowMediaStorage', 'OPTIONS': {'location': tmp.name, 'base_url': '/media/'},
+        }})
+        media.enable()
+        self.addCleanup(media.disable)
+        self.storage = storages['default']
+        self.product = Product.objects.create(name="Bike", category=Category.objects.create(name="Bikes"),
+                                              sku="MEDIA-1", price=1)
+
+    def test_card_grid_builds_each_url_once(self):
+        grid = Template(
+            "{% load product_images %}{% for m in metas %}{% responsive_image m.source m 'card' %}{% endfor %}"
+        )
+        metas = [{'source': f"products/gallery/{i}.png", 'width': 1000, 'height': 500, 'widths': [160, 400, 800, 1000]}
+                 for i in range(12)]
+        original = FileSystemStorage.url
+        with mock.patch.object(FileSystemStorage, 'url', autospec=True, side_effect=original) as built:
+            first = grid.render(Context({'metas': metas}))
+            self.assertEqual(built.call_count, 12 * 4 * 2)  # every width in WebP and JPEG, once
+            self.assertEqual(grid.render(Context({'metas': metas})), first)
+            self.assertEqual(built.call_count, 12 * 4 * 2)
+            name = derivative_name(metas[0]['source'], 400, 'jpeg')
+            default_storage.save(name, ContentFile(b'x'))
+            default_storage.url(name)
+            self.assertEqual(built.call_count, 12 * 4 * 2 + 1)
+
+    def test_gallery_uploads_run_concurrently(self):
+        images = [
+            ProductImage(product=self.product, image=SimpleUploadedFile(f"g{i}.png", png_bytes(200, 100)), sort_order=i)
+            for i in range(20)
+        ]
+        with mock.patch('products.signals.safe_generate') as regenerate:
+            upload_images(images)
+            for img in images:
+                img.save()
+        regenerate.assert_not_called()
+        self.assertGreater(self.storage.peak, 1)
+        for img in ProductImage.objects.filter(product=self.product):
+            self.assertEqual(img.renditions['widths'], [160, 200])
+            self.assertTrue(default_storage.exists(derivative_name(img.image.name, 160, 'webp')))
+        self.assertTrue(ProductCard.objects.get(pk=self.product.pk).thumbnail_renditions)
+
+
+def build_tree(fanout=(2, 4, 5, 5, 4)):
+    """One level per fanout entry; the default is 2+8+40+200+800 = 1,050 nodes."""
+    parents, created = [None], []
+    for depth in range(len(fanout)):
+        objs = [
+            Category(name=f"c{depth}-{i}-{j}", slug=f"c{depth}-{i}-{j}", parent_id=parent)
+            for i, parent in enumerate(parents) for j in range(fanout[depth])
+        ]
+        Category.objects.bulk_create(objs)
+        created += objs
+        parents = [o.pk for o in objs]
+    Category.rebuild_paths()
+    return created
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_paths_follow_save_and_reparent(self):
+        bikes = Category.objects.create(name="Bikes")
+        road = Category.objects.create(name="Road", parent=bikes)
+        race = Category.objects.create(name="Race", parent=road)
+        self.assertEqual(race.path, f"/{bikes.pk}/{road.pk}/{race.pk}/")
+        self.assertEqual(race.depth, 2)
+        self.assertEqual(race.ancestor_ids(), [bikes.pk, road.pk])
+
+        road.parent = None
+        road.save()
+        race.refresh_from_db()
+        self.assertEqual((race.path, race.depth), (f"/{road.pk}/{race.pk}/", 1))
+
+    def test_cycles_are_rejected(self):
+        bikes = Category.objects.create(name="Bikes")
+        road = Category.objects.create(name="Road", parent=bikes)
+        bikes.parent = road
+        with self.assertRaises(ValidationError):
+            bikes.full_clean()
+        with self.assertRaises(ValueError):
+            bikes.save()
+        bikes.refresh_from_db()
+        self.assertIsNone(bikes.parent_id)
+
+    def test_listing_filters_whole_subtree(self):
+        bikes = Category.objects.create(name="Bikes")
+        road = Category.objects.create(name="Road", parent=bikes)
+        gear = Category.objects.create(name="Gear")
+        for i, cat in enumerate([bikes, road, road, gear]):
+            Product.objects.create(name=f"P{i}", category=cat, sku=f"T-{i}", price=1)
+
+        resp = self.client.get(reverse('products:product_list'), {'category': 'bikes'})
+        self.assertEqual(len(resp.context['page_obj'].object_list), 3)
+        self.assertEqual(
+            [(c['indent'] + c['name'], c['count']) for c in resp.context['categories']],
+            [('Bikes', 3), ('— Road', 2), ('Gear', 1)],
+        )
+        resp = self.client.get(reverse('products:product_list'), {'category': 'nope'})
+        self.assertEqual(len(resp.context['page_obj'].object_list), 0)
+
+    def test_breadcrumbs_on_detail(self):
+        bikes = Category.objects.create(name="Bikes")
+        road = Category.objects.create(name="Road", parent=bikes)
+        p = Product.objects.create(name="Racer", category=road, sku="R-1", price=1)
+        resp = self.client.get(reverse('products:product_detail', args=[p.slug]))
+        self.assertEqual([c['name'] for c in resp.context['breadcrumbs']], ['Bikes', 'Road'])
+
+
+class CategoryTreeBenchmarkTests(TestCase):
+    """5 levels, 2,000 nodes: subtree filter and ancestor chain stay O(1) queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        nodes = build_tree()
+        extra = 2000 - len(nodes)  # top up the deepest level
+        leaves = [n for n in nodes if n.name.startswith('c4-')]
+        Category.objects.bulk_create([
+            Category(name=f"x-{i}", slug=f"x-{i}", parent_id=leaves[i % len(leaves)].parent_id) for i in range(extra)
+        ])
+        Category.rebuild_paths()
+        cls.root = nodes[0]
+        cls.leaf = leaves[-1]
+        for i, cat in enumerate(leaves[:50]):
+            Product.objects.create(name=f"P{i}", category=cat, sku=f"BM-{i}", price=1)
+
+    def setUp(self):
+        cache.clear()  # the writes above bump the version only on a commit, which never comes here
+
+    def test_tree_shape(self):
+        self.assertEqual(Category.objects.count(), 2000)
+        self.assertEqual(Category.objects.order_by('-depth').first().depth, 4)
+
+    def test_subtree_filter_is_one_query(self):
+        get_category_tree()
+        with self.assertNumQueries(1):
+            n = Product.objects.filter(category__path__startswith=self.root.path).count()
+        self.assertEqual(n, 50)
+
+    def test_ancestor_chain_without_queries(self):
+        tree = get_category_tree()
+        with self.assertNumQueries(0):
+            crumbs = get_category_tree().breadcrumbs(self.leaf.pk)
+        self.assertEqual(len(crumbs), 5)
+        self.assertEqual([c['depth'] for c in crumbs], [0, 1, 2, 3, 4])
+        self.assertEqual(len(tree.nodes), 2000)
+
+
+class RelatedProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bikes = Category.objects.create(name="Bikes")
+        cls.road = Category.objects.create(name="Road", parent=bikes)
+        cls.mtb = Category.objects.create(name="MTB", parent=bikes)
+        cls.gear = Category.objects.create(name="Gear")
+        mk = lambda sku, cat, brand, price: Product.objects.create(name=sku, sku=sku, category=cat, brand=brand, price=price)
+        cls.a = mk("A", cls.road, "Trek", 1000)
+        cls.b = mk("B", cls.road, "Trek", 1100)
+        cls.c = mk("C", cls.road, "Giant", 5000)
+        cls.d = mk("D", cls.mtb, "Trek", 1000)
+        cls.e = mk("E", cls.gear, "Trek", 1000)
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list('related__sku', flat=True))
+
+    def test_scoring_prefers_category_brand_then_price(self):
+        call_command('build_related_products', stdout=StringIO())
+        # E is in another top-level category, so never related to bikes
+        self.assertEqual(self.related(self.a), ['B', 'D', 'C'])
+        self.assertEqual(self.related(self.e), [])
+
+    def test_incremental_refresh(self):
+        call_command('build_related_products', stdout=StringIO())
+        self.c.brand, self.c.price = "Trek", 1000
+        self.c.save()
+        self.assertEqual(self.related(self.a), ['C', 'B', 'D'])
+
+        self.b.is_active = False
+        self.b.save()
+        self.assertEqual(self.related(self.b), [])
+        self.assertNotIn('B', self.related(self.a))
+
+        f = Product.objects.create(name="F", sku="F", category=self.mtb, brand="Trek", price=1000)
+        self.assertEqual(self.related(f), ['D', 'A', 'C'])
+        self.assertEqual(self.related(self.d), ['A', 'C'])  # newcomers wait for the full build
+        call_command('build_related_products', stdout=StringIO())
+        self.assertEqual(self.related(self.d), ['F', 'A', 'C'])
+        f.category = self.gear
+        f.save()
+        self.assertEqual(self.related(self.d), ['A', 'C'])
+        self.assertEqual(self.related(f), ['E'])
+
+        self.a.delete()
+        self.assertEqual(self.related(self.d), ['C'])
+
+    def test_block_scoring_matches_single_rows(self):
+        rows = list(Product.objects.values('id', 'category_id', 'category__parent_id', 'brand', 'price'))
+        group = Group(rows)
+        everything = group.top(list(range(len(group))))
+        for i, pk in enumerate(group.ids.tolist()):
+            self.assertEqual(group.top([i])[pk], everything[pk])
+
+    def test_detail_reads_index(self):
+        call_command('build_related_products', stdout=StringIO())
+        cache.clear()
+        resp = self.client.get(reverse('products:product_detail', args=[self.a.slug]))
+        self.assertEqual([p.sku for p in resp.context['related']], ['B', 'D', 'C'])
+
+
+class ProductCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bikes = Category.objects.create(name="Bikes")
+        cls.road = Category.objects.create(name="Road", parent=cls.bikes)
+        cls.gear = Category.objects.create(name="Gear")
+        cls.p = Product.objects.create(name="Racer", sku="R-1", category=cls.road, brand="Trek", price=900, stock=3)
+
+    def card(self):
+        return ProductCard.objects.filter(pk=self.p.pk).first()
+
+    def test_signals_keep_card_current(self):
+        card = self.card()
+        self.assertEqual((card.slug, card.category_name, card.category_path), ("racer", "Road", self.road.path))
+        self.assertTrue(card.in_stock)
+        self.assertEqual((card.thumbnail_url, card.variations, card.variation_count), ('', [], 0))
+
+        Variation.objects.create(product=self.p, color="Red", size="M", sku="R-1-RM")
+        ProductImage.objects.create(product=self.p, image="products/gallery/racer.png", alt_text="Side view")
+        self.p.stock = 0
+        self.p.save()
+        card = self.card()
+        self.assertEqual(card.variations, [{'slug': 'red-m', 'label': 'Red • M'}])
+        self.assertEqual(card.variation_count, 1)
+        self.assertEqual((card.thumbnail_url, card.thumbnail_alt), ("/media/products/gallery/racer.png", "Side view"))
+        self.assertFalse(card.in_stock)
+
+        self.p.variations.get().delete()
+        self.assertEqual(self.card().variation_count, 0)
+
+        self.p.is_active = False
+        self.p.save()
+        self.assertIsNone(self.card())
+
+    def test_category_rename_and_move(self):
+        self.road.name = "Road Bikes"
+        self.road.parent = self.gear
+        self.road.save()
+        card = self.card()
+        self.assertEqual(card.category_name, "Road Bikes")
+        self.assertEqual(card.category_path, f"/{self.gear.pk}/{self.road.pk}/")
+
+        cache.clear()
+        resp = self.client.get(reverse('products:product_list'), {'category': self.gear.slug})
+        self.assertEqual([c.pk for c in resp.context['page_obj'].object_list], [self.p.pk])
+        self.assertContains(resp, "Trek • Road Bikes")
+
+    def test_rebuild_command(self):
+        # bulk updates skip signals; the rebuild catches up and drops orphans
+        Product.objects.filter(pk=self.p.pk).update(price=950)
+        ProductCard.objects.create(
+            id=self.p.pk + 100, slug="gone", name="Gone", category=self.gear, category_slug="gear",
+            category_name="Gear", category_path=self.gear.path, price=1, created_at=self.p.created_at,
+        )
+        call_command('build_product_cards', stdout=StringIO())
+        self.assertEqual(list(ProductCard.objects.values_list('pk', 'price')), [(self.p.pk, Decimal('950.00'))])
+
+    def test_bulk_seed_builds_cards(self):
+        seed_catalog(products=20, depth=1, fanout=2, prefix='CARD')
+        self.assertEqual(ProductCard.objects.count(), Product.objects.filter(is_active=True).count())
+
+
+class BenchmarkHarnessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=40, depth=2, fanout=3, variations=3, images=1, brands=5)
+
+    def test_seed_is_reproducible_shape(self):
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Category.objects.count(), 12)
+        self.assertFalse(Category.objects.filter(path='').exists())
+        self.assertEqual(Product.objects.values('slug').distinct().count(), 40)
+
+    def test_run_scenarios(self):
+        results = run_scenarios(default_scenarios(), iterations=2, warmup=1)
+        self.assertIn('detail:variation', results)
+        for r in results.values():
+            self.assertEqual(r['status'], 200)
+            self.assertLessEqual(r['p50_ms'], r['p95_ms'])
+
+    def test_compare_flags_regressions(self):
+        baseline = {'list:newest': {'p95_ms': 10.0, 'queries': 4}}
+        self.assertEqual(compare({'list:newest': {'p95_ms': 11.0, 'queries': 4}}, baseline), [])
+        problems = compare({'list:newest': {'p95_ms': 20.0, 'queries': 5}}, baseline)
+        self.assertEqual(len(problems), 2)
+
+
+@override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=10_000, PERF_PUBLISH_SECONDS=0)
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(products=3)
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.reset()
+
+    def test_server_timing_header(self):
+        resp = self.client.get(reverse('products:product_list'))
+        timing = resp['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries, \d+ repeated"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertRegex(timing, r'cache;dur=[\d.]+;desc="\d+ hit, \d+ miss"')
+
+    def test_cache_hits_counted(self):
+        url = reverse('products:product_detail', args=[Product.objects.first().slug])
+        self.client.get(url)
+        second = self.client.get(url)['Server-Timing']
+        self.assertIn('0 queries', second)
+        self.assertRegex(second, r'desc="[1-9]\d* hit')
+
+    def test_repeated_queries_fingerprinted(self):
+        metrics = instrumentation.RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for p in Product.objects.all():
+                Product.objects.filter(pk=p.pk).exists()
+        self.assertEqual(metrics.repeated()[0][0], 3)
+
+    def test_histograms_and_dump(self):
+        for _ in range(3):
+            self.client.get(reverse('products:product_list'))
+        self.client.get(reverse('home'))
+        samples = instrumentation.snapshot()
+        self.assertEqual(len(samples['products:product_list']), 3)
+        self.assertEqual(len(samples['home']), 1)
+
+        out = StringIO()
+        call_command('dump_perf_stats', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['products:product_list']['count'], 3)
+
+    def test_slow_request_logged_with_sql(self):
+        with override_settings(PERF_SLOW_REQUEST_MS=0), self.assertLogs('products.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('products:product_list'))
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(PERF_INSTRUMENTATION=False)
+    def test_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('products:product_list')))
+
+
+class RenderCacheTests(TestCase):
+    def test_invariant_block_renders_once_without_context(self):
+        tpl = Template("{% load render_cache %}{% invariant 'menu' %}<nav>{{ name }}</nav>{% endinvariant %}{{ name }}")
+        self.assertEqual(tpl.render(Context({'name': 'ann'})), "<nav></nav>ann")
+        with mock.patch.object(tpl.nodelist[1].nodelist, 'render') as body:
+            self.assertEqual(tpl.render(Context({'name': 'bob'})), "<nav></nav>bob")
+        body.assert_not_called()
+        with self.settings(LAYOUT_RENDER_CACHE=False):
+            self.assertEqual(tpl.render(Context({'name': 'cy'})), "<nav></nav>cy")
+
+    def test_home_snapshot_matches_live_render(self):
+        live = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        with self.settings(HOME_SNAPSHOT=False):
+            rendered = self.client.get('/').content
+        self.assertEqual(live['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(live.content), rendered)
+        self.assertIn('Cookie', live['Vary'])
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=live['ETag']).status_code, 304)
+
+        user = User.objects.create_user('shopper', password='pw')
+        self.client.force_login(user)
+        with mock.patch.object(snapshots, 'get_snapshot') as snapshot:
+            self.assertEqual(self.client.get('/').content, rendered)
+        snapshot.assert_not_called()
+
+    def test_snapshot_rebuilt_on_catalog_change(self):
+        first = snapshots.get_snapshot('index.html')
+        self.assertIs(snapshots.get_snapshot('index.html'), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Bike", category=Category.objects.create(name="Bikes"), sku="HOME-1", price=1)
+        self.assertNotEqual(snapshots.get_snapshot('index.html').key, first.key)
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', {
+            'form.html': '{% extends "layout.html" %}{% block body %}<form>{% csrf_token %}</form>{% endblock %}',
+            'layout.html': '<main>{% block body %}{% endblock %}</main>',
+        })]},
+    }])
+    def test_csrf_token_filled_per_request(self):
+        first = snapshots.snapshot_response(RequestFactory().get('/'), 'form.html')
+        second = snapshots.snapshot_response(RequestFactory().get('/'), 'form.html')
+        self.assertNotIn(snapshots.CSRF_PLACEHOLDER.encode(), first.content)
+        self.assertIn(b'name="csrfmiddlewaretoken"', first.content)
+        self.assertNotEqual(first.content, second.content)
+        self.assertFalse(first.has_header('ETag'))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(products=3)
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.order_by('pk').first()
+        self.url = reverse('products:product_detail', args=[self.product.slug])
+
+    def test_detail_revalidates_without_rendering(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('must-revalidate', first['Cache-Control'])
+        self.assertIn('public', first['Cache-Control'])
+        with self.assertTemplateNotUsed('products/product_detail.html'), self.assertNumQueries(0):
+            again = self.client.get(self.url, headers={'if-none-match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        modified = self.client.get(self.url, headers={'if-modified-since': first['Last-Modified']})
+        self.assertEqual(modified.status_code, 304)
+
+    def test_variation_edit_changes_validators(self):
+        first = self.client.get(self.url)
+        variation = self.product.variations.first()
+        variation.color = 'Teal'
+        with self.captureOnCommitCallbacks(execute=True):
+            variation.save()
+        resp = self.client.get(self.url, headers={'if-none-match': first['ETag']})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], first['ETag'])
+
+    def test_image_delete_changes_etag(self):
+        first = self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.images.first().delete()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], first['ETag'])
+
+    def test_listing_etag_follows_query_and_catalog(self):
+        url = reverse('products:product_list')
+        a = self.client.get(url, {'sort': 'price_asc', 'q': 'x'})
+        self.assertEqual(a['ETag'], self.client.get(url, {'q': 'x', 'sort': 'price_asc'})['ETag'])
+        self.assertNotEqual(a['ETag'], self.client.get(url, {'sort': 'price_desc', 'q': 'x'})['ETag'])
+        self.assertEqual(self.client.get(url + '?sort=price_asc&q=x', headers={'if-none-match': a['ETag']}).status_code, 304)
+
+        self.product.price = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(url + '?sort=price_asc&q=x', headers={'if-none-match': a['ETag']}).status_code, 200)
+
+    def test_missing_product_has_no_validators(self):
+        resp = self.client.get(reverse('products:product_detail', args=['nope']))
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(resp.has_header('ETag'))
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(products=15, variations=2, images=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_sparse_fields_and_cursor(self):
+        url = reverse('products:api_product_list')
+        get_category_tree()
+        with self.assertNumQueries(1):
+            data = self.client.get(url, {'fields': 'sku,price,stock', 'sort': 'price_asc', 'limit': 10}).json()
+        self.assertEqual(data['results'][0], {'sku': 'SKU-0', 'price': '100.00', 'stock': 0})
+        self.assertEqual(len(data['results']), 10)
+
+        rest = self.client.get(url, {'fields': 'sku', 'sort': 'price_asc', 'limit': 10, 'cursor': data['next']}).json()
+        self.assertEqual([r['sku'] for r in rest['results']], [f"SKU-{i}" for i in range(10, 15)])
+        self.assertIsNone(rest['next'])
+        self.assertIsNotNone(rest['previous'])
+
+    def test_list_reuses_shop_filters(self):
+        data = self.client.get(reverse('products:api_product_list'), {'max': '102', 'category': 'bikes'}).json()
+        self.assertEqual(sorted(r['sku'] for r in data['results']), ['SKU-0', 'SKU-1', 'SKU-2'])
+        self.assertEqual(data['results'][0]['category'], 'bikes')
+
+    def test_bad_price_filters(self):
+        for value in ('abc', 'NaN', 'Infinity'):
+            resp = self.client.get(reverse('products:api_product_list'), {'min': value})
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json()['error'], "min must be a number")
+        self.assertEqual(self.client.get(reverse('products:api_product_list'), {'max': '1e'}).status_code, 400)
+        # the listing ignores them instead
+        resp = self.client.get(reverse('products:product_list'), {'min': 'abc', 'max': '102'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['active_filters']['min'], '')
+
+    def test_batch_keeps_order_and_reports_missing(self):
+        url = reverse('products:api_product_batch')
+        with self.assertNumQueries(2):
+            data = self.client.get(url, {'sku': 'SKU-3,NOPE,SKU-1', 'fields': 'sku,variations'}).json()
+        self.assertEqual([r['sku'] for r in data['results']], ['SKU-3', 'SKU-1'])
+        self.assertEqual(data['missing'], ['NOPE'])
+        self.assertEqual([v['sku'] for v in data['results'][0]['variations']], ['SKU-3-0', 'SKU-3-1'])
+
+    def test_batch_limit_and_bad_fields(self):
+        url = reverse('products:api_product_batch')
+        too_many = ','.join(f"S{i}" for i in range(301))
+        self.assertEqual(self.client.get(url, {'sku': too_many}).status_code, 400)
+        resp = self.client.get(url, {'sku': 'SKU-1', 'fields': 'sku,secret'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('secret', resp.json()['error'])
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_categories(self):
+        data = self.client.get(reverse('products:api_category_list')).json()
+        self.assertEqual([c['slug'] for c in data['results']], ['bikes'])
+
+
+class AsyncViewTests(TransactionTestCase):
+    """The async views run queries on pool threads, so the data must be committed."""
+
+    def setUp(self):
+        cache.clear()
+        make_catalog(products=4, variations=2, images=1)
+        self.product = Product.objects.order_by('pk').first()
+        self.factory = AsyncRequestFactory()
+
+    async def test_list_matches_sync_view(self):
+        url = reverse('products:product_list')
+        resp = await views.product_list_async(self.factory.get(url, {'sort': 'price_asc'}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'Bike 0', resp.content)
+        sync = await sync_to_async(self.client.get)(url, {'sort': 'price_asc'})
+        self.assertEqual(resp['ETag'], sync['ETag'])
+
+    async def test_detail_and_variation_404(self):
+        variation = await self.product.variations.order_by('name').alast()
+        resp = await views.product_detail_async(self.factory.get('/'), self.product.slug, variation.slug)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(variation.sku.encode(), resp.content)
+        with self.assertRaises(Http404):
+            await views.product_detail_async(self.factory.get('/'), self.product.slug, 'nope')
+
+    async def test_not_modified_skips_view(self):
+        first = await views.product_detail_async(self.factory.get('/'), self.product.slug)
+        again = await views.product_detail_async(
+            self.factory.get('/', headers={'if-none-match': first['ETag']}), self.product.slug,
+        )
+        self.assertEqual(again.status_code, 304)
+
+    @override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=10_000, PERF_PUBLISH_SECONDS=0)
+    def test_pool_thread_queries_are_instrumented(self):
+        # as under ASGI: sync middleware around the async view, whose ORM work runs on pool threads
+        middleware = instrumentation.InstrumentationMiddleware(async_to_sync(views.product_list_async))
+        resp = middleware(RequestFactory().get(reverse('products:product_list')))
+        self.addCleanup(instrumentation.reset)
+        self.assertRegex(resp['Server-Timing'], r'desc="[1-9]\d* queries')
+
+    @override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=10_000, PERF_PUBLISH_SECONDS=0)
+    async def test_instrumentation_keeps_async_views_async(self):
+        middleware = instrumentation.InstrumentationMiddleware(views.product_list_async)
+        self.addCleanup(instrumentation.reset)
+        self.assertTrue(iscoroutinefunction(middleware))
+        resp = await middleware(self.factory.get(reverse('products:product_list')))
+        self.assertRegex(resp['Server-Timing'], r'desc="[1-9]\d* queries')
+
+    @override_settings(CATALOG_ASYNC_VIEWS=True, CATALOG_FEEDS_PRECOMPUTED=False)
+    async def test_feed_streams_asynchronously(self):
+        resp = await sync_to_async(feeds.product_feed)(self.factory.get('/feeds/products.csv'), 'csv')
+        self.assertTrue(resp.is_async)
+        rows = [chunk async for chunk in resp.streaming_content]
+        self.assertEqual(len(rows), 1 + 4 * 2)
+
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        src, self.root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        (Path(src) / 'css').mkdir()
+        (Path(src) / 'css' / 'site.css').write_text("body { background: url('../logo.png'); }\n" * 200)
+        (Path(src) / 'logo.png').write_bytes(png_bytes(64, 64))
+        storage = CompressedManifestStaticFilesStorage(location=self.root, base_url='/static/')
+        source = FileSystemStorage(location=src)
+        paths = {}
+        for name in ('css/site.css', 'logo.png'):
+            with source.open(name) as fh:
+                storage.save(name, fh)
+            paths[name] = (source, name)
+        list(storage.post_process(paths))
+        self.css = storage.stored_name('css/site.css')
+        self.png = storage.stored_name('logo.png')
+
+    def serve(self, path, method='get', **headers):
+        with override_settings(SERVE_STATIC=True, STATIC_ROOT=self.root, STATIC_URL='/static/'):
+            middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+            response = middleware(getattr(RequestFactory(), method)(f'/static/{path}', headers=headers))
+        self.addCleanup(response.close)  # file bodies keep their file open until closed
+        return response
+
+    def test_hashed_and_precompressed(self):
+        self.assertRegex(self.css, r'^css/site\.[0-9a-f]{12}\.css$')
+        self.assertTrue(Path(self.root, self.css + '.gz').exists())
+        self.assertTrue(Path(self.root, self.png + '.webp').exists())
+
+    def test_encoding_negotiation(self):
+        resp = self.serve(self.css, accept_encoding='gzip, deflate')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Content-Type'], 'text/css')
+        self.assertEqual(resp['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(resp['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(resp.getvalue()), Path(self.root, self.css).read_bytes())
+
+        plain = self.serve(self.css, accept_encoding='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_webp_negotiation(self):
+        resp = self.serve(self.png, accept='image/avif,image/webp,*/*')
+        self.assertEqual(resp['Content-Type'], 'image/webp')
+        self.assertEqual(self.serve(self.png, accept='image/png')['Content-Type'], 'image/png')
+
+    def test_unhashed_names_revalidate_and_misses_fall_through(self):
+        self.assertEqual(self.serve('logo.png')['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.serve('nope.css').status_code, 404)
+
+    def test_streams_head_and_conditional_get(self):
+        size = Path(self.root, self.css).stat().st_size
+        resp = self.serve(self.css)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(int(resp['Content-Length']), size)
+        self.assertFalse(resp.has_header('Content-Disposition'))
+        head = self.serve(self.css, method='head')
+        self.assertEqual((head.content, int(head['Content-Length'])), (b'', size))
+
+        again = self.serve(self.css, if_none_match=resp['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.serve(self.css, if_modified_since=resp['Last-Modified']).status_code, 304)
+        # the gzip sibling is another representation with its own validator
+        gzipped = self.serve(self.css, accept_encoding='gzip', if_none_match=resp['ETag'])
+        self.assertEqual(gzipped.status_code, 200)
+        self.assertNotEqual(gzipped['ETag'], resp['ETag'])
+
+    async def test_async_mode_streams_asynchronously(self):
+        async def get_response(request):
+            return HttpResponse(status=404)
+
+        with override_settings(SERVE_STATIC=True, STATIC_ROOT=self.root, STATIC_URL='/static/'):
+            middleware = StaticFilesMiddleware(get_response)
+        resp = await middleware(AsyncRequestFactory().get(f'/static/{self.css}'))
+        self.assertTrue(resp.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in resp]), Path(self.root, self.css).read_bytes())
+
+    def test_missing_root_fails_at_startup(self):
+        with override_settings(SERVE_STATIC=True, STATIC_ROOT=Path(self.root, 'missing'), STATIC_URL='/static/'):
+            with self.assertRaisesMessage(ImproperlyConfigured, "run collectstatic"):
+                StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+
+
+class ManifestStaticPagesTests(TestCase):
+    """Pages render with the production static storage: every {% static %} name must be collected."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.TemporaryDirectory()
+        cls.manifest = override_settings(STATIC_ROOT=cls.root.name, STORAGES={
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'quesec.static_pipeline.CompressedManifestStaticFilesStorage'},
+        })
+        cls.manifest.enable()
+        # hashed names are what's under test; skip the (slow) .br/.gz/.webp siblings
+        with mock.patch.object(CompressedManifestStaticFilesStorage, '_write_siblings', return_value=[]):
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manifest.disable()
+        cls.root.cleanup()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(products=2, variations=0, images=0)
+
+    @override_settings(LAYOUT_RENDER_CACHE=False)
+    def test_listing_without_thumbnails(self):
+        resp = self.client.get(reverse('products:product_list'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertRegex(resp.content.decode(), r'/static/img/placeholder-4x3\.[0-9a-f]{12}\.png')
+
+
+@mock.patch.object(db_router, 'replica_aliases', return_value=['replica1', 'replica2'])
+class ReplicaRoutingTests(SimpleTestCase):
+    databases = {'default'}  # on_commit() checks the connection's autocommit; nothing is queried
+
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def serve(self, request, view):
+        middleware = db_router.ReplicaPinMiddleware(lambda req: HttpResponse(view()))
+        return middleware(request)
+
+    def test_catalog_reads_stick_to_one_replica(self, aliases):
+        seen = []
+        self.serve(self.factory.get('/shop/'), lambda: seen.extend(
+            [self.router.db_for_read(Product), self.router.db_for_read(Category), self.router.db_for_read(User)]
+        ))
+        self.assertIn(seen[0], ('replica1', 'replica2'))
+        self.assertEqual(seen[1], seen[0])
+        self.assertEqual(seen[2], 'default')
+
+    def test_catalog_reads_after_a_bump_skip_lagging_replicas(self, aliases):
+        # the replicas haven't replayed the write behind the bump yet
+        rows = {'default': 'new', 'replica1': 'old', 'replica2': 'old'}
+
+        def fill():
+            cache.get_or_set(f'price:{catalog_version()}', lambda: rows[self.router.db_for_read(Product)])
+
+        cache.clear()
+        bump_catalog_version()
+        self.serve(self.factory.get('/shop/'), fill)
+        self.assertEqual(cache.get(f'price:{catalog_version()}'), 'new')
+
+        cache.delete(db_router.HOLD_KEY)  # DB_REPLICA_PIN_SECONDS later
+        seen = []
+        self.serve(self.factory.get('/shop/'), lambda: seen.append(self.router.db_for_read(Product)))
+        self.assertIn(seen[0], ('replica1', 'replica2'))
+
+    def test_write_pins_request_and_browser(self, aliases):
+        seen = []
+
+        def view():
+            seen.append(self.router.db_for_write(Product))
+            seen.append(self.router.db_for_read(Product))
+
+        resp = self.serve(self.factory.get('/shop/'), view)
+        self.assertEqual(seen, ['default', 'default'])
+        self.assertEqual(resp.cookies[db_router.PIN_COOKIE]['max-age'], 5)
+
+        request = self.factory.get('/shop/')
+        request.COOKIES[db_router.PIN_COOKIE] = '1'
+        resp = self.serve(request, lambda: seen.append(self.router.db_for_read(Product)))
+        self.assertEqual(seen[-1], 'default')
+        self.assertNotIn(db_router.PIN_COOKIE, resp.cookies)
+
+    def test_admin_and_posts_read_primary(self, aliases):
+        seen = []
+        self.serve(self.factory.get(reverse('admin:index')), lambda: seen.append(self.router.db_for_read(Product)))
+        self.serve(self.factory.post('/shop/'), lambda: seen.append(self.router.db_for_read(Product)))
+        self.assertEqual(seen, ['default', 'default'])
+        self.assertTrue(self.router.allow_migrate('default', 'products'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'products'))
+
+
+class ProductAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.cat = Category.objects.create(name="Bikes")
+        cls.p = Product.objects.create(name="Racer", sku="R-1", category=cls.cat, brand="Trek", price=100, stock=5)
+        ProductImage.objects.create(product=cls.p, image="products/gallery/racer.png", renditions={'source': 'x'})
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:products_product_changelist')
+
+    def action(self, name, ids, **data):
+        return self.client.post(self.url, {'action': name, 'index': 0, '_selected_action': ids, **data})
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(self.url, {'all': ''}).status_code, 200)
+            return len(ctx)
+
+        small = queries()
+        for i in range(40):
+            cat = Category.objects.create(name=f"Cat {i}")
+            Product.objects.create(name=f"P{i}", sku=f"P-{i}", category=cat, brand=f"Brand {i}", price=1)
+        self.assertEqual(queries(), small)
+        resp = self.client.get(self.url, {'brand': 'brand 7'})
+        self.assertEqual(resp.context['cl'].result_count, 1)
+
+    def test_duplicate_in_bulk(self):
+        self.action('duplicate_products', [self.p.pk])
+        self.action('duplicate_products', [self.p.pk])
+        copies = Product.objects.filter(name="Racer (Copy)").order_by('pk')
+        self.assertEqual([c.sku for c in copies], ["R-1-COPY", "R-1-COPY-1"])
+        self.assertEqual([c.slug for c in copies], ["racer-copy", "racer-copy-1"])
+        self.assertEqual(copies[0].images.get().renditions, {'source': 'x'})
+        self.assertTrue(ProductCard.objects.filter(pk=copies[1].pk).exists())
+
+    def test_duplicate_fits_long_names_and_skus(self):
+        long = Product.objects.create(name="N" * 180, sku="S" * 80, category=self.cat, price=1)
+        for _ in range(2):
+            self.action('duplicate_products', [long.pk])
+        copies = Product.objects.filter(name__endswith=" (Copy)").order_by('pk')
+        self.assertEqual([c.sku for c in copies], ["S" * 70 + "-COPY", "S" * 70 + "-COPY-1"])
+        self.assertEqual(len(copies[0].name), 180)
+
+    def test_bulk_edit_percentage_and_flags(self):
+        other = Product.objects.create(name="Cruiser", sku="C-1", category=self.cat, price=Decimal('19.99'))
+        resp = self.action('bulk_edit_products', [self.p.pk, other.pk])
+        self.assertContains(resp, "Apply to 2 selected products")
+        self.action('bulk_edit_products', [self.p.pk, other.pk], apply='1', price_percent='-10', is_active='false')
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('price', 'stock', 'is_active')),
+            [(Decimal('90.00'), 5, False), (Decimal('17.99'), 0, False)],
+        )
+        self.assertFalse(ProductCard.objects.exists())
+
+    def test_bulk_edit_from_csv(self):
+        upload = SimpleUploadedFile('edits.csv', b"sku,price,stock\nR-1,120.50,\nZZZ,1,1\n")
+        self.action('bulk_edit_products', [self.p.pk], apply='1', csv_file=upload)
+        self.p.refresh_from_db()
+        self.assertEqual((self.p.price, self.p.stock), (Decimal('120.50'), 5))
+
+        bad = SimpleUploadedFile('edits.csv', b"sku,stock\nR-1,lots\n")
+        resp = self.action('bulk_edit_products', [self.p.pk], apply='1', csv_file=bad)
+        self.assertContains(resp, "line 2 (R-1)")
+
+    def test_change_form_uploads_gallery_together(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        p = self.p
+        data = {
+            'name': p.name, 'slug': p.slug, 'category': self.cat.pk, 'brand': p.brand, 'sku': p.sku,
+            'price': '100', 'stock': '5', 'is_active': 'on', 'created_at_0': '2024-01-01', 'created_at_1': '00:00:00',
+            'images-TOTAL_FORMS': '4', 'images-INITIAL_FORMS': '1', 'images-0-id': p.images.get().pk,
+            'images-0-product': p.pk, 'images-0-sort_order': '0',
+            'variations-TOTAL_FORMS': '0', 'variations-INITIAL_FORMS': '0',
+        }
+        for i in range(1, 4):
+            data[f'images-{i}-image'] = SimpleUploadedFile(f"new{i}.png", png_bytes(200, 100))
+            data[f'images-{i}-sort_order'] = str(i)
+        with self.settings(MEDIA_ROOT=tmp.name), mock.patch('products.admin.upload_images',
+                                                            side_effect=upload_images) as uploaded:
+            resp = self.client.post(reverse('admin:products_product_change', args=[p.pk]), data)
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(len(uploaded.call_args.args[0]), 3)
+        new = p.images.exclude(image="products/gallery/racer.png")
+        self.assertEqual([img.renditions['widths'] for img in new], [[160, 200]] * 3)
+
+
+@override_settings(CATALOG_BASE_URL='https://shop.example.com', CATALOG_FEEDS_PRECOMPUTED=False)
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cat = Category.objects.create(name="Bikes")
+        cls.plain = Product.objects.create(name="Racer & Co", sku="R-1", category=cat, brand="Trek",
+                                           price=90, mrp=100, stock=3, color="Red")
+        cls.sized = Product.objects.create(name="Cruiser", sku="C-1", category=cat, price=50)
+        Variation.objects.create(product=cls.sized, name="Small", sku="C-1-S", size="S")
+        Variation.objects.create(product=cls.sized, name="Large", sku="C-1-L", size="L")
+        Product.objects.create(name="Hidden", sku="H-1", category=cat, price=1, is_active=False)
+
+    def body(self, resp):
+        self.assertEqual(resp.status_code, 200)
+        return b''.join(resp.streaming_content).decode()
+
+    def test_sitemap_index_and_sections(self):
+        index = self.body(self.client.get('/sitemap.xml'))
+        self.assertIn('<loc>https://shop.example.com/sitemap-products-1.xml</loc>', index)
+        self.assertIn('<loc>https://shop.example.com/sitemap-variations-1.xml</loc>', index)
+
+        products = self.body(self.client.get('/sitemap-products-1.xml'))
+        self.assertEqual(products.count('<url>'), 2)
+        self.assertIn(f'https://shop.example.com/shop/{self.plain.slug}/</loc>', products)
+        variations = self.body(self.client.get('/sitemap-variations-1.xml'))
+        self.assertIn(f'/shop/{self.sized.slug}/small/</loc>', variations)
+        self.assertEqual(self.client.get('/sitemap-products-2.xml').status_code, 404)
+        self.assertEqual(self.client.get('/sitemap-users-1.xml').status_code, 404)
+
+    def test_section_pages_split_at_limit(self):
+        with mock.patch.object(feeds, 'SITEMAP_LIMIT', 1):
+            self.assertEqual(feeds.sitemap_pages(), [('products', 1), ('products', 2),
+                                                     ('variations', 1), ('variations', 2)])
+            second = ''.join(feeds.sitemap_section('https://x', 'products', 2))
+        self.assertIn(self.sized.slug, second)
+        self.assertNotIn(self.plain.slug, second)
+
+    def test_feed_items_group_variations(self):
+        items = {item['id']: item for item in feeds.feed_items('https://x')}
+        self.assertEqual(set(items), {'R-1', 'C-1-S', 'C-1-L'})
+        self.assertEqual((items['R-1']['price'], items['R-1']['sale_price']), ('100.00 INR', '90.00 INR'))
+        self.assertEqual(items['R-1']['availability'], 'in_stock')
+        self.assertEqual(items['C-1-S']['item_group_id'], 'C-1')
+        self.assertEqual((items['C-1-S']['title'], items['C-1-S']['size']), ("Cruiser - Small", 'S'))
+        self.assertEqual(items['C-1-L']['availability'], 'out_of_stock')
+
+    def test_feed_formats_stream(self):
+        with CaptureQueriesContext(connection) as ctx:
+            xml = self.body(self.client.get('/feeds/products.xml'))
+        self.assertIn('<g:title>Racer &amp; Co</g:title>', xml)
+        self.assertEqual(xml.count('<item>'), 3)
+        self.assertLessEqual(len(ctx), 4)  # products, images, variations, variation images
+        rows = self.body(self.client.get('/feeds/products.csv')).splitlines()
+        self.assertEqual(rows[0].split(',')[:2], ['id', 'item_group_id'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(self.client.get('/feeds/products.json').status_code, 404)
+
+    def test_precomputed_files(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with self.settings(MEDIA_ROOT=tmp.name, CATALOG_FEEDS_PRECOMPUTED=True):
+            self.assertEqual(self.client.get('/feeds/products.xml').status_code, 404)
+            call_command('build_feeds', stdout=StringIO())
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get('/feeds/products.xml', HTTP_ACCEPT_ENCODING='gzip, br')
+                raw = b''.join(resp.streaming_content)
+            self.assertEqual(len(ctx), 0)
+            self.assertEqual(resp['Content-Encoding'], 'gzip')
+            self.assertEqual(int(resp['Content-Length']), len(raw))
+            self.assertEqual(gzip.decompress(raw).count(b'<item>'), 3)
+            plain = self.body(self.client.get('/sitemap-products-1.xml'))
+            self.assertEqual(plain.count('<url>'), 2)
+
+
+class SuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bikes = Category.objects.create(name="Road Bikes")
+        Category.objects.create(name="Hidden Things", is_active=False)
+        Product.objects.create(name="Roadster Classic", sku="RC-1", category=bikes, brand="Royal Enfield",
+                               price=10, stock=0)
+        Product.objects.create(name="Road King", sku="RK-1", category=bikes, brand="Hero", price=10, stock=5)
+        Product.objects.create(name="Road Queen", sku="RQ-1", category=bikes, brand="Hero", price=10, stock=5,
+                               is_featured=True)
+        cls.helmet = Product.objects.create(name="Road Helmet Pro", sku="RH-1", category=bikes, brand="Hero",
+                                            price=10, stock=1)
+        Variation.objects.create(product=cls.helmet, name="Large", sku="RH-1-L")
+        Product.objects.create(name="Road Ghost", sku="RG-1", category=bikes, price=10, is_active=False)
+
+    def setUp(self):
+        suggest.reset()
+        self.addCleanup(suggest.reset)
+
+    def names(self, query, **kwargs):
+        return [p['name'] for p in suggest.suggestions(query, **kwargs)['products']]
+
+    def test_prefix_ranks_featured_then_in_stock(self):
+        self.assertEqual(self.names('ro'), ["Road Queen", "Road Helmet Pro", "Road King", "Roadster Classic"])
+        self.assertEqual(self.names('ROAD', limit=2), ["Road Queen", "Road Helmet Pro"])
+        self.assertEqual(self.names('road he'), ["Road Helmet Pro"])
+        self.assertEqual(self.names('pro road'), ["Road Helmet Pro"])
+        self.assertEqual(self.names('ghost'), [])
+        self.assertEqual(suggest.suggestions('  '), {'products': [], 'brands': [], 'categories': [], 'skus': []})
+
+    def test_brands_categories_and_skus(self):
+        data = suggest.suggestions('enf')
+        self.assertEqual(data['brands'], [{'name': "Royal Enfield", 'count': 1, 'url': '/shop/?brand=Royal+Enfield'}])
+        bikes = suggest.suggestions('bik')['categories']
+        self.assertEqual(bikes, [{'name': "Road Bikes", 'url': '/shop/?category=road-bikes'}])
+        self.assertEqual(suggest.suggestions('hidden')['categories'], [])
+
+        self.assertEqual(suggest.suggestions('rh-1-l')['skus'], [
+            {'sku': 'RH-1-L', 'name': "Road Helmet Pro - Large", 'url': f'/shop/{self.helmet.slug}/large/'},
+        ])
+        self.assertEqual(suggest.suggestions('RK-1')['skus'][0]['name'], "Road King")
+        self.assertEqual(suggest.suggestions('RG-1')['skus'], [])  # inactive
+
+    def test_keystrokes_do_not_query(self):
+        suggest.suggestions('r')
+        with self.assertNumQueries(0):
+            for typed in ('r', 'ro', 'roa', 'road', 'road k', 'her', 'RK-2'):
+                suggest.suggestions(typed)
+
+    def test_signals_patch_the_live_index(self):
+        suggest.suggestions('road')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('road'), ["Road Queen", "Road Helmet Pro", "Road King", "Roadster Classic"])
+        king = Product.objects.get(sku="RK-1")
+        king.name, king.is_featured = "Road Emperor", True
+        king.save()
+        Product.objects.create(name="Roadrunner", sku="RR-1", category=king.category, brand="Acme", price=1, stock=1)
+        Product.objects.filter(sku="RC-1").get().delete()
+        self.helmet.is_active = False
+        self.helmet.save()
+        Variation.objects.create(product=Product.objects.get(sku="RQ-1"), name="Blue", sku="RQ-1-B")
+
+        self.assertEqual(self.names('road'), ["Road Emperor", "Road Queen", "Roadrunner"])
+        self.assertEqual(self.names('road em'), ["Road Emperor"])
+        self.assertEqual(self.names('king'), [])
+        self.assertEqual(suggest.suggestions('acm')['brands'][0]['name'], "Acme")
+        self.assertEqual(suggest.suggestions('RQ-1-B')['skus'][0]['sku'], 'RQ-1-B')
+
+        Category.objects.create(name="Gravel")
+        self.assertEqual(suggest.suggestions('grav')['categories'][0]['name'], "Gravel")
+
+    def test_bulk_writes_rebuild_in_background(self):
+        index = suggest.get_suggest_index()
+        suggest.invalidate()
+        with mock.patch.object(suggest.threading, 'Thread') as thread:
+            self.assertIs(suggest.get_suggest_index(), index)  # the old one answers meanwhile
+            suggest.get_suggest_index()
+        thread.assert_called_once()
+        self.addCleanup(suggest._state.update, building=False, log=None)
+
+    def test_large_prefixes_are_exact(self):
+        rows = [(i, f"Widget {i} {'blue' if i % 3 else 'red'}", f"w-{i}", "", False, i % 2 == 0) for i in range(9000)]
+        index = SuggestIndex(rows, [], [])
+        best = index.products(['w'], 3)
+        self.assertEqual(best, [("Widget 0 red", "w-0"), ("Widget 10 blue", "w-10"), ("Widget 100 blue", "w-100")])
+        reds = index.products(['wid', 'r'], 4)
+        self.assertEqual([name for name, _ in reds], ["Widget 0 red", "Widget 1002 red", "Widget 1008 red",
+                                                      "Widget 1014 red"])
+
+    def test_endpoint(self):
+        url = reverse('products:api_suggest')
+        resp = self.client.get(url, {'q': 'road', 'limit': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('max-age=60', resp['Cache-Control'])
+        self.assertEqual([p['name'] for p in resp.json()['products']], ["Road Queen", "Road Helmet Pro"])
+        self.assertEqual(self.client.get(url, {'q': 'road', 'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+
+class WarmupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bikes = make_catalog(products=4, variations=1, images=0)
+        kids = Category.objects.create(name="Kids", parent=bikes)
+        Category.objects.create(name="Empty")
+        cls.star = Product.objects.create(name="Star", category=kids, sku="STAR", price=5, is_featured=True)
+
+    def setUp(self):
+        cache.clear()
+        suggest.reset()
+        self.addCleanup(suggest.reset)
+
+    def test_hot_paths(self):
+        self.assertEqual(warmup.hot_paths(categories=2, products=2), [
+            '/', '/shop/', '/shop/?category=bikes', '/shop/?category=kids', f'/shop/{self.star.slug}/', '/shop/bike-3/',
+        ])
+
+    def test_warm_leaves_nothing_for_the_first_requests(self):
+        steps = dict(warmup.warm())
+        self.assertIn('9 pages (9x200)', steps)  # home, shop, both non-empty categories, all 5 products
+        detail = reverse('products:product_detail', args=[self.star.slug])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/').status_code, 200)
+            self.assertEqual(self.client.get(detail).status_code, 200)
+            suggest.suggestions('bi')
+
+    def test_warm_cache_command(self):
+        out = StringIO()
+        call_command('warm_cache', '--products', '1', stdout=out)
+        self.assertIn("Warmed 5/5 pages", out.getvalue())
+        self.assertIn("suggest index", out.getvalue())
+
+    def test_urlconf_does_not_import_numpy(self):
+        # numpy (attributes, suggest, related) loads on first use or warm-up, not with the URLconf
+        probe = "import sys, django; django.setup(); import quesec.urls; print('numpy' in sys.modules)"
+        proc = subprocess.run([sys.executable, '-c', probe], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                              env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE})
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(proc.stdout.strip(), 'False')
+
+    def test_import_breakdown(self):
+        stderr = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:      1500 |       1500 |   environ.environ",
+            "--- app",
+            "import time:      2000 |       2500 |   numpy.core",
+            "import time:       500 |       2500 | numpy",
+            "import time:       250 |        250 | django.db",
+        ])
+        self.assertEqual(import_breakdown(stderr), {
+            'settings': {'environ': 1.5}, 'app': {'numpy': 2.5, 'django': 0.25},
+        })
 
-# Create your tests here.
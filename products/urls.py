@@ -1,10 +1,24 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, feeds, views
 
 app_name = 'products'
 
+# quesec.asgi turns CATALOG_ASYNC_VIEWS on; under WSGI the async views would only add overhead
+if settings.CATALOG_ASYNC_VIEWS:
+    product_list, product_detail = views.product_list_async, views.product_detail_async
+else:
+    product_list, product_detail = views.product_list, views.product_detail
+
 urlpatterns = [
-    path('shop/', views.product_list, name='product_list'),
-    path('shop/<slug:product_slug>/', views.product_detail, name='product_detail'),
-    path('shop/<slug:product_slug>/<slug:variation_slug>/', views.product_detail, name='product_detail_variation'),
+    path('shop/', product_list, name='product_list'),
+    path('shop/<slug:product_slug>/', product_detail, name='product_detail'),
+    path('shop/<slug:product_slug>/<slug:variation_slug>/', product_detail, name='product_detail_variation'),
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/products/batch/', api.product_batch, name='api_product_batch'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/suggest/', api.suggest, name='api_suggest'),
+    path('sitemap.xml', feeds.sitemap, name='sitemap'),
+    path('sitemap-<str:section>-<int:page>.xml', feeds.sitemap_page, name='sitemap_section'),
+    path('feeds/products.<str:fmt>', feeds.product_feed, name='product_feed'),
 ]
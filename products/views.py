@@ -1,68 +1,171 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
-from django.db.models import Q, Min, Max
-from .models import Product, Category, Variation
-
-def product_list(request):
-    qs = Product.objects.filter(is_active=True)
-
-    q = request.GET.get('q')
-    cat = request.GET.get('category')
-    brand = request.GET.get('brand')
-    minp = request.GET.get('min')
-    maxp = request.GET.get('max')
-    sort = request.GET.get('sort')
+from . import instrumentation
+from .cache import detail_cache_key
+from .categories import get_category_tree
+from .conditional import conditional_page, detail_validators, listing_validators
+from .facets import get_facets
+from .filters import filter_cards, get_filters, sort_products
+from .models import Product, RelatedProduct, Variation
+from .pagination import KEYSET_ORDERINGS, KeysetPaginator
 
-    if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(brand__icontains=q) | Q(short_description__icontains=q))
-    if cat:
-        qs = qs.filter(category__slug=cat)
-    if brand:
-        qs = qs.filter(brand__iexact=brand)
-    if minp:
-        qs = qs.filter(price__gte=minp)
-    if maxp:
-        qs = qs.filter(price__lte=maxp)
-    if sort == 'price_asc':
-        qs = qs.order_by('price')
-    elif sort == 'price_desc':
-        qs = qs.order_by('-price')
-    elif sort == 'featured':
-        qs = qs.order_by('-is_featured', '-created_at')
-    else:
-        qs = qs.order_by('-created_at')
+def _listing_page(request, filters, sort):
+    # ProductCard rows carry everything a card shows: no joins, no prefetches
+    qs = sort_products(filter_cards(filters), sort, filters['q'])
 
-    paginator = Paginator(qs, 12)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    # relevance has no stable seek key, so it always uses numbered pages
+    if settings.SHOP_PAGINATION == 'cursor' and sort != 'relevance':
+        ordering = KEYSET_ORDERINGS.get(sort, KEYSET_ORDERINGS[None])
+        paginator = KeysetPaginator(qs, 12, ordering, with_total=settings.SHOP_APPROX_TOTAL)
+        return paginator.get_page(request.GET.get('cursor'))
+    page_obj = Paginator(qs, 12).get_page(request.GET.get('page'))
+    page_obj.object_list = list(page_obj.object_list)  # evaluate here, not in the template
+    return page_obj
 
-    price_range = Product.objects.filter(is_active=True).aggregate(min_price=Min('price'), max_price=Max('price'))
-    categories = Category.objects.filter(is_active=True).order_by('name').select_related('parent')
+def _listing_context(request, filters, sort, page_obj, facets):
+    # current filters without page/cursor, for building pagination links
+    filter_query = request.GET.copy()
+    filter_query.pop('page', None)
+    filter_query.pop('cursor', None)
+    # in-process search annotates how many products matched; worth saying when it returned fewer
+    matches = getattr(next(iter(page_obj.object_list), None), 'search_matches', None)
 
-    ctx = {
+    return {
         'page_obj': page_obj,
-        'categories': categories,
-        'price_range': price_range,
-        'active_filters': {'q': q, 'category': cat, 'brand': brand, 'min': minp, 'max': maxp, 'sort': sort},
+        'search_matches': matches if matches and matches > settings.SEARCH_MAX_RESULTS > 0 else None,
+        'search_max_results': settings.SEARCH_MAX_RESULTS,
+        'categories': facets['categories'],
+        'brands': facets['brands'],
+        'colors': facets['colors'],
+        'sizes': facets['sizes'],
+        'price_range': facets['price_range'],
+        'price_buckets': facets['price_buckets'],
+        'active_filters': dict(filters, sort=sort),
+        'filter_query': filter_query.urlencode(),
     }
+
+@conditional_page(listing_validators)
+def product_list(request):
+    filters = get_filters(request.GET)
+    sort = request.GET.get('sort')
+    page_obj = _listing_page(request, filters, sort)
+    ctx = _listing_context(request, filters, sort, page_obj, get_facets(filters))
     return render(request, 'products/shop_list.html', ctx)
 
+@conditional_page(detail_validators)
 def product_detail(request, product_slug, variation_slug=None):
-    product = get_object_or_404(Product.objects.select_related('category'), slug=product_slug, is_active=True)
+    # Whole rendered page is cached; the key changes whenever the product, its
+    # variations/images or any catalog row change (see products.cache).
+    key = detail_cache_key(product_slug, variation_slug)
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content)
+    response = _render_product_detail(request, product_slug, variation_slug)
+    cache.set(key, response.content, settings.DETAIL_CACHE_TIMEOUT)
+    return response
+
+def _detail_product(product_slug):
+    return get_object_or_404(
+        Product.objects.select_related('category').prefetch_related('images'),
+        slug=product_slug, is_active=True,
+    )
 
-    # Select variation (optional)
-    variations_qs = product.variations.all().order_by('name')
-    selected_variation = None
+def _select_variation(variations, variation_slug):
     if variation_slug:
-        selected_variation = get_object_or_404(variations_qs, slug=variation_slug)
-    elif variations_qs.exists():
-        selected_variation = variations_qs.first()
+        selected = next((v for v in variations if v.slug == variation_slug), None)
+        if selected is None:
+            raise Http404("No Variation matches the given query.")
+    else:
+        selected = variations[0] if variations else None
+    if selected:
+        prefetch_related_objects([selected], 'images')
+    return selected
+
+def _indexed_related(**product_lookup):
+    # precomputed by products.related
+    return [
+        entry.related for entry in
+        RelatedProduct.objects.filter(**product_lookup, related__is_active=True).select_related('related')
+    ]
 
-    related = Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:8]
+def _live_related(product):
+    # only until the index covers this product
+    return list(Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:8])
 
-    ctx = {
+def _detail_context(product, variations, selected_variation, related):
+    return {
         'product': product,
+        'breadcrumbs': get_category_tree().breadcrumbs(product.category_id),
         'selected_variation': selected_variation,
-        'variations': variations_qs,
+        'variations': variations,
         'related': related,
     }
+
+def _render_product_detail(request, product_slug, variation_slug):
+    product = _detail_product(product_slug)
+    variations = list(product.variations.all().order_by('name'))
+    selected_variation = _select_variation(variations, variation_slug)
+    related = _indexed_related(product=product) or _live_related(product)
+    ctx = _detail_context(product, variations, selected_variation, related)
     return render(request, 'products/product_detail.html', ctx)
+
+# ---------------- async versions (CATALOG_ASYNC_VIEWS, served by quesec.asgi) ----------------
+
+def _concurrently(func, *args, **kwargs):
+    """
+    Run blocking ORM work on a pool thread with its own DB connection, so
+    several can be awaited together. Django's async ORM methods (aget,
+    acount, ...) all funnel through one thread per request, so gathering
+    them would still run the queries one after another.
+    """
+    def run():
+        try:
+            with instrumentation.counting_queries():  # the request's context, this thread's connections
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()  # pool threads never see request_finished
+    return sync_to_async(run, thread_sensitive=False)()
+
+@conditional_page(listing_validators)
+async def product_list_async(request):
+    filters = get_filters(request.GET)
+    sort = request.GET.get('sort')
+    # the page (count + rows) and the sidebar facets are independent
+    page_obj, facets = await asyncio.gather(
+        _concurrently(_listing_page, request, filters, sort),
+        _concurrently(get_facets, filters),
+    )
+    ctx = _listing_context(request, filters, sort, page_obj, facets)
+    return await sync_to_async(render)(request, 'products/shop_list.html', ctx)
+
+@conditional_page(detail_validators)
+async def product_detail_async(request, product_slug, variation_slug=None):
+    key = await sync_to_async(detail_cache_key)(product_slug, variation_slug)
+    content = await cache.aget(key)
+    if content is not None:
+        return HttpResponse(content)
+    response = await _arender_product_detail(request, product_slug, variation_slug)
+    await cache.aset(key, response.content, settings.DETAIL_CACHE_TIMEOUT)
+    return response
+
+async def _arender_product_detail(request, product_slug, variation_slug):
+    # product (+gallery), variations and the related index only share the slug
+    product, variations, related = await asyncio.gather(
+        _concurrently(_detail_product, product_slug),
+        _concurrently(lambda: list(Variation.objects.filter(product__slug=product_slug).order_by('name'))),
+        _concurrently(_indexed_related, product__slug=product_slug),
+    )
+    selected_variation, related = await asyncio.gather(
+        _concurrently(_select_variation, variations, variation_slug),
+        _concurrently(_live_related, product) if not related else asyncio.sleep(0, related),
+    )
+    ctx = await sync_to_async(_detail_context)(product, variations, selected_variation, related)
+    return await sync_to_async(render)(request, 'products/product_detail.html', ctx)
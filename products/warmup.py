@@ -0,0 +1,145 @@
+"""
+Cache warm-up for fresh processes and fresh deploys. A new worker otherwise
+pays, on its first requests, for importing the URLconf and views, compiling
+templates, loading the static manifest and building the in-process indexes
+(facet attributes, search, suggestions); with an empty cache those requests
+also rebuild facets, detail pages and the home snapshot.
+
+``warm()`` does all of that up front: the per-process part directly, the
+shared-cache part by requesting the hottest pages (home, /shop/, the largest
+categories, the top products) through a WSGI handler. gunicorn.conf.py runs
+it in the master before workers are forked; ``manage.py warm_cache`` runs it
+after a deploy to fill a shared cache.
+"""
+import io
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.handlers.wsgi import WSGIHandler
+from django.db.models import Count
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+from django.utils.http import urlencode
+
+from . import attributes, suggest
+from .categories import get_category_tree
+from .models import Product
+from .search import get_search_backend
+
+
+def _host():
+    # a host the site accepts; pages don't embed it, so cached entries are the same for every host
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def fetch(app, path):
+    """
+    GET ``path`` (may carry a query string) through the WSGI ``app``.
+    Returns (status code, ms to the first body byte, ms to the last).
+    """
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': _host(), 'SERVER_PORT': '80', 'HTTP_HOST': _host(), 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_ACCEPT_ENCODING': 'gzip, br', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': False,
+        'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    status = []
+    started = time.perf_counter()
+    body = app(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+    first_byte = None
+    try:
+        for chunk in body:
+            if chunk and first_byte is None:
+                first_byte = time.perf_counter()
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    done = time.perf_counter()
+    return status[0], ((first_byte or done) - started) * 1000, (done - started) * 1000
+
+
+def hot_paths(categories=None, products=None):
+    """
+    Home, /shop/, the ``categories`` largest categories (counting their
+    subcategories' products) and the ``products`` top product pages
+    (featured, then newest), as the listing shows them.
+    """
+    categories = settings.WARMUP_CATEGORIES if categories is None else categories
+    products = settings.WARMUP_PRODUCTS if products is None else products
+    shop = reverse('products:product_list')
+    paths = [reverse('home'), shop]
+
+    tree = get_category_tree()
+    counts = dict(Product.objects.filter(is_active=True).order_by().values_list('category').annotate(n=Count('pk')))
+    totals = tree.rollup(counts)
+    largest = sorted((pk for pk in totals if pk in tree.by_id), key=lambda pk: (-totals[pk], pk))[:categories]
+    paths += [f"{shop}?{urlencode({'category': tree.by_id[pk]['slug']})}" for pk in largest]
+
+    top = Product.objects.filter(is_active=True).order_by('-is_featured', '-created_at', '-pk')
+    paths += [reverse('products:product_detail', args=[slug]) for slug in top.values_list('slug', flat=True)[:products]]
+    return paths
+
+
+def _project_templates():
+    """Every template under TEMPLATES DIRS except admin overrides (the admin isn't latency-sensitive)."""
+    for directory in engines['django'].engine.dirs:
+        for path in sorted(directory.rglob('*.html')):
+            name = path.relative_to(directory).as_posix()
+            if not name.startswith('admin/'):
+                yield name
+
+
+def warm_process():
+    """Per-process state; returns [(step, ms)]."""
+    steps = [
+        ('urlconf', lambda: get_resolver().reverse_dict),
+        ('templates', lambda: [get_template(name) for name in _project_templates()]),
+        ('static manifest', lambda: getattr(staticfiles_storage, 'manifest_hash', None)),
+        ('category tree', get_category_tree),
+        ('attribute index', attributes.get_attribute_index),
+        # the in-process backend builds on its first search; Postgres has nothing to load
+        ('search index', lambda: get_search_backend().search(Product.objects.none(), 'warm')),
+        ('suggest index', suggest.get_suggest_index),
+    ]
+    return [(name, _timed(step)) for name, step in steps]
+
+
+def warm_pages(app=None, paths=None):
+    """Request ``paths`` (default: hot_paths()) through ``app``; returns [(path, status, ms)]."""
+    app = app if isinstance(app, WSGIHandler) else WSGIHandler()
+    results = []
+    for path in hot_paths() if paths is None else paths:
+        status, _, total = fetch(app, path)
+        results.append((path, status, total))
+    return results
+
+
+def warm(app=None, paths=None):
+    """
+    warm_process() then warm_pages(); ``app`` is the WSGI handler that will
+    serve traffic, so its middleware instances warm up too (others, e.g. the
+    ASGI handler, get a separate WSGI handler for the pages).
+    """
+    started = time.perf_counter()
+    steps = warm_process()
+    pages = warm_pages(app, paths)
+    statuses = Counter(status for _, status, _ in pages)
+    steps.append((f"{len(pages)} pages ({', '.join(f'{n}x{s}' for s, n in sorted(statuses.items()))})",
+                  sum(ms for _, _, ms in pages)))
+    steps.append(('total', (time.perf_counter() - started) * 1000))
+    return steps
+
+
+def _timed(step):
+    started = time.perf_counter()
+    step()
+    return (time.perf_counter() - started) * 1000
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quesec.settings')
+# serve /shop/ with the async catalog views (see products.views)
+os.environ.setdefault('CATALOG_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -0,0 +1,153 @@
+"""
+Read replicas for the catalog. Reads of the apps in REPLICA_APPS go to one
+of the DB_REPLICA_URLS aliases (``replica1``, ``replica2``, ...), picked
+once per request; everything else, every write and every read inside a
+transaction on the primary uses ``default``.
+
+Read-your-writes: the first write in a request pins the rest of it to the
+primary, and ReplicaPinMiddleware sets a cookie that keeps that browser
+on the primary for DB_REPLICA_PIN_SECONDS, long enough for the replicas to
+replay the change. Unsafe methods and the admin are always pinned.
+
+Caches: pages, facets and indexes rebuilt under a new catalog version must
+not be read from a replica that hasn't replayed the write behind the bump,
+or they'd hold the old rows under the new key until it is bumped again. So
+products.cache calls hold_replicas() on every bump, and for the next
+DB_REPLICA_PIN_SECONDS every process reads the catalog from the primary.
+"""
+import random
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+from django.urls import NoReverseMatch, reverse
+
+PIN_COOKIE = 'dbpin'
+HOLD_KEY = 'db-routing:hold-replicas'
+REPLICA_APPS = {'products'}
+
+
+class _Routing:
+    """Per-request routing state; mutated in place so pool threads' changes are seen by the request."""
+
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_PROCESS = _Routing()  # outside requests (management commands, shells): pinned by the first write
+_state = ContextVar('db_routing', default=None)
+
+
+def _current():
+    return _state.get() or _PROCESS
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def pin_to_primary():
+    """Send the remaining reads of this request (or process, outside one) to the primary."""
+    _current().pinned = True
+
+
+def hold_replicas():
+    """
+    Once the current transaction commits, send every process's catalog reads
+    to the primary for DB_REPLICA_PIN_SECONDS (through the shared cache).
+    """
+    if replica_aliases():
+        transaction.on_commit(lambda: cache.set(HOLD_KEY, True, settings.DB_REPLICA_PIN_SECONDS))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current()
+        if state.pinned or model._meta.app_label not in REPLICA_APPS:
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'  # the transaction may have written already
+        if state.replica is None:
+            aliases = replica_aliases()
+            if not aliases:
+                return 'default'
+            # a replica may still lag behind the last bump: anything read now may be cached under it
+            state.replica = 'default' if cache.get(HOLD_KEY) else random.choice(aliases)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current()
+        state.pinned = state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'  # replicas get the schema through replication
+
+
+@lru_cache(maxsize=1)
+def _admin_prefix():
+    try:
+        return reverse('admin:index')
+    except NoReverseMatch:
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Starts the routing state of each request: pinned for unsafe methods, the
+    admin and browsers holding the pin cookie; sets that cookie after a
+    request that wrote. Enabled when DB_REPLICA_URLS names any replica.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        admin = _admin_prefix()
+        pinned = (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or PIN_COOKIE in request.COOKIES
+            or (admin is not None and request.path.startswith(admin))
+        )
+        state = _Routing(pinned)
+        return state, _state.set(state)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DB_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            return self._finish(state, self.get_response(request))
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            return self._finish(state, await self.get_response(request))
+        finally:
+            _state.reset(token)
@@ -0,0 +1,83 @@
+"""
+Media storages that memoize url(). Templates ask for the same names over
+and over (a card grid resolves every srcset width in two formats); with
+S3 each of those is a botocore URL build. URLs are kept per process, keyed
+by name, dropped when that name is saved or deleted here and, for signed
+URLs, well before the signature expires.
+
+MemoizedS3Storage is built on first access, so boto3/botocore are imported
+only where STORAGES actually names it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+
+URL_CACHE_SIZE = 20_000  # names per process
+
+
+class MemoizedURLMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._urls = OrderedDict()  # name -> (url, expires at or None), oldest first
+        self._urls_lock = threading.Lock()
+
+    def _url_ttl(self):
+        if getattr(self, 'querystring_auth', False):
+            return self.querystring_expire / 2
+        return None
+
+    def url(self, name, *args, **kwargs):
+        if args or kwargs:  # per-call parameters (expire, http_method, ...) are not memoized
+            return super().url(name, *args, **kwargs)
+        now = time.monotonic()
+        hit = self._urls.get(name)
+        if hit is not None and (hit[1] is None or hit[1] > now):
+            return hit[0]
+        url = super().url(name)
+        ttl = self._url_ttl()
+        with self._urls_lock:
+            self._urls[name] = (url, now + ttl if ttl else None)
+            self._urls.move_to_end(name)
+            while len(self._urls) > URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        return url
+
+    def forget_url(self, name):
+        with self._urls_lock:
+            self._urls.pop(name, None)
+
+    def save(self, name, content, max_length=None):
+        saved = super().save(name, content, max_length=max_length)
+        self.forget_url(saved)
+        return saved
+
+    def delete(self, name):
+        super().delete(name)
+        self.forget_url(name)
+
+
+class MemoizedFileSystemStorage(MemoizedURLMixin, FileSystemStorage):
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting in ('MEDIA_ROOT', 'MEDIA_URL'):
+            with self._urls_lock:
+                self._urls.clear()
+
+
+def __getattr__(name):
+    if name != 'MemoizedS3Storage':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        from storages.backends.s3boto3 import S3Boto3Storage
+    except (ImportError, ImproperlyConfigured) as exc:  # boto3 is only installed where media lives on S3
+        raise AttributeError(f"MemoizedS3Storage needs django-storages[s3]: {exc}") from exc
+
+    global MemoizedS3Storage
+
+    class MemoizedS3Storage(MemoizedURLMixin, S3Boto3Storage):
+        pass
+
+    return MemoizedS3Storage
@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 # ---------------------- Paths ----------------------
 BASE_DIR = Path(__file__).resolve().parent.parent      # /.../src/quesec
@@ -15,7 +16,8 @@ if not env_file.exists():
     alt = REPO_DIR / ".env"
     if alt.exists():
         env_file = alt
-environ.Env.read_env(env_file)
+if env_file.exists():  # containers usually set the environment directly
+    environ.Env.read_env(env_file)
 
 # ---------------------- Core -----------------------
 SECRET_KEY = env("SECRET_KEY", default="dev-change-me")
@@ -38,7 +40,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # no-op unless PERF_INSTRUMENTATION is on; first so it times everything below
+    "products.instrumentation.InstrumentationMiddleware",
+    # no-op without read replicas; read-your-writes pinning for quesec.db_router
+    "quesec.db_router.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # serves STATIC_ROOT when SERVE_STATIC is on (see quesec.static_pipeline)
+    "quesec.static_pipeline.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -81,6 +89,48 @@ DATABASES = {
         "CONN_MAX_AGE": 60,
     }
 }
+# DATABASE_URL (e.g. sqlite:///bench.sqlite3, postgres://u:p@host/db) overrides the
+# DB_* values above; handy for running tests/benchmarks without a Postgres server
+if env("DATABASE_URL", default=""):
+    DATABASES["default"] = env.db("DATABASE_URL")
+    DATABASES["default"].setdefault("CONN_MAX_AGE", 60)
+
+# Comma-separated read-replica URLs -> aliases replica1, replica2, ...; catalog reads
+# go there (quesec.db_router). Locally, copies of a SQLite file stand in for them.
+for i, url in enumerate(env.list("DB_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f"replica{i}"] = {**env.db_url_config(url), "CONN_MAX_AGE": 60, "TEST": {"MIRROR": "default"}}
+if len(DATABASES) > 1:
+    DATABASE_ROUTERS = ["quesec.db_router.ReplicaRouter"]
+# after a write, that browser (and, after a catalog version bump, every process)
+# reads from the primary for this long (replica lag)
+DB_REPLICA_PIN_SECONDS = env.int("DB_REPLICA_PIN_SECONDS", default=5)
+
+# Postgres connection pool per worker process and alias (psycopg[pool]); 0 keeps
+# one persistent connection per thread (CONN_MAX_AGE). A pool caps connections at
+# workers x DB_POOL_SIZE however many threads the async views use.
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", default=0)
+# seconds a request waits for a free pooled connection before erroring
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", default=10)
+if DB_POOL_SIZE:
+    for _db in DATABASES.values():
+        if _db["ENGINE"] == "django.db.backends.postgresql":
+            _db.setdefault("OPTIONS", {})["pool"] = {
+                "min_size": 1, "max_size": DB_POOL_SIZE, "timeout": DB_POOL_TIMEOUT,
+            }
+            _db["CONN_MAX_AGE"] = 0  # Django rejects persistent connections with a pool
+
+# ---------------------- Cache ----------------------
+# e.g. CACHE_URL=rediscache://127.0.0.1:6379/1. The catalog/product version
+# counters (products.cache) live here and every page, facet and snapshot cache
+# is keyed by them, so with several workers the cache must be shared: with a
+# per-process one, a write would only invalidate the worker that made it.
+# DEBUG (runserver, one process) falls back to per-process memory.
+if DEBUG:
+    CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+else:
+    CACHES = {"default": env.cache("CACHE_URL")}
+    if CACHES["default"]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+        raise ImproperlyConfigured("CACHE_URL must name a shared cache (Redis, memcached) when DEBUG is off")
 
 # ---------------------- i18n -----------------------
 LANGUAGE_CODE = "en-us"
@@ -109,6 +159,20 @@ for p in (_repo_assets, _templates_assets):
     if p.exists():
         STATICFILES_DIRS.append(p)
 
+# collectstatic writes content-hashed names plus .br/.gz/.webp siblings
+STATIC_PIPELINE = env.bool("STATIC_PIPELINE", default=not DEBUG)
+# serve STATIC_ROOT from Django itself (immutable caching, encoding negotiation)
+SERVE_STATIC = env.bool("SERVE_STATIC", default=not DEBUG)
+
+STORAGES = {
+    # url() memoized per name; replaced by the S3 variant below when DEBUG is off
+    "default": {"BACKEND": "quesec.media_storage.MemoizedFileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "quesec.static_pipeline.CompressedManifestStaticFilesStorage"
+        if STATIC_PIPELINE else "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 # --------------------------------
 # Media: local when DEBUG=True, S3 when DEBUG=False
 
@@ -118,7 +182,8 @@ if DEBUG:
     MEDIA_ROOT = PROJECT_DIR / "media"
 else:
     # --------- S3 (django-storages) ----------
-    DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
+    # S3Boto3Storage with url() memoized per name (quesec.media_storage)
+    STORAGES["default"] = {"BACKEND": "quesec.media_storage.MemoizedS3Storage"}
 
     AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
     AWS_S3_REGION_NAME      = env("AWS_S3_REGION_NAME", default="ap-south-1")
@@ -142,6 +207,77 @@ else:
         # standard S3 virtual-hosted–style URL
         MEDIA_URL = f"https://{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazonaws.com/"
 
+# ---------------------- Catalog --------------------
+# "page" = numbered pages (OFFSET + COUNT), "cursor" = keyset pagination
+SHOP_PAGINATION = env("SHOP_PAGINATION", default="page")
+# cursor mode only: show a planner-estimated total (Postgres), never COUNT(*)
+SHOP_APPROX_TOTAL = env.bool("SHOP_APPROX_TOTAL", default=True)
+# dotted path to a search backend; empty = Postgres full-text if available,
+# else the in-process index (products.search.InMemorySearchBackend)
+PRODUCT_SEARCH_BACKEND = env("PRODUCT_SEARCH_BACKEND", default="")
+# in-process index only: a search returns its best this-many matches (0 = all;
+# each one is a bound SQL parameter). Listing pages and facet counts then cover
+# those alone, and the listing says "best N of M matches"
+SEARCH_MAX_RESULTS = env.int("SEARCH_MAX_RESULTS", default=1000)
+# sidebar facets are keyed by catalog version, so this only bounds memory use
+FACET_CACHE_TIMEOUT = env.int("FACET_CACHE_TIMEOUT", default=60 * 60 * 24)
+# rendered product pages, also version-keyed; 0 disables the page cache
+DETAIL_CACHE_TIMEOUT = env.int("DETAIL_CACHE_TIMEOUT", default=60 * 60 * 24)
+# browser/CDN freshness (seconds) for /shop/ pages; they always carry ETag and
+# Last-Modified, so 0 still means a cheap 304 revalidation, not a refetch
+CATALOG_MAX_AGE = env.int("CATALOG_MAX_AGE", default=0)
+# route /shop/ pages to the async views, which run their independent queries
+# concurrently (one pool thread + DB connection each); quesec.asgi turns it on
+CATALOG_ASYNC_VIEWS = env.bool("CATALOG_ASYNC_VIEWS", default=False)
+# build thumb/card/detail/zoom WebP+JPEG renditions when an image is uploaded
+# (existing files: manage.py generate_derivatives)
+IMAGE_DERIVATIVES_ON_SAVE = env.bool("IMAGE_DERIVATIVES_ON_SAVE", default=True)
+# threads uploading media concurrently: an image's renditions, and the new
+# gallery files of one admin save (with S3 each upload is a network round trip)
+MEDIA_UPLOAD_THREADS = env.int("MEDIA_UPLOAD_THREADS", default=8)
+# refresh the precomputed related-products rows of a product, and of those
+# listing it, when its price, category, brand or active flag changes; other
+# products only start listing it after a full build_related_products
+RELATED_PRODUCTS_INCREMENTAL = env.bool("RELATED_PRODUCTS_INCREMENTAL", default=True)
+# /api/suggest/ prefix index: rebuilt in the background once older than this
+# (seconds; picks up other processes' writes), 0 = only this process's signals
+SUGGEST_MAX_AGE = env.int("SUGGEST_MAX_AGE", default=300)
+# browser/CDN freshness of suggestion responses
+SUGGEST_CACHE_MAX_AGE = env.int("SUGGEST_CACHE_MAX_AGE", default=60)
+# pages warmed by manage.py warm_cache and by each gunicorn master before it forks
+# workers (products.warmup): home, /shop/, the N largest categories' listings and
+# the top N (featured, then newest) product pages
+WARMUP_CATEGORIES = env.int("WARMUP_CATEGORIES", default=10)
+WARMUP_PRODUCTS = env.int("WARMUP_PRODUCTS", default=50)
+# scheme + host for sitemap <loc>s and feed links, e.g. "https://shop.example.com";
+# empty = taken from the request (manage.py build_feeds then needs --base-url)
+CATALOG_BASE_URL = env("CATALOG_BASE_URL", default="")
+# ISO 4217 code appended to shopping-feed prices
+CATALOG_CURRENCY = env("CATALOG_CURRENCY", default="INR")
+CATALOG_FEED_TITLE = env("CATALOG_FEED_TITLE", default="Quesec products")
+# serve /sitemap*.xml and /feeds/products.* from the gzip files manage.py
+# build_feeds writes to media storage instead of streaming them from the DB
+CATALOG_FEEDS_PRECOMPUTED = env.bool("CATALOG_FEEDS_PRECOMPUTED", default=False)
+
+# ---------------------- Rendering ----------------
+# {% invariant %} blocks of base.html (head, mega-menu, footer) render once per
+# process instead of on every page (products.templatetags.render_cache)
+LAYOUT_RENDER_CACHE = env.bool("LAYOUT_RENDER_CACHE", default=True)
+# anonymous visitors get / as a pre-rendered, pre-compressed snapshot, rebuilt
+# when the templates, static manifest or catalog change (quesec.snapshots)
+HOME_SNAPSHOT = env.bool("HOME_SNAPSHOT", default=True)
+
+# ---------------------- Instrumentation ------------
+# per-request query count, DB/template/cache time as a Server-Timing header,
+# plus rolling per-view histograms (manage.py dump_perf_stats)
+PERF_INSTRUMENTATION = env.bool("PERF_INSTRUMENTATION", default=False)
+# requests slower than this are logged (products.instrumentation) with their SQL
+PERF_SLOW_REQUEST_MS = env.int("PERF_SLOW_REQUEST_MS", default=500)
+# requests kept per URL name, per process
+PERF_HISTOGRAM_SIZE = env.int("PERF_HISTOGRAM_SIZE", default=1000)
+# how often each worker copies its histograms into the cache for dump_perf_stats
+PERF_PUBLISH_SECONDS = env.int("PERF_PUBLISH_SECONDS", default=30)
+
 # ---------------------- Security (prod-friendly) ---
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 SESSION_COOKIE_SECURE = not DEBUG
@@ -0,0 +1,116 @@
+"""
+Pre-rendered pages for anonymous visitors. A snapshot is the template
+rendered once, without a request, plus its gzip/Brotli encodings; it is
+keyed by a digest of the template sources (and whatever they extend or
+include), the static manifest and the catalog version, so a deploy, a
+collectstatic or a catalog write all lead to a fresh one. Snapshots live
+in the process and in the shared cache, like the facet index.
+
+Templates rendered this way must not depend on the request: they see no
+``request``/``user``/``messages``. ``{% csrf_token %}`` is the exception;
+it renders a placeholder swapped for the visitor's token when served (such
+pages are then sent uncompressed).
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from products.cache import catalog_version
+
+from .static_pipeline import _accepts, brotli_bytes, gzip_bytes
+
+CSRF_PLACEHOLDER = 'snapshot-csrf-token-placeholder'
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+_local = {}  # template name -> Snapshot
+_lock = threading.Lock()
+
+
+class Snapshot:
+    __slots__ = ('key', 'etag', 'body', 'encoded', 'needs_csrf')
+
+    def __init__(self, key, html):
+        self.key = key
+        self.body = html.encode()
+        self.etag = quote_etag(hashlib.md5(self.body).hexdigest())
+        self.needs_csrf = CSRF_PLACEHOLDER.encode() in self.body
+        self.encoded = []  # [(encoding, bytes)] in preference order
+        if not self.needs_csrf:
+            for encoding, make in (('br', brotli_bytes), ('gzip', gzip_bytes)):
+                data = make(self.body)
+                if data is not None:
+                    self.encoded.append((encoding, data))
+
+
+def _sources(template, engine, seen):
+    """Source text of ``template`` and of every constant-named template it extends or includes."""
+    yield template.source
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        expr = node.parent_name if isinstance(node, ExtendsNode) else node.template
+        name = expr.var if isinstance(expr.var, str) else None
+        if name and name not in seen:
+            seen.add(name)
+            yield from _sources(engine.get_template(name), engine, seen)
+
+
+def _digest(template):
+    # once per compiled template; a template edit recompiles and so re-digests
+    django_template = template.template
+    digest = getattr(django_template, 'snapshot_digest', None)
+    if digest is None:
+        sources = _sources(django_template, django_template.engine, {django_template.origin.template_name})
+        digest = hashlib.md5('\0'.join(sources).encode()).hexdigest()
+        django_template.snapshot_digest = digest
+    return digest
+
+
+def get_snapshot(template_name):
+    template = get_template(template_name)
+    manifest = getattr(staticfiles_storage, 'manifest_hash', '')
+    key = f'snapshot:{template_name}:{_digest(template)}:{manifest}:{catalog_version()}'
+    snapshot = _local.get(template_name)
+    if snapshot is None or snapshot.key != key:
+        with _lock:
+            snapshot = _local.get(template_name)
+            if snapshot is None or snapshot.key != key:
+                snapshot = cache.get(key)
+                if snapshot is None:
+                    snapshot = Snapshot(key, template.render({'csrf_token': CSRF_PLACEHOLDER}))
+                    cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+                _local[template_name] = snapshot
+    return snapshot
+
+
+def snapshot_response(request, template_name):
+    """The snapshot of ``template_name`` as a 200 (or 304), in the best encoding the client takes."""
+    snapshot = get_snapshot(template_name)
+    if not snapshot.needs_csrf:
+        not_modified = get_conditional_response(request, etag=snapshot.etag)
+        if not_modified is not None:
+            return not_modified
+    body, encoding = snapshot.body, None
+    if snapshot.needs_csrf:
+        body = body.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    else:
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding, body = next(
+            ((enc, data) for enc, data in snapshot.encoded if _accepts(accept_encoding, enc)), (None, body),
+        )
+    response = HttpResponse(body)
+    response['Content-Length'] = len(body)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if not snapshot.needs_csrf:
+        response['ETag'] = snapshot.etag
+    # signed-in visitors get a live render of the same URL
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
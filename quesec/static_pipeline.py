@@ -0,0 +1,245 @@
+"""
+Static asset pipeline: content-hashed names, gzip/Brotli and WebP siblings
+written at collectstatic time, and a middleware that serves STATIC_ROOT from
+the Django process with far-future caching and content negotiation.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+from io import BytesIO
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional; without it only .gz siblings are written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico', '.ttf', '.otf', '.eot')
+# a sibling is only kept if it saves at least this fraction of the original
+MIN_SAVING = 0.05
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # preference order
+
+
+def _smaller(data, original):
+    return data if len(data) <= len(original) * (1 - MIN_SAVING) else None
+
+
+def gzip_bytes(data):
+    return _smaller(gzip.compress(data, compresslevel=9, mtime=0), data)
+
+
+def brotli_bytes(data):
+    return _smaller(brotli.compress(data, quality=11), data) if brotli else None
+
+
+def webp_bytes(data):
+    """Lossless WebP of a PNG, or None if it isn't smaller (or isn't a readable image)."""
+    from PIL import Image  # only collectstatic needs Pillow, not every web process
+
+    try:
+        img = Image.open(BytesIO(data))
+        img.load()
+    except OSError:
+        return None
+    buf = BytesIO()
+    img.save(buf, 'WEBP', lossless=True, method=6)
+    return _smaller(buf.getvalue(), data)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes, next to every collected file,
+    <name>.br / <name>.gz for text assets and <name>.webp for PNGs whenever
+    they come out smaller. StaticFilesMiddleware picks them per request.
+    """
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # a url() in some vendored CSS pointing at a file we don't ship
+            logger.warning("Static reference to missing file %s left unhashed", name)
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        self._derived = {}  # unhashed and hashed copies share content: derive once
+        for name in sorted(set(self.hashed_files) | set(self.hashed_files.values())):
+            if not self.exists(name):
+                continue
+            try:
+                written = self._write_siblings(name)
+            except OSError as exc:
+                yield name, None, exc
+                continue
+            for sibling in written:
+                yield name, sibling, True
+
+    def _write_siblings(self, name):
+        lower = name.lower()
+        makers = []
+        if lower.endswith(COMPRESSIBLE):
+            makers = [('.br', brotli_bytes), ('.gz', gzip_bytes)]
+        elif lower.endswith('.png'):
+            makers = [('.webp', webp_bytes)]
+        if not makers:
+            return []
+        with self.open(name) as fh:
+            data = fh.read()
+        written = []
+        digest = hashlib.md5(data).hexdigest()
+        for suffix, make in makers:
+            sibling = name + suffix
+            if self.exists(sibling):
+                self.delete(sibling)
+            if (digest, suffix) not in self._derived:
+                self._derived[digest, suffix] = make(data)
+            derived = self._derived[digest, suffix]
+            if derived is not None:
+                self._save(sibling, ContentFile(derived))
+                written.append(sibling)
+        return written
+
+
+class StaticFile:
+    __slots__ = ('path', 'content_type', 'immutable', 'encoded', 'webp')
+
+    def __init__(self, path, immutable, siblings):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        self.immutable = immutable
+        self.encoded = [(enc, Path(f"{path}{ext}")) for enc, ext in ENCODINGS if f"{path}{ext}" in siblings]
+        self.webp = Path(f"{path}.webp") if f"{path}.webp" in siblings else None
+
+
+def _accepts(header, token):
+    """Whether an Accept/Accept-Encoding header lists ``token`` with a non-zero q."""
+    for part in header.split(','):
+        value, _, params = part.strip().partition(';')
+        if value.strip().lower() == token:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+async def _file_chunks(path):
+    # ASGI would read a plain file object into memory in one go (and warn); stream it from a pool thread
+    with path.open('rb') as fh:
+        while chunk := await sync_to_async(fh.read, thread_sensitive=False)(FileResponse.block_size):
+            yield chunk
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collectstatic output (STATIC_ROOT) under STATIC_URL, so no separate
+    static web server is needed. Hashed names from the manifest get a one-year
+    immutable Cache-Control; the rest revalidate after a minute. Negotiates
+    Brotli/gzip siblings on Accept-Encoding and WebP on Accept, answers
+    If-None-Match/If-Modified-Since with 304s and streams file bodies. Enabled
+    with SERVE_STATIC; STATIC_ROOT is indexed at startup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVE_STATIC or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        if not settings.STATIC_ROOT or not Path(settings.STATIC_ROOT).is_dir():
+            raise ImproperlyConfigured(f"SERVE_STATIC needs STATIC_ROOT ({settings.STATIC_ROOT}): run collectstatic")
+        self.root = Path(settings.STATIC_ROOT)
+        self.files = self._index()  # {url path below STATIC_URL: StaticFile}
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def _index(self):
+        manifest = self.root / ManifestStaticFilesStorage.manifest_name
+        hashed = set()
+        if manifest.exists():
+            hashed = set(json.loads(manifest.read_text()).get('paths', {}).values())
+        paths = {str(p) for p in self.root.rglob('*') if p.is_file()}
+        siblings = {p for p in paths if p.endswith(('.br', '.gz', '.webp'))}
+        files = {}
+        for p in paths - siblings:
+            path = Path(p)
+            name = path.relative_to(self.root).as_posix()
+            files[name] = StaticFile(path, name in hashed, siblings)
+        # a real .webp/.gz asset (not a sibling of something) is still servable
+        for p in siblings:
+            name = Path(p).relative_to(self.root).as_posix()
+            if str(Path(p).with_suffix('')) not in paths:
+                files[name] = StaticFile(Path(p), name in hashed, set())
+        return files
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        asset = self.files.get(request.path_info[len(self.prefix):])
+        if asset is None:
+            return None
+
+        path, content_type, encoding, vary = asset.path, asset.content_type, None, []
+        if asset.webp:
+            vary.append('Accept')
+            if _accepts(request.META.get('HTTP_ACCEPT', ''), 'image/webp'):
+                path, content_type = asset.webp, 'image/webp'
+        if asset.encoded:
+            vary.append('Accept-Encoding')
+            accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+            encoding, path = next(
+                ((enc, p) for enc, p in asset.encoded if _accepts(accept_encoding, enc)), (None, path),
+            )
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None  # removed since startup
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'  # per representation: the siblings differ in size
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=content_type)
+            elif self.async_mode:
+                response = StreamingHttpResponse(_file_chunks(path), content_type=content_type)
+            else:
+                response = FileResponse(path.open('rb'), content_type=content_type)
+                del response['Content-Disposition']  # FileResponse names the file after the open handle
+            response['Content-Length'] = stat.st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        elif response.status_code != 304:
+            return response  # 412 for a failed If-Match / If-Unmodified-Since
+        response['Cache-Control'] = IMMUTABLE if asset.immutable else REVALIDATE
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['ETag'] = etag
+        if vary:
+            response['Vary'] = ', '.join(vary)
+        return response
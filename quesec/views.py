@@ -1,7 +1,10 @@
-
-
+from django.conf import settings
 from django.shortcuts import render
 
+from .snapshots import snapshot_response
+
 
 def home(request):
-    return render(request, 'index.html')
\ No newline at end of file
+    if settings.HOME_SNAPSHOT and not request.user.is_authenticated:
+        return snapshot_response(request, 'index.html')
+    return render(request, 'index.html')